@@ -0,0 +1,223 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass, asdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+from markowitz_portfolio_optimizer import MarkowitzOptimizer, minimize_portfolio_variance, discretize_weights
+from useful_functions_for_models import get_price_panel
+from streaming_estimator import StreamingCovarianceEstimator, get_log_returns, get_observed_returns
+from shared_panel import publish_price_panel, attach_price_panel
+
+WEEKS_PER_YEAR = 52
+
+
+@dataclass
+class BacktestParameters:
+    amount_to_invest: float = 500
+    critical_sales_threshold: float = 0.5
+    sales_volume_sensitivity: float = 0.5
+
+    window: int = 26              # trailing weeks used to estimate returns and covariance
+    rebalance_every: int = 4      # weeks between two rebalancings
+    transaction_cost: float = 0.0 # proportional fee paid on every buy and sell
+    spread: float = 0.0           # full bid/ask spread, as a fraction of the mid price
+
+    threshold: float = 0.01
+    ratio: float = 0.5
+    N: int = 30
+    candidate_selection: str = 'clusters'
+
+
+class WalkForwardBacktester:
+    def __init__(self, prices: pd.DataFrame, volumes: pd.DataFrame, params: BacktestParameters = None):
+        """
+        Walk-forward backtest of the Markowitz strategy: at each rebalancing date, returns, covariance
+        and sales volumes are estimated on the trailing window only, so no future data is used.
+
+        Args:
+            prices: Weekly prices (weeks x cards), as returned by get_price_panel
+            volumes: Weekly quantities sold (weeks x cards), as returned by get_price_panel
+            params: Backtest parameters
+        """
+        self.params = params or BacktestParameters()
+        self.card_ids = prices.columns.values
+        self.dates = prices.index
+        # A card can only be traded once it has a price: no backward filling (it would leak future data)
+        self.prices = prices.ffill().values
+        self.volumes = volumes.fillna(0).values
+        self.log_returns = get_log_returns(prices).values
+        self.observed_returns = get_observed_returns(prices)
+
+    @classmethod
+    def from_cards_dataframe(cls, cards_df: pd.DataFrame, params: BacktestParameters = None):
+        """Builds the backtester from the output of get_dataframe_cards_matrix()"""
+        prices, volumes = get_price_panel(cards_df)
+        return cls(prices, volumes, params)
+
+    def select_portfolio(self, t: int, moments: StreamingCovarianceEstimator, window_volumes: np.ndarray, budget: float) -> np.ndarray:
+        """
+        Runs the optimizer filters, the minimum variance problem and the budget discretization
+        on the statistics available at week t.
+
+        Returns:
+            np.ndarray: Column indices of the cards to hold
+        """
+        p = self.params
+        prices = self.prices[t]
+        tradable = np.flatnonzero(~np.isnan(prices) & (prices > 0))
+        if len(tradable) == 0:
+            return tradable
+
+        window_df = pd.DataFrame({
+            'card_id': self.card_ids[tradable],
+            'last_price': prices[tradable],
+            'mean_return': moments.mean(tradable) * 100,
+            # The fiability sigmoid is calibrated on yearly sales
+            'Quantity Sold': window_volumes[tradable] * WEEKS_PER_YEAR / p.window,
+            'Card Info': None
+        }, index=tradable)
+
+        # The trailing window moments also give the correlations used to cluster the candidates
+        optimizer = MarkowitzOptimizer(budget, p.critical_sales_threshold, p.sales_volume_sensitivity,
+                                       dataframe_cards_info=window_df, estimator=moments,
+                                       candidate_selection=p.candidate_selection)
+        filtered_df = optimizer.get_optimized_return_mean_matrix_fiability(p.threshold, p.ratio, p.N)
+        if filtered_df.empty:
+            return np.array([], dtype=int)
+
+        candidates = filtered_df.index.values
+        weights = minimize_portfolio_variance(moments.covariance(candidates))
+        _, selected = discretize_weights(weights, prices[candidates], budget)
+        return candidates[selected]
+
+    def run(self) -> pd.DataFrame:
+        """
+        Runs the backtest.
+
+        Returns:
+            pd.DataFrame: One row per week after the first window, with columns:
+                - value: Cash + holdings at mid price
+                - cash: Remaining cash (negative if the discretization overshoots the budget)
+                - n_cards: Number of cards held
+                - costs: Spread and fees paid during the week
+                - rebalanced: Whether the portfolio was rebalanced that week
+        """
+        p = self.params
+        n_weeks, n_cards = self.prices.shape
+        if n_weeks <= p.window:
+            raise ValueError(f"The window ({p.window} weeks) must be shorter than the history ({n_weeks} weeks)")
+
+        buy_factor = (1 + p.spread / 2) * (1 + p.transaction_cost)
+        sell_factor = (1 - p.spread / 2) * (1 - p.transaction_cost)
+
+        # Rolling window estimate: each week is a rank-1 add (and drop of the oldest week)
+        moments = StreamingCovarianceEstimator(self.card_ids, window=p.window)
+        cumulative_volumes = np.vstack([np.zeros(n_cards), np.cumsum(self.volumes, axis=0)])
+        holdings = np.zeros(n_cards, dtype=bool)
+        cash = p.amount_to_invest
+        records = []
+
+        for t in range(1, n_weeks):
+            # log_returns[t - 1] is the return from week t-1 to week t
+            moments.update(self.log_returns[t - 1], self.observed_returns[t - 1])
+            if t < p.window:
+                continue
+
+            prices = np.nan_to_num(self.prices[t])
+            costs = 0.0
+            rebalanced = (t - p.window) % p.rebalance_every == 0
+            if rebalanced:
+                equity = cash + prices[holdings].sum()
+                window_volumes = cumulative_volumes[t + 1] - cumulative_volumes[t + 1 - p.window]
+                target = np.zeros(n_cards, dtype=bool)
+                target[self.select_portfolio(t, moments, window_volumes, equity)] = True
+
+                sold = holdings & ~target
+                bought = target & ~holdings
+                cash += prices[sold].sum() * sell_factor - prices[bought].sum() * buy_factor
+                costs = prices[sold].sum() * (1 - sell_factor) + prices[bought].sum() * (buy_factor - 1)
+                holdings = target
+
+            records.append({
+                'date': self.dates[t],
+                'value': cash + prices[holdings].sum(),
+                'cash': cash,
+                'n_cards': int(holdings.sum()),
+                'costs': costs,
+                'rebalanced': rebalanced
+            })
+
+        return pd.DataFrame(records).set_index('date')
+
+
+def summarize_backtest(results: pd.DataFrame, initial_amount: float) -> Dict[str, float]:
+    """
+    Computes the performance statistics of a backtest.
+
+    Args:
+        results: Output of WalkForwardBacktester.run()
+        initial_amount: Amount invested at the start
+
+    Returns:
+        dict: total_return, annualized_volatility, sharpe_ratio, max_drawdown, total_costs
+    """
+    values = results['value']
+    weekly_returns = values.pct_change().dropna()
+    volatility = weekly_returns.std() * np.sqrt(WEEKS_PER_YEAR)
+    drawdown = values / values.cummax() - 1
+    return {
+        'total_return': round(float(values.iloc[-1] / initial_amount - 1), 4),
+        'annualized_volatility': round(float(volatility), 4),
+        'sharpe_ratio': round(float(weekly_returns.mean() / weekly_returns.std() * np.sqrt(WEEKS_PER_YEAR)), 3)
+                        if weekly_returns.std() > 0 else np.nan,
+        'max_drawdown': round(float(drawdown.min()), 4),
+        'total_costs': round(float(results['costs'].sum()), 2)
+    }
+
+
+_worker_panel = {}
+
+def _init_worker(panel_directory: str):
+    # The panel is attached from memory-mapped files instead of being copied into every worker
+    _worker_panel['prices'], _worker_panel['volumes'] = attach_price_panel(panel_directory)
+
+
+def _run_configuration(params: BacktestParameters) -> Tuple[BacktestParameters, pd.DataFrame]:
+    backtester = WalkForwardBacktester(_worker_panel['prices'], _worker_panel['volumes'], params)
+    return params, backtester.run()
+
+
+def run_backtests(prices: pd.DataFrame, volumes: pd.DataFrame, configurations: List[BacktestParameters],
+                  max_workers: int = None):
+    """
+    Backtests many parameter configurations in parallel, one process per core.
+
+    Args:
+        prices: Weekly prices (weeks x cards), as returned by get_price_panel
+        volumes: Weekly quantities sold (weeks x cards)
+        configurations: Parameter sets to backtest
+        max_workers: Number of processes. Defaults to the number of cores.
+
+    Returns:
+        tuple(pd.DataFrame, list): Summary table (one row per configuration, parameters + statistics)
+        and the list of weekly results, in the same order as configurations.
+
+    Example:
+        >>> prices, volumes = get_price_panel(get_dataframe_cards_matrix())
+        >>> grid = [BacktestParameters(window=w, rebalance_every=k) for w in (13, 26) for k in (1, 4)]
+        >>> summary, curves = run_backtests(prices, volumes, grid)
+    """
+    max_workers = max_workers or os.cpu_count()
+    with tempfile.TemporaryDirectory() as root:
+        panel_directory = publish_price_panel(prices, volumes, root)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(panel_directory,)) as executor:
+            outputs = list(executor.map(_run_configuration, configurations))
+
+    rows, curves = [], []
+    for params, results in outputs:
+        rows.append({**asdict(params), **summarize_backtest(results, params.amount_to_invest)})
+        curves.append(results)
+    return pd.DataFrame(rows), curves
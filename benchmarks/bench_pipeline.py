@@ -0,0 +1,133 @@
+"""
+Benchmark of the loading and optimization pipeline on synthetic universes.
+
+Usage:
+    python benchmarks/bench_pipeline.py --sizes 1000 10000 50000
+    python benchmarks/bench_pipeline.py --compare <baseline commit>
+
+Each run appends one JSON line per universe size to benchmarks/results.jsonl, tagged with the
+current commit, so that timings can be compared across commits.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_universe import generate_price_history_tree
+from useful_functions_for_models import get_dataframe_cards_matrix, calculate_covariance_matrix
+from markowitz_portfolio_optimizer import MarkowitzOptimizer
+from plots_streamlit import plot_analysis
+
+RESULTS_PATH = os.path.join(ROOT, 'benchmarks', 'results.jsonl')
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def best_time(func, repeat):
+    """Minimum wall time over `repeat` runs, and the result of the last run"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return round(min(timings), 6), result
+
+
+def benchmark_universe(folder_path, repeat=3, amount=500, x0=0.5, k=0.5):
+    """
+    Times each step of the pipeline on one price history tree.
+
+    Returns:
+        dict: {step: seconds}
+    """
+    timings = {}
+    timings['get_dataframe_cards_matrix'], cards_df = best_time(
+        lambda: get_dataframe_cards_matrix(folder_path), repeat)
+
+    optimizer = MarkowitzOptimizer(amount, x0, k, dataframe_cards_info=cards_df, folder_path=folder_path)
+    filtered_df = optimizer.get_optimized_return_mean_matrix_fiability()
+
+    timings['calculate_covariance_matrix'], _ = best_time(
+        lambda: calculate_covariance_matrix(filtered_df, folder_path), repeat)
+    timings['optimize_portfolio'], _ = best_time(optimizer.optimize_portfolio, repeat)
+    timings['optimize_cards_sell'], (_, _, portfolio) = best_time(optimizer.optimize_cards_sell, repeat)
+    timings['plot_analysis'], _ = best_time(lambda: plot_analysis(portfolio), repeat)
+    return timings
+
+
+def run(sizes, n_weeks, missing_rate, repeat, data_dir, output):
+    commit = get_commit()
+    for n_cards in sizes:
+        folder_path = os.path.join(data_dir, f'universe_{n_cards}_{n_weeks}_{missing_rate}')
+        start = time.perf_counter()
+        generate_price_history_tree(folder_path, n_cards, n_weeks, missing_rate)
+        print(f"[{n_cards} cards] synthetic tree ready in {time.perf_counter() - start:.1f}s")
+
+        timings = benchmark_universe(folder_path, repeat)
+        record = {
+            'commit': commit,
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'n_cards': n_cards,
+            'n_weeks': n_weeks,
+            'missing_rate': missing_rate,
+            'timings': timings
+        }
+        with open(output, 'a') as file:
+            file.write(json.dumps(record) + '\n')
+        for step, seconds in timings.items():
+            print(f"[{n_cards} cards] {step:<30} {seconds:>10.4f}s")
+
+
+def compare(baseline, output):
+    """Prints the ratio of the latest timings of the current commit to those of the baseline commit"""
+    with open(output) as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    current = get_commit()
+    latest = {}
+    for record in records:
+        if record['commit'] in (baseline, current):
+            latest[(record['commit'], record['n_cards'], record['n_weeks'], record['missing_rate'])] = record['timings']
+
+    for (commit, *universe), timings in sorted(latest.items(), key=lambda item: item[0][1:]):
+        if commit != current or (baseline, *universe) not in latest:
+            continue
+        reference = latest[(baseline, *universe)]
+        print(f"{universe[0]} cards, {universe[1]} weeks, missing {universe[2]}")
+        for step, seconds in timings.items():
+            if step in reference and reference[step] > 0:
+                print(f"    {step:<30} {reference[step]:>10.4f}s -> {seconds:>10.4f}s  (x{seconds / reference[step]:.2f})")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000], help='Numbers of cards')
+    parser.add_argument('--weeks', type=int, default=52, help='Length of the histories')
+    parser.add_argument('--missing', type=float, default=0.1, help='Share of truncated histories and empty weeks')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per step, the best one is kept')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'pokemon_benchmarks'),
+                        help='Where the synthetic trees are generated (reused between runs)')
+    parser.add_argument('--output', default=RESULTS_PATH, help='JSON lines file of the results')
+    parser.add_argument('--compare', metavar='COMMIT', help='Compare the current commit to a baseline commit and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare, args.output)
+    else:
+        run(args.sizes, args.weeks, args.missing, args.repeat, args.data_dir, args.output)
@@ -0,0 +1,176 @@
+"""
+Benchmark of the scraper against the local fixture server (benchmarks/fixture_server.py).
+
+Usage:
+    python benchmarks/bench_scraper.py --cards 200 --concurrency 1 4 16 --latency 0.2
+    python benchmarks/bench_scraper.py --paths requests selenium --failure-rate 0.05
+
+For each fetch path ('requests': fetch_html_content, 'selenium': get_html_content) and each
+concurrency level, the same cards are fetched then parsed with extract_price_history, and the
+following are measured:
+    - cards_per_minute: Successfully scraped cards per minute of wall time
+    - cpu_per_card: CPU seconds per card, of this process and of its finished children (Chrome)
+    - memory_per_card: Median peak of the Python allocations while scraping one card (tracemalloc,
+      measured on a separate sequential pass so that it does not slow down the throughput runs)
+The Selenium path is skipped when Chrome cannot be started. One JSON line per run is appended to
+benchmarks/scraper_results.jsonl.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import threading
+import tracemalloc
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixture_server import FixtureServer
+from bench_pipeline import get_commit
+from get_historic_card_prices import fetch_html_content, get_html_content, extract_price_history, setup_driver
+
+RESULTS_PATH = os.path.join(ROOT, 'benchmarks', 'scraper_results.jsonl')
+
+
+def serve(queue, stop_event, **kwargs):
+    """Runs the fixture server in its own process, so that its CPU is not counted"""
+    with FixtureServer(**kwargs) as server:
+        queue.put((server.base_url, server.card_ids()))
+        stop_event.wait()
+
+
+class RequestsFetcher:
+    """fetch_html_content with one keep-alive session per thread"""
+    def __init__(self):
+        self._local = threading.local()
+
+    def __call__(self, url):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return fetch_html_content(url, session=session)
+
+
+FETCHERS = {
+    'requests': RequestsFetcher,
+    'selenium': lambda: get_html_content
+}
+
+
+def selenium_available():
+    try:
+        setup_driver().quit()
+        return True
+    except Exception as e:
+        print(f"Selenium path skipped: {str(e).splitlines()[0] if str(e) else type(e).__name__}")
+        return False
+
+
+def scrape_card(fetch, url):
+    """Fetches and parses one card, returns True if a price history was extracted"""
+    html_content, state = fetch(url)
+    if html_content is None:
+        return False
+    return not extract_price_history(html_content, state).empty
+
+
+def cpu_seconds():
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def measure_throughput(fetch, urls, concurrency):
+    cpu_start, start = cpu_seconds(), time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        successes = sum(executor.map(lambda url: scrape_card(fetch, url), urls))
+    wall, cpu = time.perf_counter() - start, cpu_seconds() - cpu_start
+    return {
+        'cards_per_minute': round(successes / wall * 60, 1),
+        'success_rate': round(successes / len(urls), 3),
+        'wall_seconds': round(wall, 3),
+        'cpu_per_card': round(cpu / len(urls), 5)
+    }
+
+
+def measure_memory(fetch, urls):
+    """Median peak of the Python allocations while scraping one card, in KiB"""
+    peaks = []
+    tracemalloc.start()
+    for url in urls:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        scrape_card(fetch, url)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    return round(float(np.median(peaks)) / 1024, 1)
+
+
+def run(paths, n_cards, concurrency_levels, memory_sample, folder, pages_dir, latency, jitter, failure_rate, output):
+    queue, stop_event = multiprocessing.Queue(), multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(queue, stop_event), kwargs={
+        'folder_path': folder, 'pages_dir': pages_dir, 'latency': latency, 'jitter': jitter,
+        'failure_rate': failure_rate}, daemon=True)
+    server.start()
+    base_url, card_ids = queue.get(timeout=300)
+    urls = [f"{base_url}/{card_id}" for card_id in card_ids[:n_cards]]
+    print(f"Fixture server ready at {base_url} ({len(urls)} cards)")
+
+    commit = get_commit()
+    try:
+        for path in paths:
+            if path == 'selenium' and not selenium_available():
+                continue
+            fetch = FETCHERS[path]()
+            memory_per_card = measure_memory(fetch, urls[:memory_sample])
+            for concurrency in concurrency_levels:
+                metrics = measure_throughput(fetch, urls, concurrency)
+                record = {
+                    'commit': commit,
+                    'date': datetime.now().isoformat(timespec='seconds'),
+                    'python': platform.python_version(),
+                    'cpu_count': os.cpu_count(),
+                    'path': path,
+                    'concurrency': concurrency,
+                    'n_cards': len(urls),
+                    'latency': latency,
+                    'jitter': jitter,
+                    'failure_rate': failure_rate,
+                    **metrics,
+                    'memory_per_card_kib': memory_per_card
+                }
+                with open(output, 'a') as file:
+                    file.write(json.dumps(record) + '\n')
+                print(f"[{path:<8} x{concurrency:>3}] {metrics['cards_per_minute']:>10.1f} cards/min  "
+                      f"cpu {metrics['cpu_per_card'] * 1000:>8.2f} ms/card  memory {memory_per_card:>8.1f} KiB/card  "
+                      f"success {metrics['success_rate']:.1%}")
+    finally:
+        stop_event.set()
+        server.join(timeout=10)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--paths', nargs='+', choices=list(FETCHERS), default=list(FETCHERS), help='Fetch paths to compare')
+    parser.add_argument('--cards', type=int, default=200, help='Number of cards fetched per run')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16], help='Numbers of concurrent fetches')
+    parser.add_argument('--memory-sample', type=int, default=20, help='Cards of the sequential memory pass')
+    parser.add_argument('--folder', default=os.path.join(ROOT, 'datas', 'price_history'), help='Price history tree served')
+    parser.add_argument('--pages-dir', help='Folder of recorded pages {card_id}.html, served in priority')
+    parser.add_argument('--latency', type=float, default=0.1, help='Server delay per page, in seconds')
+    parser.add_argument('--jitter', type=float, default=0.05, help='Random extra delay per page, in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of pages answered with a 503')
+    parser.add_argument('--output', default=RESULTS_PATH, help='JSON lines file of the results')
+    args = parser.parse_args()
+
+    run(args.paths, args.cards, args.concurrency, args.memory_sample, args.folder, args.pages_dir,
+        args.latency, args.jitter, args.failure_rate, args.output)
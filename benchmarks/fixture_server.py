@@ -0,0 +1,174 @@
+"""
+Local stand-in for the TCGPlayer price pages, used to benchmark the scraper without the live site.
+
+Pages are served at /tcgplayer/{card_id}. A recorded page {card_id}.html in the pages folder is
+served as is; otherwise a TCGPlayer-style page is rendered from the price history CSV files of the
+card (the same markup as the live page: Near Mint table, chart buttons, filters and sales table).
+
+Usage:
+    python benchmarks/fixture_server.py --port 8765 --latency 0.2 --failure-rate 0.05
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from useful_functions_for_models import get_price_history_index
+
+
+def render_card_page(card_id, histories):
+    """
+    Renders a TCGPlayer-style price page.
+
+    Args:
+        card_id (str): Card identifier
+        histories (dict): {state: price history DataFrame (start_date, end_date, price, quantity_sold)}
+
+    Returns:
+        str: HTML page. The sales table shows the history of the highest priced state, as the live
+            page does once the filters are applied.
+    """
+    last_prices = {state: df['price'].iloc[-1] for state, df in histories.items()}
+    table_rows = ''.join(
+        f'<tr><td data-v-762a0eeb><span class="text">{state}:</span></td>'
+        f'<td data-v-762a0eeb><span class="near-mint-table__price">${price:.2f}</span></td></tr>'
+        for state, price in last_prices.items())
+    filters = ''.join(
+        f'<label><span class="checkbox__option-value checkbox__option-value-mobile">{state}</span></label>'
+        for state in histories)
+
+    selected = max(last_prices, key=last_prices.get)
+    history = histories[selected]
+    sales_rows = ''.join(
+        f'<tr><td>{pd.Timestamp(start):%m/%d} to {pd.Timestamp(end):%m/%d}</td><td>${price:.2f}</td><td>{quantity}</td></tr>'
+        for start, end, price, quantity in history[['start_date', 'end_date', 'price', 'quantity_sold']].itertuples(index=False))
+
+    return f"""<!DOCTYPE html>
+<html><head><title>{card_id}</title></head>
+<body>
+<table class="near-mint-table"><tbody>{table_rows}</tbody></table>
+<div class="martech-charts-history"><div class="charts-title">Near Mint {selected}</div>
+<button data-v-0177b97d class="charts-item">3M</button><button data-v-0177b97d class="charts-item">1Y</button></div>
+<div class="modal__activator" role="button">Sales history</div>
+<button class="sales-history-snapshot__show-filters">Filters</button>
+<label><span>Near Mint</span></label>{filters}
+<table class="sales-history"><tr><th>Date</th><th>Price</th><th>Quantity</th></tr>{sales_rows}</table>
+</body></html>"""
+
+
+class FixtureServer:
+    def __init__(self, folder_path='datas/price_history', pages_dir=None, port=0,
+                 latency=0.0, jitter=0.0, failure_rate=0.0, seed=42):
+        """
+        Args:
+            folder_path (str): Price history tree used to render the pages
+            pages_dir (str, optional): Folder of recorded pages {card_id}.html, served in priority
+            port (int): Port to listen on (0 picks a free port)
+            latency (float): Delay added to every response, in seconds
+            jitter (float): Uniform random delay added on top of the latency, in seconds
+            failure_rate (float): Probability of answering 503 instead of the page
+            seed (int): Seed of the latency/failure draws
+        """
+        self.index = get_price_history_index(folder_path)
+        self.pages_dir = pages_dir
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._pages = {}
+        self.requests_served = 0
+        self.failures_injected = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._make_handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/tcgplayer"
+
+    def card_ids(self):
+        """Catalog ids that can be served"""
+        return self.index.index.get_level_values('base_id').unique().tolist()
+
+    def get_page(self, card_id):
+        if card_id not in self._pages:
+            recorded = os.path.join(self.pages_dir, f'{card_id}.html') if self.pages_dir else None
+            if recorded and os.path.exists(recorded):
+                with open(recorded, encoding='utf-8') as file:
+                    self._pages[card_id] = file.read()
+            elif card_id in self.index.index.get_level_values('base_id'):
+                rows = self.index.loc[card_id]
+                histories = {variant.replace('_', ' '): pd.read_csv(path) for variant, path in rows['path'].items()}
+                self._pages[card_id] = render_card_page(card_id, histories)
+            else:
+                return None
+        return self._pages[card_id]
+
+    def _make_handler(self):
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with fixture._random_lock:
+                    delay = fixture.latency + fixture._random.uniform(0, fixture.jitter)
+                    fail = fixture._random.random() < fixture.failure_rate
+                    fixture.requests_served += 1
+                    fixture.failures_injected += fail
+                time.sleep(delay)
+
+                page = fixture.get_page(self.path.rstrip('/').rsplit('/', 1)[-1])
+                if fail or page is None:
+                    self.send_response(503 if fail else 404)
+                    self.end_headers()
+                    return
+                body = page.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--folder', default='datas/price_history', help='Price history tree')
+    parser.add_argument('--pages-dir', help='Folder of recorded pages {card_id}.html')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FixtureServer(args.folder, args.pages_dir, args.port, args.latency, args.jitter, args.failure_rate)
+    print(f"Serving {len(server.card_ids())} cards at {server.base_url}/<card_id>")
+    server.server.serve_forever()
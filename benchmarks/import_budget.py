@@ -0,0 +1,76 @@
+"""
+Import-time budget of the entry modules.
+
+Usage:
+    python benchmarks/import_budget.py
+    python benchmarks/import_budget.py --budget 0.8 --repeat 5
+
+Each module is imported in a fresh interpreter. The check fails (exit code 1) if the import loads
+one of the heavy optional stacks (scraping, plotting, statsmodels) that the module does not need,
+or if the best import time over the runs exceeds the budget.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Stacks that must only be loaded by the functions that use them
+HEAVY_MODULES = ('selenium', 'webdriver_manager', 'bs4', 'requests', 'matplotlib', 'statsmodels')
+
+ENTRY_MODULES = (
+    'useful_functions_for_models',
+    'markowitz_portfolio_optimizer',
+    'backtesting',
+    'monte_carlo_risk',
+    'optimization_service',
+    'plots_streamlit',
+    'get_historic_card_prices'
+)
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+loaded = sorted({{name.split('.')[0] for name in sys.modules}} & set({heavy!r}))
+print(json.dumps({{'seconds': seconds, 'loaded': loaded}}))
+"""
+
+
+def measure_import(module, repeat=3):
+    """
+    Returns:
+        tuple: (best import time in seconds, heavy modules loaded by the import)
+    """
+    timings, loaded = [], []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                                cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result['seconds'])
+        loaded = result['loaded']
+    return min(timings), loaded
+
+
+def run(modules, budget, repeat):
+    failures = 0
+    for module in modules:
+        seconds, loaded = measure_import(module, repeat)
+        ok = seconds <= budget and not loaded
+        failures += not ok
+        details = f"  loads {', '.join(loaded)}" if loaded else ''
+        print(f"{'ok  ' if ok else 'FAIL'} {module:<32} {seconds:>7.3f}s{details}")
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', nargs='+', default=list(ENTRY_MODULES), help='Modules to import')
+    parser.add_argument('--budget', type=float, default=1.0, help='Maximum import time per module, in seconds')
+    parser.add_argument('--repeat', type=int, default=3, help='Imports per module, the best one is kept')
+    args = parser.parse_args()
+
+    sys.exit(1 if run(args.modules, args.budget, args.repeat) else 0)
@@ -0,0 +1,77 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+END_DATE = pd.Timestamp('2024-11-26')
+BUCKETS = ('low_sales', 'medium_sales', 'high_sales')
+
+
+def generate_price_history_tree(output_dir, n_cards=1000, n_weeks=52, missing_rate=0.1, seed=42):
+    """
+    Writes a synthetic price history tree shaped like datas/price_history:
+    {low,medium,high}_sales/{card_id}_{variant}.csv with start_date, end_date, price, quantity_sold.
+
+    Args:
+        output_dir (str): Folder of the tree (created if needed)
+        n_cards (int): Number of cards
+        n_weeks (int): Length of a full history
+        missing_rate (float): Share of cards whose history starts later (truncated history)
+            and share of weeks without any sale
+        seed (int): Seed of the generator, the same arguments always give the same tree
+
+    Returns:
+        str: output_dir
+
+    Notes:
+        - Prices follow geometric random walks with card-specific drift and volatility
+        - Weekly sales are Poisson with a log-normal intensity, the bucket is chosen from
+          the total sales with the same thresholds as save_historic_prices
+        - A tree already generated with the same arguments is reused
+    """
+    arguments = {'n_cards': n_cards, 'n_weeks': n_weeks, 'missing_rate': missing_rate, 'seed': seed}
+    marker = os.path.join(output_dir, 'synthetic_universe.json')
+    if os.path.exists(marker):
+        with open(marker) as file:
+            if json.load(file) == arguments:
+                return output_dir
+
+    rng = np.random.default_rng(seed)
+    for bucket in BUCKETS:
+        shutil.rmtree(os.path.join(output_dir, bucket), ignore_errors=True)
+        os.makedirs(os.path.join(output_dir, bucket))
+
+    starts = pd.date_range(end=END_DATE, periods=n_weeks, freq='7D')
+    start_dates = starts.strftime('%Y-%m-%d').values
+    end_dates = (starts + pd.Timedelta(days=6)).strftime('%Y-%m-%d').values
+
+    drifts = rng.normal(0.002, 0.004, n_cards)
+    volatilities = rng.uniform(0.01, 0.1, n_cards)
+    initial_prices = np.exp(rng.normal(2.5, 1.0, n_cards))
+    intensities = np.exp(rng.normal(-0.5, 1.5, n_cards))
+    variants = rng.choice(['Holofoil', 'Reverse_Holofoil', 'Normal'], size=n_cards, p=[0.66, 0.30, 0.04])
+
+    for i in range(n_cards):
+        length = n_weeks
+        if rng.random() < missing_rate:
+            length = int(rng.integers(max(n_weeks // 4, 2), n_weeks))
+
+        returns = rng.normal(drifts[i], volatilities[i], length)
+        prices = np.round(initial_prices[i] * np.exp(np.cumsum(returns)), 2)
+        quantities = rng.poisson(intensities[i], length)
+        quantities[rng.random(length) < missing_rate] = 0
+
+        total_sales = quantities.sum()
+        bucket = 'low_sales' if total_sales < 5 else 'medium_sales' if total_sales <= 20 else 'high_sales'
+        path = os.path.join(output_dir, bucket, f'syn{i // 100}-{i % 100}_{variants[i]}.csv')
+
+        lines = ['start_date,end_date,price,quantity_sold']
+        lines += [f'{s},{e},{p:.2f},{q}' for s, e, p, q in
+                  zip(start_dates[-length:], end_dates[-length:], prices, quantities)]
+        with open(path, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+
+    with open(marker, 'w') as file:
+        json.dump(arguments, file)
+    return output_dir
@@ -0,0 +1,89 @@
+import numpy as np
+from instrumentation import timed, increment
+
+
+class CandidateIndex:
+    def __init__(self, prices: np.ndarray, scores: np.ndarray, eligible: np.ndarray = None, block_size: int = 64):
+        """
+        Index of the cards sorted by price and by score, answering the optimizer filter
+        `score > threshold and price < max_price` with range queries instead of masks over the universe.
+
+        Counts use a merge-sort tree over the price order: at each level, aligned blocks of
+        `block_size * 2**j` cards have their scores sorted. The cards cheaper than max_price are a
+        prefix of the price order, covered by at most one block per level, so a count is one
+        searchsorted per level plus a scan of at most block_size cards. Candidate sets are read from
+        the shorter of the price range and the score range.
+
+        Args:
+            prices: Last price of every card of the universe
+            scores: Score of every card (e.g. Return x Fiability, it depends on the reliability parameters)
+            eligible: Cards that can be selected at all (valid, tradable...), every card by default.
+                Cards with a missing price or score are never eligible
+            block_size: Size of the smallest sorted blocks (memory is about n * log2(n / block_size) floats)
+
+        Example:
+            >>> index = CandidateIndex(df['last_price'].values, df['Return x Fiability'].values)
+            >>> index.count(threshold=0.01, max_price=250)
+            >>> filtered_df = df.iloc[index.candidates(threshold=0.01, max_price=250)]
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        scores = np.asarray(scores, dtype=np.float64)
+        mask = np.isfinite(prices) & np.isfinite(scores)
+        if eligible is not None:
+            mask &= np.asarray(eligible, dtype=bool)
+        positions = np.flatnonzero(mask)
+        self.n_cards = len(prices)
+        self.block_size = block_size
+
+        self.by_price = positions[np.argsort(prices[positions], kind='stable')]
+        self.prices = prices[self.by_price]
+        self._price_scores = scores[self.by_price]
+
+        self.by_score = positions[np.argsort(scores[positions], kind='stable')]
+        self.scores = scores[self.by_score]
+        self._score_prices = prices[self.by_score]
+
+        self._levels = []
+        size = block_size
+        while size <= len(positions):
+            full = len(positions) // size * size
+            self._levels.append(np.sort(self._price_scores[:full].reshape(-1, size), axis=1).ravel())
+            size *= 2
+
+    @classmethod
+    @timed('candidate_index.build')
+    def from_frame(cls, df, score_column: str = 'Return x Fiability', eligible: np.ndarray = None, block_size: int = 64):
+        """Index of a DataFrame with 'last_price' and score_column, positions are rows of df"""
+        return cls(df['last_price'].values, df[score_column].values, eligible, block_size)
+
+    def __len__(self):
+        """Number of eligible cards"""
+        return len(self.by_price)
+
+    def count(self, threshold: float, max_price: float) -> int:
+        """Number of eligible cards with score > threshold and price < max_price"""
+        increment('candidate_index_counts')
+        end = int(np.searchsorted(self.prices, max_price, side='left'))
+        total = start = 0
+        # Largest blocks first: start stays a multiple of the block size of every remaining level
+        for level in range(len(self._levels) - 1, -1, -1):
+            size = self.block_size << level
+            if start + size <= end:
+                block = self._levels[level][start:start + size]
+                total += size - int(np.searchsorted(block, threshold, side='right'))
+                start += size
+        return total + int(np.count_nonzero(self._price_scores[start:end] > threshold))
+
+    def candidates(self, threshold: float, max_price: float) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: Positions (ascending) of the eligible cards with score > threshold and price < max_price
+        """
+        increment('candidate_index_queries')
+        end = int(np.searchsorted(self.prices, max_price, side='left'))
+        start = int(np.searchsorted(self.scores, threshold, side='right'))
+        if end <= len(self.scores) - start:
+            positions = self.by_price[:end][self._price_scores[:end] > threshold]
+        else:
+            positions = self.by_score[start:][self._score_prices[start:] < max_price]
+        return np.sort(positions)
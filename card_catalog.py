@@ -0,0 +1,105 @@
+import os
+import pickle
+import threading
+import numpy as np
+import pandas as pd
+from instrumentation import timed, increment
+
+CATALOG_PATH = 'datas/pokemon_cards.csv'
+CATEGORICAL_COLUMNS = ('rarity', 'collection', 'series', 'artist')
+_cache = {}
+
+
+def parse_popularity_rank(ranks: pd.Series) -> pd.Series:
+    """
+    Converts ranks like '#41' to integers, 'Not Referenced' (and anything unparsable) becomes <NA>.
+
+    Returns:
+        pd.Series: Nullable Int16 ranks
+    """
+    ranks = ranks.astype(str).str.extract(r'^#(\d+)$', expand=False)
+    return pd.to_numeric(ranks, errors='coerce').astype('Int16')
+
+
+def parse_pokedex_numbers(numbers: pd.Series) -> pd.Series:
+    """
+    Converts stringified lists like '[173, 174, 175]' to int16 arrays, missing values become empty arrays.
+
+    Returns:
+        pd.Series: object Series of np.ndarray (dtype int16)
+    """
+    empty = np.empty(0, dtype=np.int16)
+    parsed = {text: np.array(text.strip('[]').split(','), dtype=np.int16) if text.strip('[] ') else empty
+              for text in numbers.dropna().unique()}
+    return pd.Series([parsed.get(text, empty) if isinstance(text, str) else empty for text in numbers],
+                     index=numbers.index, dtype=object)
+
+
+@timed('catalog.read_card_catalog')
+def read_card_catalog(csv_path: str = CATALOG_PATH) -> pd.DataFrame:
+    """
+    Reads pokemon_cards.csv with compact types.
+
+    Args:
+        csv_path: Path of the catalog
+
+    Returns:
+        pd.DataFrame: Same columns as the CSV, with:
+            - rarity, collection, series, artist: category
+            - holofoil_price, reverse_holofoil_price: float32
+            - release_date: datetime64
+            - nationalPokedexNumbers: int16 arrays (empty when unknown)
+            - popularity_rank: Int16, <NA> for 'Not Referenced'
+    """
+    increment('files_read')
+    catalog = pd.read_csv(csv_path, dtype={column: 'category' for column in CATEGORICAL_COLUMNS} | {
+        'holofoil_price': np.float32, 'reverse_holofoil_price': np.float32})
+    catalog['release_date'] = pd.to_datetime(catalog['release_date'], format='%Y/%m/%d', errors='coerce')
+    catalog['nationalPokedexNumbers'] = parse_pokedex_numbers(catalog['nationalPokedexNumbers'])
+    catalog['popularity_rank'] = parse_popularity_rank(catalog['popularity_rank'])
+    return catalog
+
+
+def load_card_catalog(csv_path: str = CATALOG_PATH, cache_path: str = None) -> pd.DataFrame:
+    """
+    Typed card catalog (see read_card_catalog), cached in memory and in a binary file next to the CSV.
+
+    Args:
+        csv_path: Path of the catalog
+        cache_path: Binary cache, defaults to the CSV path with a .pkl extension
+
+    Returns:
+        pd.DataFrame: Typed catalog. The cached frame is shared between callers: add columns
+            freely, but do not modify values in place
+
+    Notes:
+        - The cache is rebuilt whenever the size or modification time of the CSV changes
+    """
+    cache_path = cache_path or os.path.splitext(csv_path)[0] + '.pkl'
+    stat = os.stat(csv_path)
+    version = (os.path.abspath(csv_path), stat.st_size, stat.st_mtime_ns)
+
+    if _cache.get('version') != version:
+        catalog = None
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'rb') as file:
+                    cached_version, catalog = pickle.load(file)
+                if cached_version != version[1:]:
+                    catalog = None
+            except (OSError, pickle.UnpicklingError, EOFError, ValueError, AttributeError, ImportError):
+                catalog = None
+
+        if catalog is None:
+            catalog = read_card_catalog(csv_path)
+            # One temporary file per writer: the refresh stages can write concurrently
+            temporary = f"{cache_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+            try:
+                with open(temporary, 'wb') as file:
+                    pickle.dump((version[1:], catalog), file, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temporary, cache_path)
+            except OSError as e:
+                print(f"Could not write the catalog cache: {str(e)}")
+
+        _cache['version'], _cache['catalog'] = version, catalog
+    return _cache['catalog'].copy(deep=False)
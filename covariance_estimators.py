@@ -0,0 +1,191 @@
+import numpy as np
+import pandas as pd
+from typing import Sequence
+
+
+def sample_covariance(returns: np.ndarray) -> np.ndarray:
+    """
+    Unbiased sample covariance.
+
+    Args:
+        returns: Weekly returns (weeks x cards)
+
+    Returns:
+        np.ndarray: Covariance matrix (cards x cards)
+    """
+    return np.cov(np.asarray(returns), rowvar=False)
+
+
+def ledoit_wolf_covariance(returns: np.ndarray) -> np.ndarray:
+    """
+    Ledoit-Wolf shrinkage of the sample covariance towards a scaled identity,
+    with the optimal (closed form) shrinkage intensity.
+
+    With ~52 weeks and more cards than weeks the sample covariance is singular,
+    the shrunk matrix is always well conditioned.
+
+    Args:
+        returns: Weekly returns (weeks x cards)
+
+    Returns:
+        np.ndarray: Covariance matrix (cards x cards)
+    """
+    X = np.asarray(returns, dtype=float)
+    n_weeks, n_cards = X.shape
+    X = X - X.mean(axis=0)
+    sample = X.T @ X / n_weeks
+
+    mu = np.trace(sample) / n_cards
+    delta = np.sum((sample - mu * np.eye(n_cards)) ** 2) / n_cards
+    beta = np.sum((X ** 2).T @ (X ** 2) / n_weeks - sample ** 2) / (n_weeks * n_cards)
+    shrinkage = 0.0 if delta == 0 else min(beta, delta) / delta
+
+    shrunk = (1 - shrinkage) * sample
+    shrunk[np.diag_indices(n_cards)] += shrinkage * mu
+    return shrunk
+
+
+def constant_correlation_covariance(returns: np.ndarray) -> np.ndarray:
+    """
+    Ledoit-Wolf (2003) shrinkage of the sample covariance towards the constant correlation model:
+    every pair of cards shares the average correlation, variances are kept.
+
+    Args:
+        returns: Weekly returns (weeks x cards)
+
+    Returns:
+        np.ndarray: Covariance matrix (cards x cards)
+    """
+    X = np.asarray(returns, dtype=float)
+    n_weeks, n_cards = X.shape
+    X = X - X.mean(axis=0)
+    sample = X.T @ X / n_weeks
+
+    std = np.sqrt(np.diag(sample))
+    # Cards with a flat history (zero variance) have no correlation with anything
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv_std = np.where(std > 0, 1 / std, 0)
+    correlation = sample * np.outer(inv_std, inv_std)
+    mean_correlation = (correlation.sum() - np.trace(correlation)) / (n_cards * (n_cards - 1))
+    target = mean_correlation * np.outer(std, std)
+    target[np.diag_indices(n_cards)] = np.diag(sample)
+
+    # Optimal shrinkage intensity (pi - rho) / gamma / T
+    squared = X ** 2
+    pi_matrix = squared.T @ squared / n_weeks - sample ** 2
+    pi = pi_matrix.sum()
+    theta_ii = (X ** 3).T @ X / n_weeks - np.diag(sample)[:, None] * sample
+    theta_jj = theta_ii.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio_ij = np.where(std[:, None] > 0, std[None, :] * inv_std[:, None], 0)
+    off_diagonal = ratio_ij * theta_ii + ratio_ij.T * theta_jj
+    np.fill_diagonal(off_diagonal, 0)
+    rho = np.trace(pi_matrix) + mean_correlation / 2 * off_diagonal.sum()
+    gamma = np.sum((sample - target) ** 2)
+    shrinkage = 0.0 if gamma == 0 else max(0.0, min(1.0, (pi - rho) / gamma / n_weeks))
+
+    return shrinkage * target + (1 - shrinkage) * sample
+
+
+class FactorCovariance:
+    def __init__(self, loadings: np.ndarray, specific_variances: np.ndarray, labels: Sequence[str] = None):
+        """
+        Low-rank covariance Σ = F·Fᵀ + diag(D), never materialized:
+        memory and matrix-vector products are O(n·k) instead of O(n²).
+
+        Args:
+            loadings: F (cards x factors)
+            specific_variances: D, the idiosyncratic variance of each card
+            labels: card_id of each row
+        """
+        self.loadings = np.asarray(loadings, dtype=float)
+        self.specific_variances = np.asarray(specific_variances, dtype=float)
+        self.labels = None if labels is None else np.asarray(labels)
+
+    def __len__(self):
+        return len(self.specific_variances)
+
+    @property
+    def shape(self):
+        return (len(self), len(self))
+
+    def matvec(self, weights: np.ndarray) -> np.ndarray:
+        """Σ·w in O(n·k)"""
+        return self.loadings @ (self.loadings.T @ weights) + self.specific_variances * weights
+
+    def quadratic_form(self, weights: np.ndarray) -> float:
+        """wᵀ·Σ·w (portfolio variance) in O(n·k)"""
+        exposures = self.loadings.T @ weights
+        return float(exposures @ exposures + np.sum(self.specific_variances * weights ** 2))
+
+    def subset(self, indices: np.ndarray) -> 'FactorCovariance':
+        """Factor covariance of a subset of the cards"""
+        labels = None if self.labels is None else self.labels[indices]
+        return FactorCovariance(self.loadings[indices], self.specific_variances[indices], labels)
+
+    def to_dense(self) -> np.ndarray:
+        """Materializes the n x n matrix (only for small subsets)"""
+        return self.loadings @ self.loadings.T + np.diag(self.specific_variances)
+
+
+def get_factor_exposures(card_ids: Sequence[str], catalog: pd.DataFrame,
+                         factors=('collection', 'rarity', 'series')) -> pd.DataFrame:
+    """
+    One-hot exposures of each card to its set, rarity and series.
+
+    Args:
+        card_ids: Identifiers like 'swsh6-207_Holofoil' (the variant suffix is removed to join the catalog)
+        catalog: Content of pokemon_cards.csv
+        factors: Catalog columns used as factors
+
+    Returns:
+        pd.DataFrame: 0/1 exposures (cards x factors), cards missing from the catalog have no exposure
+    """
+    base_ids = pd.Series(card_ids).str.split('_').str[0]
+    metadata = catalog.drop_duplicates('id').set_index('id')[list(factors)]
+    metadata = metadata.reindex(base_ids.values)
+    # Categorical columns (typed catalog) would get a dummy for every category, even unused ones
+    metadata = metadata.apply(lambda column: column.cat.remove_unused_categories()
+                              if isinstance(column.dtype, pd.CategoricalDtype) else column)
+    exposures = pd.get_dummies(metadata, columns=list(factors), dtype=float)
+    exposures.index = card_ids
+    return exposures
+
+
+def factor_covariance(returns: np.ndarray, exposures: pd.DataFrame, ridge: float = 1e-3) -> FactorCovariance:
+    """
+    Fits the set/rarity/series factor model: factor returns are estimated each week by a
+    cross-sectional (ridge) regression of the card returns on their exposures.
+
+    Args:
+        returns: Weekly returns (weeks x cards)
+        exposures: Output of get_factor_exposures, aligned with the columns of returns
+        ridge: Ridge penalty of the cross-sectional regressions (exposures are collinear:
+            every card belongs to one set and one series)
+
+    Returns:
+        FactorCovariance: Σ = F·Fᵀ + D with F = B·L, where B are the exposures and L·Lᵀ the
+        covariance of the factor returns
+    """
+    R = np.asarray(returns, dtype=float)
+    B = exposures.values
+    n_factors = B.shape[1]
+
+    # f_t = (BᵀB + λI)⁻¹ Bᵀ r_t for every week at once, only a k x k system is solved
+    gram = B.T @ B + ridge * np.eye(n_factors)
+    factor_returns = np.linalg.solve(gram, B.T @ R.T).T
+    residuals = R - factor_returns @ B.T
+
+    factor_cov = np.atleast_2d(np.cov(factor_returns, rowvar=False))
+    eigenvalues, eigenvectors = np.linalg.eigh(factor_cov)
+    root = eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+    specific_variances = residuals.var(axis=0, ddof=1)
+
+    return FactorCovariance(B @ root, specific_variances, exposures.index.values)
+
+
+COVARIANCE_ESTIMATORS = {
+    'sample': sample_covariance,
+    'ledoit_wolf': ledoit_wolf_covariance,
+    'constant_correlation': constant_correlation_covariance,
+}
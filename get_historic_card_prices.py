@@ -1,24 +1,17 @@
-import requests
-from bs4 import BeautifulSoup
 import pandas as pd
 import time
 import os
 from tqdm import tqdm
-
-
-from bs4 import BeautifulSoup
-from datetime import datetime
+from datetime import datetime, timedelta
 import glob
-from selenium import webdriver 
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
+from instrumentation import timed, increment
+
+# selenium, webdriver_manager, bs4 and requests are imported inside the functions that use them:
+# importing this module (e.g. for resolve_date or save_price_history) does not load the scraping stack
 
 
 
+@timed('scraper.setup_driver')
 def setup_driver():
     """
     Configure and initialize a headless Chrome WebDriver for web scraping.
@@ -31,6 +24,12 @@ def setup_driver():
         - Standard window size (1920x1080)
         - Automated chromedriver installation
     """
+    increment('driver_launches')
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+    from webdriver_manager.chrome import ChromeDriverManager
+
     service = Service(ChromeDriverManager().install())
     
     # Configure Chrome options
@@ -45,7 +44,7 @@ def setup_driver():
     # Initialize and return the WebDriver
     return webdriver.Chrome(service=service, options=chrome_options)
 
-def test_button_click(driver, wait, selector, by=By.CSS_SELECTOR):
+def test_button_click(driver, wait, selector, by=None):
     """
     Attempts to click on a web element using JavaScript with enhanced reliability.
     
@@ -54,7 +53,7 @@ def test_button_click(driver, wait, selector, by=By.CSS_SELECTOR):
         wait (selenium.webdriver.support.ui.WebDriverWait): WebDriverWait instance
         selector (str): Element selector (e.g., "button.submit")
         by (selenium.webdriver.common.by.By, optional): Selector strategy. 
-            Defaults to CSS_SELECTOR.
+            Defaults to By.CSS_SELECTOR.
     
     Returns:
         bool: True if click succeeds, False otherwise
@@ -65,6 +64,10 @@ def test_button_click(driver, wait, selector, by=By.CSS_SELECTOR):
         - Uses JavaScript click for reliability
         - Provides detailed error feedback
     """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+
+    by = by or By.CSS_SELECTOR
     try:
         # Wait for element to be present in DOM
         element = wait.until(EC.presence_of_element_located((by, selector)))
@@ -112,6 +115,9 @@ def get_chart_data(driver, wait):
         - Returns "Unknown" if title missing
         - Captures full HTML for price extraction
     """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+
     try:
         wait.until(EC.presence_of_element_located((By.CLASS_NAME, "martech-charts-history")))
         
@@ -128,6 +134,43 @@ def get_chart_data(driver, wait):
         return None, None
 
 
+def get_near_mint_table(driver, wait):
+    """
+    Extracts every available state and its price from the Near Mint Comparison Prices table.
+    
+    Args:
+        driver (selenium.webdriver.Chrome): Instance of Chrome WebDriver
+        wait (selenium.webdriver.support.ui.WebDriverWait): WebDriverWait instance for handling timeouts
+    
+    Returns:
+        dict: {state: price} (e.g. {"Holofoil": 357.42, "Reverse Holofoil": 120.5}), "N/A" prices are ignored
+    """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+
+    wait.until(EC.presence_of_element_located((By.CLASS_NAME, "near-mint-table")))
+    
+    states_prices = {}
+    cells = driver.find_elements(By.CSS_SELECTOR, "td[data-v-762a0eeb]")
+    
+    i = 0
+    while i < len(cells):
+        try:
+            state = cells[i].find_element(By.CLASS_NAME, "text").text.strip().replace(':', '')
+            price_element = cells[i+1].find_element(By.CLASS_NAME, "near-mint-table__price")
+            price_text = price_element.text.replace('$', '')
+            
+            if price_text != 'N/A':
+                states_prices[state] = float(price_text)
+            i += 2
+                
+        except Exception as e:
+            print(f"Erreur d'extraction : {e}")
+            i += 1
+
+    return states_prices
+
+
 def get_near_mint_prices(driver, wait):
     """
     Extracts prices and states from the Near Mint Comparison Prices table.
@@ -157,25 +200,7 @@ def get_near_mint_prices(driver, wait):
         - Uses specific HTML classes from the price table structure
         - Handles both single and multiple variant cases
     """
-    wait.until(EC.presence_of_element_located((By.CLASS_NAME, "near-mint-table")))
-    
-    states_prices = {}
-    cells = driver.find_elements(By.CSS_SELECTOR, "td[data-v-762a0eeb]")
-    
-    i = 0
-    while i < len(cells):
-        try:
-            state = cells[i].find_element(By.CLASS_NAME, "text").text.strip().replace(':', '')
-            price_element = cells[i+1].find_element(By.CLASS_NAME, "near-mint-table__price")
-            price_text = price_element.text.replace('$', '')
-            
-            if price_text != 'N/A':
-                states_prices[state] = float(price_text)
-            i += 2
-                
-        except Exception as e:
-            print(f"Erreur d'extraction : {e}")
-            i += 1
+    states_prices = get_near_mint_table(driver, wait)
     
     if states_prices:
         selected_state = max(states_prices.items(), key=lambda x: x[1])[0]
@@ -183,6 +208,44 @@ def get_near_mint_prices(driver, wait):
         
     return None, None
 
+
+def open_near_mint_history(driver, wait):
+    """
+    Opens the 1 year sales history filtered on Near Mint condition.
+    
+    Args:
+        driver (selenium.webdriver.Chrome): Chrome WebDriver instance
+        wait (selenium.webdriver.support.ui.WebDriverWait): WebDriverWait instance
+    
+    Returns:
+        bool: True if every click succeeded
+    
+    Notes:
+        - Clicks sequence: 1Y > Filters > Near Mint
+    """
+    from selenium.webdriver.common.by import By
+
+    initial_clicks = [
+        ('CSS_SELECTOR', 'button[data-v-0177b97d][class="charts-item"]:last-child'),
+        ('CSS_SELECTOR', 'div.modal__activator[role="button"]'),
+        ('CSS_SELECTOR', 'button.sales-history-snapshot__show-filters'),
+        ('XPATH', '//label[span[text()="Near Mint"]]')
+    ]
+    
+    for selector_type, selector in initial_clicks:
+        by_type = By.CSS_SELECTOR if selector_type == 'CSS_SELECTOR' else By.XPATH
+        if not test_button_click(driver, wait, selector, by=by_type):
+            print(f"Click failed for selector: {selector}")
+            return False
+    return True
+
+
+def get_state_selector(state):
+    """XPath of the filter checkbox of a card state (e.g. "Holofoil")"""
+    return f'//span[@class="checkbox__option-value checkbox__option-value-mobile" and text()="{state}"]'
+
+
+@timed('scraper.get_html_content')
 def get_html_content(website):
     """
     Extracts price history data for a Pokemon card by selecting and filtering the highest priced variant.
@@ -203,10 +266,15 @@ def get_html_content(website):
         - Handles multiple card states (Normal/Holofoil/Reverse)
         - Returns full HTML for price history extraction
     """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
     driver = setup_driver()
     wait = WebDriverWait(driver, 60)
     
     try:
+        increment('http_requests')
         driver.get(website)
         wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
         
@@ -214,21 +282,10 @@ def get_html_content(website):
         if not selected_state:
             return None, None
             
-        initial_clicks = [
-            ('CSS_SELECTOR', 'button[data-v-0177b97d][class="charts-item"]:last-child'),
-            ('CSS_SELECTOR', 'div.modal__activator[role="button"]'),
-            ('CSS_SELECTOR', 'button.sales-history-snapshot__show-filters'),
-            ('XPATH', '//label[span[text()="Near Mint"]]')
-        ]
-        
-        for selector_type, selector in initial_clicks:
-            by_type = By.CSS_SELECTOR if selector_type == 'CSS_SELECTOR' else By.XPATH
-            if not test_button_click(driver, wait, selector, by=by_type):
-                print(f"Click failed for selector: {selector}")
-                return None, None
+        if not open_near_mint_history(driver, wait):
+            return None, None
         
-        state_selector = f'//span[@class="checkbox__option-value checkbox__option-value-mobile" and text()="{selected_state}"]'
-        if not test_button_click(driver, wait, state_selector, By.XPATH):
+        if not test_button_click(driver, wait, get_state_selector(selected_state), By.XPATH):
             print(f"Click failed for state: {selected_state}")
             return None, None
             
@@ -243,13 +300,156 @@ def get_html_content(website):
         driver.quit()
 
 
-def extract_price_history(html_content, card_state):
+def parse_near_mint_table(html_content):
+    """
+    Extracts every available state and its price from the Near Mint table of a static HTML page.
+    
+    Args:
+        html_content (str): Raw HTML of the card price page
+    
+    Returns:
+        dict: {state: price}, same output as get_near_mint_table without a browser
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html_content, "html.parser")
+    cells = soup.select("td[data-v-762a0eeb]")
+    states_prices = {}
+    
+    for state_cell, price_cell in zip(cells[::2], cells[1::2]):
+        state_element = state_cell.find(class_="text")
+        price_element = price_cell.find(class_="near-mint-table__price")
+        if state_element is None or price_element is None:
+            continue
+        price_text = price_element.get_text(strip=True).replace('$', '')
+        if price_text != 'N/A':
+            states_prices[state_element.get_text(strip=True).replace(':', '')] = float(price_text)
+    return states_prices
+
+
+@timed('scraper.fetch_html_content')
+def fetch_html_content(website, session=None, timeout=30):
+    """
+    Lightweight alternative to get_html_content: a single HTTP GET, without a browser.
+    
+    Args:
+        website (str): URL of the Pokemon card price page
+        session (requests.Session, optional): Session reused between cards (keeps the connection alive)
+        timeout (float, optional): Timeout of the request in seconds
+    
+    Returns:
+        tuple: (html_content, selected_state), same as get_html_content.
+            Returns (None, None) if the request fails or the page has no Near Mint price
+    
+    Notes:
+        - Only works for pages whose sales table is in the served HTML (local fixtures,
+          cached pages, server-rendered pages): nothing is clicked and no JavaScript is run
+    """
+    import requests
+
+    try:
+        increment('http_requests')
+        response = (session or requests).get(website, timeout=timeout)
+        if response.status_code != 200:
+            print(f"Erreur: {response.status_code}")
+            return None, None
+        
+        states_prices = parse_near_mint_table(response.text)
+        if not states_prices:
+            return None, None
+        selected_state = max(states_prices.items(), key=lambda x: x[1])[0]
+        return response.text, selected_state
+    
+    except requests.RequestException as e:
+        print(f"An error occurred: {str(e)}")
+        return None, None
+
+
+@timed('scraper.get_all_variants_html_content')
+def get_all_variants_html_content(website):
+    """
+    Extracts the price history of every available variant of a Pokemon card from a single page load.
+    
+    Args:
+        website (str): URL of the Pokemon card price page
+    
+    Returns:
+        dict: {state: html_content} for each variant of the Near Mint table
+            (e.g. "Normal", "Holofoil", "Reverse Holofoil"), empty if the page fails
+    
+    Notes:
+        - The page and the Near Mint filter are opened once
+        - Each state filter is checked, the HTML is captured, then the filter is unchecked
+        - A failing variant is skipped, the others are kept
+    """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    driver = setup_driver()
+    wait = WebDriverWait(driver, 60)
+    contents = {}
+    
+    try:
+        increment('http_requests')
+        driver.get(website)
+        wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+        
+        states_prices = get_near_mint_table(driver, wait)
+        if not states_prices or not open_near_mint_history(driver, wait):
+            return contents
+        
+        for state in states_prices:
+            if not test_button_click(driver, wait, get_state_selector(state), By.XPATH):
+                print(f"Click failed for state: {state}")
+                continue
+            contents[state] = driver.page_source
+            # Uncheck the filter so that the next state is shown alone
+            test_button_click(driver, wait, get_state_selector(state), By.XPATH)
+        return contents
+        
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        return contents
+    
+    finally:
+        driver.quit()
+
+
+def resolve_date(month, day, upper_bound):
+    """
+    Returns the latest date with the given month and day that is not after upper_bound.
+
+    Args:
+        month (int): Month of the date (1-12)
+        day (int): Day of the month
+        upper_bound (datetime): Latest acceptable date
+
+    Returns:
+        datetime: Resolved date, walking back one year at a time (handles 02/29)
+    """
+    year = upper_bound.year
+    while True:
+        try:
+            candidate = datetime(year, month, day)
+        except ValueError:
+            year -= 1
+            continue
+        if candidate <= upper_bound:
+            return candidate
+        year -= 1
+
+
+@timed('scraper.extract_price_history')
+def extract_price_history(html_content, card_state, scrape_date=None):
     """
     Extracts and processes price history data from Pokemon card sales table.
     
     Args:
         html_content (str): Raw HTML containing price history table
         card_state (str): Card state (e.g. "Holofoil", "Reverse Holofoil")
+        scrape_date (datetime, optional): Date the page was fetched, used to anchor
+            the year of the most recent period. Defaults to now.
     
     Returns:
         pandas.DataFrame: Price history with columns:
@@ -259,35 +459,33 @@ def extract_price_history(html_content, card_state):
     
     Notes:
         - Removes "Near Mint" prefix from card state
-        - Handles date ranges across year boundaries
+        - The table only shows "MM/DD to MM/DD", so years are resolved by walking
+          from the most recent period backwards: each period ends before the next
+          one starts, which handles any number of year boundaries. The most recent
+          period may be the current week and end up to 6 days after scrape_date
         - Converts prices and quantities to numeric values
-        - Returns sorted DataFrame by date range
+        - Returns a DataFrame whose index is already sorted and unique
     """
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html_content, "html.parser")
-    price_history = {}
     card_state = card_state.replace("Near Mint ", "")
+    scrape_date = scrape_date or datetime.now()
 
-    
-    def convert_date(date_str):
+    def parse_range(date_str):
         try:
             start_date, end_date = date_str.split(" to ")
             start_month, start_day = map(int, start_date.split("/"))
             end_month, end_day = map(int, end_date.split("/"))
-            
-            current_year = 2024
-            previous_year = current_year - 1
-            
-            start_year = previous_year if start_month == 12 else current_year
-            end_year = current_year if end_month == 1 else start_year
-            
-            return datetime(start_year, start_month, start_day), datetime(end_year, end_month, end_day)
-            
+            return (start_month, start_day), (end_month, end_day)
+
         except Exception as e:
             print(f"Date conversion error: {date_str} - {str(e)}")
             return None, None
 
     rows = soup.find_all("tr")
-    
+    records = []
+
     for row in rows[1:]:
         cells = row.find_all("td")
         if len(cells) >= 3:
@@ -295,24 +493,76 @@ def extract_price_history(html_content, card_state):
                 date = cells[0].get_text(strip=True)
                 price = float(cells[1].get_text(strip=True).replace('$', ''))
                 quantity = float(cells[2].get_text(strip=True).replace('$', ''))
-                
-                start_date_obj, end_date_obj = convert_date(date)
-                if start_date_obj and end_date_obj:
-                    price_history[(start_date_obj, end_date_obj)] = {
-                        'price': price,
-                        'quantity_sold': int(quantity)
-                    }
+
+                start, end = parse_range(date)
+                if start and end:
+                    records.append((start, end, price, int(quantity)))
             except (ValueError, AttributeError) as e:
                 continue
 
-    df = pd.DataFrame.from_dict(price_history, orient='index')
-    df.index = pd.MultiIndex.from_tuples(df.index, names=['start_date', 'end_date'])
-        
-    return df.sort_index()
+    # The table may be listed oldest or newest first: in chronological order the
+    # next period starts the day after the previous one ends.
+    def follows(earlier, later):
+        start = resolve_date(*later[0], datetime(2000, 12, 31))
+        end = resolve_date(*earlier[1], start - timedelta(days=1))
+        return (start - end).days == 1
+
+    if len(records) > 1 and follows(records[1], records[0]):
+        newest_first = records
+    else:
+        newest_first = records[::-1]
+
+    index, data = [], []
+    # The most recent period is usually the current week, which ends up to 6 days after the scrape
+    upper_bound = scrape_date + timedelta(days=6)
+    for start, end, price, quantity in newest_first:
+        end_date_obj = resolve_date(*end, upper_bound)
+        start_date_obj = resolve_date(*start, end_date_obj)
+        index.append((start_date_obj, end_date_obj))
+        data.append({'price': price, 'quantity_sold': quantity})
+        upper_bound = start_date_obj - timedelta(days=1)
+
+    df = pd.DataFrame(data[::-1], columns=['price', 'quantity_sold'])
+    df.index = pd.MultiIndex.from_tuples(index[::-1], names=['start_date', 'end_date'])
+
+    return df
+
 
 
 
-def save_historic_prices(cards_df, output_dir='datas/price_history'):
+def save_price_history(price_history, card_id, card_state, subdirs):
+    """
+    Saves one price history in the sales bucket matching its total sales.
+    
+    Args:
+        price_history (pandas.DataFrame): Output of extract_price_history
+        card_id (str): Card identifier (e.g. 'swsh6-207')
+        card_state (str): Card state (e.g. "Reverse Holofoil")
+        subdirs (dict): Paths of the 'low_sales', 'medium_sales' and 'high_sales' folders
+    
+    Returns:
+        str: Path of the saved file: {card_id}_{state}.csv
+    """
+    total_sales = price_history['quantity_sold'].sum()
+    
+    if total_sales < 5:
+        subdir = subdirs['low_sales']
+    elif total_sales <= 20:
+        subdir = subdirs['medium_sales']
+    else:
+        subdir = subdirs['high_sales']
+    
+    sanitized_state = card_state.replace("Near Mint ", "").replace(" ", "_")
+    file_path = os.path.join(subdir, f'{card_id}_{sanitized_state}.csv')
+    
+    price_df = price_history.reset_index()
+    price_df.columns = ['start_date', 'end_date', 'price', 'quantity_sold']
+    price_df.to_csv(file_path, index=False)
+    return file_path
+
+
+def save_historic_prices(cards_df, output_dir='datas/price_history', all_variants=True, page_cache=None,
+                         freshness=7 * 24 * 3600):
     """
     Extracts and saves price history data for multiple Pokemon cards with progress tracking.
     
@@ -320,6 +570,14 @@ def save_historic_prices(cards_df, output_dir='datas/price_history'):
         cards_df (pandas.DataFrame): DataFrame containing card information with 'id' column
         output_dir (str, optional): Base directory for saving price history files.
             Defaults to 'price_history'
+        all_variants (bool, optional): If True, every variant (Normal, Holofoil, Reverse Holofoil)
+            is saved from the same page load. If False, only the highest priced one.
+            Defaults to True.
+        page_cache (PageCache, optional): Cache of the raw pages (see page_cache.py). Fetched pages are
+            stored in it, and a card fetched less than `freshness` seconds ago is parsed from it
+            instead of being fetched again. With all_variants, the cached pages are only used if they
+            come from fetches of every variant
+        freshness (float, optional): Freshness window of the cached pages, in seconds. Defaults to a week.
     
     Notes:
         - Creates subdirectories for different sales volumes:
@@ -329,6 +587,7 @@ def save_historic_prices(cards_df, output_dir='datas/price_history'):
         - Skips existing files to avoid duplicate processing
         - Shows progress with tqdm bar including current card status
         - Saves price history as CSV with format: {card_id}_{state}.csv
+          (one file per variant, see get_price_history_index)
         - Handles errors gracefully with status updates
     """
     subdirs = {
@@ -363,33 +622,39 @@ def save_historic_prices(cards_df, output_dir='datas/price_history'):
                 pbar.update(1)
                 continue
                 
+            cached = {}
             try:
-                html_content, card_state = get_html_content(
-                    f"https://prices.pokemontcg.io/tcgplayer/{card_id}")
-                
-                if html_content and card_state:
-                    price_history = extract_price_history(html_content, card_state)
-                    
-                    if price_history is not None:
-                        total_sales = price_history['quantity_sold'].sum()
-                        
-                        if total_sales < 5:
-                            subdir = subdirs['low_sales']
-                        elif total_sales <= 20:
-                            subdir = subdirs['medium_sales']
-                        else:
-                            subdir = subdirs['high_sales']
-                        
-                        sanitized_state = card_state.replace(" ", "_")
-                        file_path = os.path.join(subdir, f'{card_id}_{sanitized_state}.csv')
-                        
-                        price_df = price_history.reset_index()
-                        price_df.columns = ['start_date', 'end_date', 'price', 'quantity_sold']
-                        price_df.to_csv(file_path, index=False)
-                        
-                        pbar.set_postfix_str(f"Saved {card_id}", refresh=True)
+                website = f"https://prices.pokemontcg.io/tcgplayer/{card_id}"
+                scrape_date = datetime.now()
+                cached = page_cache.get_card(card_id, max_age=freshness) if page_cache is not None else {}
+                if all_variants and not all(page.complete for page in cached.values()):
+                    # Cached by a single-variant fetch: the other variants of the page may be missing
+                    cached = {}
+                if cached:
+                    contents = {card_state: page_cache.read(page) for card_state, page in cached.items()}
+                    fetch_dates = {card_state: page.fetched_at for card_state, page in cached.items()}
+                else:
+                    if all_variants:
+                        contents = get_all_variants_html_content(website)
                     else:
-                        pbar.set_postfix_str(f"No data for {card_id}", refresh=True)
+                        html_content, card_state = get_html_content(website)
+                        contents = {card_state: html_content} if html_content and card_state else {}
+                    fetch_dates = dict.fromkeys(contents, scrape_date)
+                    if page_cache is not None:
+                        for card_state, html_content in contents.items():
+                            page_cache.put(card_id, card_state, html_content, scrape_date, website, complete=all_variants)
+                
+                saved = 0
+                for card_state, html_content in contents.items():
+                    price_history = extract_price_history(html_content, card_state, fetch_dates[card_state])
+                    if price_history is not None and not price_history.empty:
+                        save_price_history(price_history, card_id, card_state, subdirs)
+                        saved += 1
+                
+                if saved:
+                    pbar.set_postfix_str(f"Saved {card_id} ({saved} variants)", refresh=True)
+                else:
+                    pbar.set_postfix_str(f"No data for {card_id}", refresh=True)
                 
             except Exception as e:
                 pbar.set_postfix_str(f"Failed {card_id}: {str(e)}", refresh=True)
@@ -397,7 +662,8 @@ def save_historic_prices(cards_df, output_dir='datas/price_history'):
                 failed_ids.add(card_id)
             
             pbar.update(1)
-            time.sleep(1)
+            if not cached:
+                time.sleep(1)
 
 
 def load_failed_ids(file_path='datas/failed_ids.txt'):
@@ -412,3 +678,49 @@ def save_failed_id(card_id, file_path='datas/failed_ids.txt'):
     """Add a new ID that that faild to the txt file"""
     with open(file_path, 'a') as f:
         f.write(f"{card_id}\n")
+
+
+_reparse_state = {}
+
+def _init_reparse_worker(cache_root, subdirs):
+    from page_cache import PageCache
+    _reparse_state.update(cache=PageCache(cache_root), subdirs=subdirs)
+
+
+def _reparse_page(page):
+    cache, subdirs = _reparse_state['cache'], _reparse_state['subdirs']
+    price_history = extract_price_history(cache.read(page), page.variant, page.fetched_at)
+    if price_history is None or price_history.empty:
+        return None
+    # The sales bucket can change with the new parsing: the previous file of the variant is replaced
+    file_name = f"{page.card_id}_{page.variant.replace('Near Mint ', '').replace(' ', '_')}.csv"
+    for subdir in subdirs.values():
+        if os.path.exists(os.path.join(subdir, file_name)):
+            os.remove(os.path.join(subdir, file_name))
+    return save_price_history(price_history, page.card_id, page.variant, subdirs)
+
+
+@timed('scraper.reparse_pages')
+def reparse_pages(page_cache, output_dir='datas/price_history', max_workers=None):
+    """
+    Parses again the latest cached page of every card and variant, without any request (e.g. after a
+    fix of extract_price_history), in parallel over the cores.
+    
+    Args:
+        page_cache (PageCache): Cache filled by save_historic_prices
+        output_dir (str, optional): Base directory of the price history files
+        max_workers (int, optional): Parsing processes. Defaults to the number of cores.
+    
+    Returns:
+        int: Number of price history files written
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    subdirs = {bucket: os.path.join(output_dir, bucket) for bucket in ('low_sales', 'medium_sales', 'high_sales')}
+    for subdir in subdirs.values():
+        os.makedirs(subdir, exist_ok=True)
+    pages = page_cache.pages()
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_reparse_worker,
+                             initargs=(page_cache.root, subdirs)) as executor:
+        paths = list(tqdm(executor.map(_reparse_page, pages, chunksize=16), total=len(pages), desc="Parsing"))
+    return sum(path is not None for path in paths)
@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import atexit
+import functools
+import threading
+from datetime import datetime
+
+# Set POKEMON_PROFILE=1 to enable the timers and counters, and POKEMON_PROFILE_REPORT=<path>
+# to write the JSON report when the process exits. When disabled, decorated functions are
+# left untouched and timers/counters are no-ops.
+ENABLED = os.environ.get('POKEMON_PROFILE', '').lower() in ('1', 'true', 'yes')
+
+_lock = threading.Lock()
+_timings = {}
+_counters = {}
+_started_at = datetime.now().isoformat(timespec='seconds')
+
+
+class _Timer:
+    """Times a block (context manager) or every call of a function (decorator)"""
+    def __init__(self, name):
+        self.name = name
+        self._local = threading.local()
+
+    def __enter__(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        record_time(self.name, time.perf_counter() - self._local.stack.pop())
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_time(self.name, time.perf_counter() - start)
+        return wrapper
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __call__(self, func):
+        return func
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(name):
+    """
+    Times a block or a function under the given name.
+
+    Args:
+        name (str): Name of the timing in the report (e.g. 'markowitz.optimize_portfolio')
+
+    Returns:
+        Context manager / decorator. When profiling is disabled, the decorated function
+        is returned as is (zero overhead).
+
+    Example:
+        >>> @timed('loading.cards_matrix')
+        ... def get_dataframe_cards_matrix(...): ...
+        >>> with timed('dashboard.charts'):
+        ...     price, returns = plot_analysis(portfolio)
+    """
+    return _Timer(name) if ENABLED else _NULL_TIMER
+
+
+def record_time(name, seconds):
+    """Adds a duration to a timing"""
+    with _lock:
+        stats = _timings.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+        stats['count'] += 1
+        stats['total'] += seconds
+        stats['max'] = max(stats['max'], seconds)
+
+
+def increment(counter, value=1):
+    """
+    Increments a counter (files read, objective evaluations, driver launches, HTTP requests...).
+
+    Args:
+        counter (str): Name of the counter
+        value (int): Increment
+    """
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[counter] = _counters.get(counter, 0) + value
+
+
+def get_report():
+    """
+    Returns:
+        dict: started_at, timings ({name: count, total, mean, max} in seconds) and counters
+    """
+    with _lock:
+        timings = {
+            name: {**stats, 'total': round(stats['total'], 6), 'max': round(stats['max'], 6),
+                   'mean': round(stats['total'] / stats['count'], 6)}
+            for name, stats in sorted(_timings.items())
+        }
+        return {'enabled': ENABLED, 'started_at': _started_at, 'timings': timings, 'counters': dict(sorted(_counters.items()))}
+
+
+def dump_report(path):
+    """Writes the report of the current run as JSON"""
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(get_report(), file, indent=2)
+
+
+def reset():
+    """Clears every timing and counter"""
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+
+
+if ENABLED and os.environ.get('POKEMON_PROFILE_REPORT'):
+    atexit.register(dump_report, os.environ['POKEMON_PROFILE_REPORT'])
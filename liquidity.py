@@ -0,0 +1,96 @@
+import warnings
+import numpy as np
+import pandas as pd
+from useful_functions_for_models import get_price_panel, get_data_version
+from streaming_estimator import get_log_returns
+
+_cache = {}
+
+
+def compute_liquidity_metrics(cards_df: pd.DataFrame, impact_coefficient: float = 1.0, panel=None) -> pd.DataFrame:
+    """
+    Computes the liquidity of every card at once from the aligned weekly panel.
+
+    Args:
+        cards_df: Output of get_dataframe_cards_matrix(), with columns 'card_id' and 'Card Info'
+        impact_coefficient: Constant of the square-root market impact model
+        panel: (prices, volumes) of the cards, as returned by get_price_panel (e.g. a shared panel,
+            see shared_panel.py). Built from the 'Card Info' column if not given
+
+    Returns:
+        pd.DataFrame: One row per card (same index as cards_df), with columns:
+            - active_frequency: Share of weeks with at least one sale
+            - median_volume: Median quantity sold over the active weeks
+            - mean_volume: Mean quantity sold per week
+            - median_price: Median weekly price
+            - volatility: Standard deviation of the weekly log returns
+            - time_to_fill: Expected number of weeks to sell (or buy) one copy, inf if never traded
+            - market_impact: Estimated price impact of trading one copy, as a fraction of the price
+              (square-root law: coefficient x volatility x sqrt(1 / median_volume))
+    """
+    prices, volumes = panel if panel is not None else get_price_panel(cards_df)
+    observed = ~np.isnan(volumes.values)
+    volume_values = np.nan_to_num(volumes.values)
+    n_observed = np.maximum(observed.sum(axis=0), 1)
+
+    active = volume_values > 0
+    active_frequency = active.sum(axis=0) / n_observed
+    mean_volume = volume_values.sum(axis=0) / n_observed
+    with warnings.catch_warnings():
+        # Cards that never sold have an all-NaN column: their median volume is 0
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median_volume = np.nan_to_num(np.nanmedian(np.where(active, volume_values, np.nan), axis=0))
+    volatility = get_log_returns(prices).values.std(axis=0, ddof=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        time_to_fill = np.where(mean_volume > 0, 1 / mean_volume, np.inf)
+        market_impact = np.where(median_volume > 0, impact_coefficient * volatility * np.sqrt(1 / median_volume), np.inf)
+
+    return pd.DataFrame({
+        'card_id': cards_df['card_id'].values,
+        'active_frequency': np.round(active_frequency, 3),
+        'median_volume': median_volume,
+        'mean_volume': np.round(mean_volume, 3),
+        'median_price': np.nanmedian(prices.values, axis=0),
+        'volatility': np.round(volatility, 4),
+        'time_to_fill': np.round(time_to_fill, 2),
+        'market_impact': np.round(market_impact, 4)
+    }, index=cards_df.index)
+
+
+def get_liquidity_metrics(cards_df: pd.DataFrame, folder_path: str = 'datas/price_history', panel=None) -> pd.DataFrame:
+    """
+    Cached version of compute_liquidity_metrics: the metrics are computed once per version of
+    the price history tree and universe.
+
+    Args:
+        cards_df: Output of get_dataframe_cards_matrix()
+        folder_path: Price history folder, its fingerprint invalidates the cache
+        panel: Optional (prices, volumes) of the cards, see compute_liquidity_metrics
+
+    Returns:
+        pd.DataFrame: See compute_liquidity_metrics
+    """
+    key = (get_data_version(folder_path), len(cards_df), hash(tuple(cards_df['card_id'])))
+    if key not in _cache:
+        _cache.clear()
+        _cache[key] = compute_liquidity_metrics(cards_df, panel=panel)
+    return _cache[key].set_axis(cards_df.index)
+
+
+def get_position_limits(liquidity_df: pd.DataFrame, prices: np.ndarray, amount_to_invest: float,
+                        max_volume_fraction: float) -> np.ndarray:
+    """
+    Maximum weight of each card such that the position stays below a fraction of its weekly volume.
+
+    Args:
+        liquidity_df: Liquidity metrics of the candidate cards
+        prices: Prices of the candidate cards
+        amount_to_invest: Budget
+        max_volume_fraction: Maximum position, as a fraction of the median weekly volume
+
+    Returns:
+        np.ndarray: Upper bound of each weight, in [0, 1]
+    """
+    max_copies = max_volume_fraction * liquidity_df['median_volume'].values
+    return np.clip(max_copies * prices / amount_to_invest, 0, 1)
@@ -1,9 +1,115 @@
+import time
 import pandas as pd
 import numpy as np
 from typing import Dict
 from dataclasses import dataclass
-from useful_functions_for_models import select_mixed_cards, calculate_covariance_matrix, get_dataframe_cards_matrix
+from useful_functions_for_models import select_mixed_cards, select_clustered_cards, get_dataframe_cards_matrix, get_price_panel, get_data_version
+from streaming_estimator import StreamingCovarianceEstimator, get_log_returns
+from covariance_estimators import COVARIANCE_ESTIMATORS, FactorCovariance, factor_covariance, get_factor_exposures
+from liquidity import get_liquidity_metrics, get_position_limits
+from card_catalog import load_card_catalog
+from universe_table import load_universe_table
+from result_store import OptimizationResult, ResultStore
+from candidate_index import CandidateIndex
+from instrumentation import timed, increment
 from scipy.optimize import minimize
+
+
+def portfolio_variance(covariance_matrix, weights: np.ndarray) -> float:
+    """wᵀ·Σ·w, for a dense covariance matrix or a FactorCovariance"""
+    if isinstance(covariance_matrix, FactorCovariance):
+        return covariance_matrix.quadratic_form(weights)
+    return np.dot(weights.T, np.dot(covariance_matrix, weights))
+
+
+@timed('markowitz.minimize_portfolio_variance')
+def minimize_portfolio_variance(covariance_matrix, upper_bounds: np.ndarray = None, return_info: bool = False):
+    """
+    Solves the long-only minimum variance problem (weights summing to 1) with SLSQP.
+
+    Args:
+        covariance_matrix: Covariance matrix of the candidate cards (n x n), dense or FactorCovariance
+        upper_bounds: Maximum weight of each card (defaults to 1)
+        return_info: Also return the solver statistics
+
+    Returns:
+        np.ndarray: Optimal weights, starting from the equally weighted portfolio.
+            With return_info, (weights, {'iterations', 'evaluations', 'success', 'message'})
+    """
+    if isinstance(covariance_matrix, FactorCovariance):
+        matvec = covariance_matrix.matvec
+    else:
+        dense = np.asarray(covariance_matrix)
+        matvec = lambda weights: dense @ weights
+    n_cards = len(covariance_matrix)
+    constraints = [
+        {'type': 'eq', 'fun': lambda x: np.sum(x) - 1, 'jac': lambda x: np.ones_like(x)}
+    ]
+    if upper_bounds is None:
+        upper_bounds = np.ones(n_cards)
+    if np.sum(upper_bounds) < 1:
+        raise ValueError("The position limits are too tight to invest the whole amount")
+    bounds = tuple((0, upper) for upper in upper_bounds)
+    # Equal weights, clipped to the limits and rescaled to sum to 1
+    initial_weights = np.minimum(np.array([1/n_cards] * n_cards), upper_bounds)
+    while initial_weights.sum() < 1 - 1e-12:
+        room = upper_bounds - initial_weights
+        initial_weights = np.minimum(initial_weights + room * (1 - initial_weights.sum()) / room.sum(), upper_bounds)
+
+    def objective(weights):
+        # Analytic gradient 2·Σ·w: SLSQP does not need n finite difference evaluations per step
+        increment('objective_evaluations')
+        sigma_w = matvec(weights)
+        return weights @ sigma_w, 2 * sigma_w
+
+    result = minimize(
+        objective,
+        initial_weights,
+        jac=True,
+        method='SLSQP',
+        bounds=bounds,
+        constraints=constraints
+    )
+    increment('slsqp_iterations', result.nit)
+    if return_info:
+        return result.x, {'iterations': int(result.nit), 'evaluations': int(result.nfev),
+                          'success': bool(result.success), 'message': str(result.message)}
+    return result.x
+
+
+def discretize_weights(weights: np.ndarray, prices: np.ndarray, amount_to_invest: float):
+    """
+    Markowitz adaptation: buys one copy of each card, by decreasing weight, until the budget is reached.
+    The last card is kept if it brings the total closer to the budget.
+
+    Args:
+        weights: Optimal weights of the candidate cards
+        prices: Prices of the candidate cards
+        amount_to_invest: Budget
+
+    Returns:
+        tuple: (total_investment, selected_indices)
+    """
+    sorted_indices = np.argsort(weights)[::-1]
+
+    total_investment = 0
+    selected_indices = []
+
+    for idx in sorted_indices:
+        if total_investment + prices[idx] <= amount_to_invest:
+            total_investment += prices[idx]
+            selected_indices.append(idx)
+        else:
+            if abs(amount_to_invest - (total_investment + prices[idx])) < abs(amount_to_invest - total_investment):
+                total_investment += prices[idx]
+                selected_indices.append(idx)
+            break
+    return total_investment, selected_indices
+
+
+CANDIDATE_SELECTIONS = ('clusters', 'mixed')
+
+
 @dataclass
 class SigmoidParameters:
     MAX_K: float = 0.1
@@ -17,7 +123,16 @@ class MarkowitzOptimizer:
                  amount_to_invest: float, 
                  critical_sales_threshold: float, 
                  sales_volume_sensitivity: float,
-                dataframe_cards_info: pd.DataFrame = get_dataframe_cards_matrix()):
+                dataframe_cards_info: pd.DataFrame = None,
+                estimator: StreamingCovarianceEstimator = None,
+                covariance_estimator: str = 'sample',
+                path_database: str = "datas/pokemon_cards.csv",
+                max_volume_fraction: float = None,
+                folder_path: str = 'datas/price_history',
+                data_version: str = None,
+                price_panel: tuple = None,
+                candidate_index: CandidateIndex = None,
+                candidate_selection: str = 'clusters'):
         """
         Initialize the Markowitz Optimizer
         
@@ -26,12 +141,61 @@ class MarkowitzOptimizer:
             dataframe_cards_info: DataFrame containing card information
             critical_sales_threshold: Threshold for sales (x0)
             sales_volume_sensitivity: Sensitivity parameter (k)
+            estimator: Shared streaming estimate of the weekly returns. If given, mean returns and
+                covariance come from it instead of being recomputed from the price files.
+            covariance_estimator: 'sample' (default), 'ledoit_wolf', 'constant_correlation' or 'factor'.
+                The shrinkage and factor estimators work on weekly log returns and stay well
+                conditioned when there are more cards than weeks.
+            path_database: Card catalog, used for the set/rarity/series exposures of the factor model
+            max_volume_fraction: If set, the position in each card is limited to this fraction of its
+                median weekly volume: cards that cannot be traded even once are filtered out and the
+                weights are bounded accordingly.
+            folder_path: Price history folder, used when dataframe_cards_info is not given and to
+                fingerprint the data (liquidity cache, result store)
+            data_version: Fingerprint of folder_path (see get_data_version), computed when a result
+                store is first used if not given
+            price_panel: (prices, volumes) aligned with dataframe_cards_info (e.g. attached from shared
+                memory, see shared_panel.py). The returns and liquidity are then read from it, and
+                dataframe_cards_info does not need the 'Card Info' column
+            candidate_index: Index of the candidates built for the same cards and reliability parameters
+                (see get_candidate_index), e.g. reused while only the amount changes. Built on first use
+                if not given
+            candidate_selection: How the candidates are reduced to N cards before the solve: 'clusters'
+                (default, best scoring card of each cluster of correlated returns) or 'mixed' (half
+                most expensive, half random)
         """
+        if candidate_selection not in CANDIDATE_SELECTIONS:
+            raise ValueError(f"Unknown candidate selection '{candidate_selection}', choose among {list(CANDIDATE_SELECTIONS)}")
+        if covariance_estimator not in COVARIANCE_ESTIMATORS and covariance_estimator != 'factor':
+            raise ValueError(f"Unknown covariance estimator '{covariance_estimator}', "
+                             f"choose among {list(COVARIANCE_ESTIMATORS) + ['factor']}")
+        if dataframe_cards_info is None:
+            dataframe_cards_info = get_dataframe_cards_matrix(folder_path)
         self.amount_to_invest = amount_to_invest
-        self.df = dataframe_cards_info[['card_id', 'last_price', 'mean_return', 'Quantity Sold', 'Card Info']].copy()        
+        self.folder_path = folder_path
+        columns = ['card_id', 'last_price', 'mean_return', 'Quantity Sold', 'Card Info']
+        if price_panel is not None and 'Card Info' not in dataframe_cards_info:
+            columns.remove('Card Info')
+        self.df = dataframe_cards_info[columns].copy()
+        self.price_panel = price_panel
+        # Cards flagged by the loader (malformed dates, null prices) are never selected
+        self.valid = (dataframe_cards_info['valid'].values if 'valid' in dataframe_cards_info
+                      else np.ones(len(dataframe_cards_info), dtype=bool))
+        self.estimator = estimator
+        self.covariance_estimator = covariance_estimator
+        self.path_database = path_database
+        self._factor_model = None
+        self.max_volume_fraction = max_volume_fraction
+        self.liquidity = get_liquidity_metrics(self.df, folder_path, price_panel) if max_volume_fraction is not None else None
+        if estimator is not None:
+            self.df['mean_return'] = np.round(estimator.mean(estimator.indices_of(self.df['card_id'])) * 100, 4)
         self.critical_sales_threshold = critical_sales_threshold
         self.sales_volume_sensitivity = sales_volume_sensitivity
         self.params = SigmoidParameters()
+        self.solver_stats = {}
+        self.data_version = data_version
+        self._candidate_index = candidate_index
+        self.candidate_selection = candidate_selection
     
     @staticmethod
     def sigmoid(x: np.ndarray, x0: float, k: float) -> np.ndarray:
@@ -54,27 +218,94 @@ class MarkowitzOptimizer:
         return self.df
 
 
+    @timed('markowitz.get_optimized_return_mean_matrix_fiability')
     def get_optimized_return_mean_matrix_fiability(self, threshold=0.01, ratio=0.5, N=30):
         """
         Filter the DataFrame according to the given criterias and limits the dataframe with N to reduce time complexity of the Markowitz model.
         If you want more cards but more time to compute, change N.
         """
         self.df=self.add_fiability_metrics()
-        filtered_df = self.df[
-            (self.df['Return x Fiability'] > threshold) & 
-            (self.df['last_price'] < ratio * self.amount_to_invest)
-        ]
+        filtered_df = self.df.iloc[self.get_candidate_index().candidates(threshold, ratio * self.amount_to_invest)]
         
         if len(filtered_df) > N:
-            # Function from UsefulFunctionsForModels.py -> the half of the cards are taken according to the highest prices and the other half is taken randomly (to have different cards when we compute because of the N).
-            filtered_df = select_mixed_cards(filtered_df, N)
+            if self.candidate_selection == 'clusters':
+                # One card per cluster of correlated returns: a small problem that still spans the universe
+                filtered_df = select_clustered_cards(filtered_df, N, self.get_candidate_covariance(filtered_df),
+                                                     budget=self.amount_to_invest)
+            else:
+                # Function from UsefulFunctionsForModels.py -> the half of the cards are taken according to the highest prices and the other half is taken randomly (to have different cards when we compute because of the N).
+                filtered_df = select_mixed_cards(filtered_df, N)
         return filtered_df
 
 
+    def get_candidate_index(self) -> CandidateIndex:
+        """
+        Cards sorted by price and by Return x Fiability, restricted to the valid (and tradable) cards.
+        The index only depends on the reliability parameters: candidates and counts for any threshold
+        and amount are then range queries (see count_candidates)
+        """
+        if self._candidate_index is None:
+            if 'Return x Fiability' not in self.df:
+                self.add_fiability_metrics()
+            eligible = self.valid
+            if self.liquidity is not None:
+                # At least one copy must fit in the allowed share of the weekly volume
+                eligible = eligible & (self.liquidity['median_volume'].values * self.max_volume_fraction >= 1)
+            self._candidate_index = CandidateIndex.from_frame(self.df, eligible=eligible)
+        return self._candidate_index
+
+    def count_candidates(self, threshold=0.01, ratio=0.5) -> int:
+        """Number of cards passing the filter of get_optimized_return_mean_matrix_fiability, before the N limit"""
+        return self.get_candidate_index().count(threshold, ratio * self.amount_to_invest)
+
+    def get_candidate_covariance(self, filtered_df) -> np.ndarray:
+        """
+        Covariance of the weekly log returns of the candidates, used to cluster them. Read from the
+        estimator when given (moments precomputed once per data version, see shared_panel.py),
+        otherwise computed from the aligned returns of the candidates only
+        """
+        if self.estimator is not None:
+            return self.estimator.covariance(self.estimator.indices_of(filtered_df['card_id']))
+        return np.cov(self.get_returns(filtered_df), rowvar=False)
+
+    def get_returns(self, cards_df) -> np.ndarray:
+        """Aligned weekly log returns (weeks x cards) of the given cards"""
+        if self.price_panel is not None:
+            prices = self.price_panel[0].iloc[:, self.df.index.get_indexer(cards_df.index)]
+        else:
+            prices, _ = get_price_panel(cards_df)
+        return get_log_returns(prices).values
+
+    def get_factor_model(self) -> FactorCovariance:
+        """Set/rarity/series factor model, fitted once on the whole universe"""
+        if self._factor_model is None:
+            exposures = get_factor_exposures(self.df['card_id'].values, load_card_catalog(self.path_database))
+            self._factor_model = factor_covariance(self.get_returns(self.df), exposures)
+        return self._factor_model
+
+    @timed('markowitz.calculate_covariance')
+    def calculate_covariance(self, filtered_df):
+        """
+        Covariance of the weekly log returns of the filtered cards, with the selected estimator. The
+        'sample' covariance is read from the estimator when given, computed from the aligned returns
+        of the filtered cards otherwise (the same quantity)
+        """
+        if self.covariance_estimator == 'factor':
+            return self.get_factor_model().subset(self.df.index.get_indexer(filtered_df.index))
+
+        if self.covariance_estimator != 'sample':
+            return COVARIANCE_ESTIMATORS[self.covariance_estimator](self.get_returns(filtered_df))
+
+        if self.estimator is None:
+            covariance = np.atleast_2d(COVARIANCE_ESTIMATORS['sample'](self.get_returns(filtered_df)))
+        else:
+            covariance = self.estimator.covariance(self.estimator.indices_of(filtered_df['card_id']))
+        return pd.DataFrame(covariance, index=filtered_df['card_id'].values, columns=filtered_df['card_id'].values)
+
     def objective_weights(self, weights):
         filtered_df = self.get_optimized_return_mean_matrix_fiability()
-        covariance_filtered_cards = calculate_covariance_matrix(filtered_df)
-        return np.dot(weights.T, np.dot(covariance_filtered_cards, weights))
+        covariance_filtered_cards = self.calculate_covariance(filtered_df)
+        return portfolio_variance(covariance_filtered_cards, weights)
     
     def set_constraints(self):
         filtered_df = self.get_optimized_return_mean_matrix_fiability()
@@ -88,6 +319,7 @@ class MarkowitzOptimizer:
         bounds = tuple((0, 1) for _ in range(n_cards))
         return constraints, bounds
     
+    @timed('markowitz.optimize_portfolio')
     def optimize_portfolio(self):
         filtered_df = self.get_optimized_return_mean_matrix_fiability()
         n_cards = len(filtered_df)
@@ -95,66 +327,103 @@ class MarkowitzOptimizer:
         if n_cards == 0:
             raise ValueError("No cards correspond to the filter criterias")
         
-        constraints, bounds = self.set_constraints()
-        initial_weights = np.array([1/n_cards] * n_cards)
-
-        # Markowitz problem
-        result = minimize(
-            self.objective_weights, 
-            initial_weights, 
-            method='SLSQP', 
-            bounds=bounds, 
-            constraints=constraints
-        )
-        
-        
-        return result.x, filtered_df
+        # Markowitz problem (the covariance is computed once, not at every objective evaluation)
+        covariance_filtered_cards = self.calculate_covariance(filtered_df)
+        upper_bounds = None
+        if self.liquidity is not None:
+            upper_bounds = get_position_limits(self.liquidity.loc[filtered_df.index], filtered_df['last_price'].values,
+                                               self.amount_to_invest, self.max_volume_fraction)
+        weights, self.solver_stats = minimize_portfolio_variance(covariance_filtered_cards, upper_bounds, return_info=True)
 
-    def optimize_cards_sell(self):
-        # Markowitz adaptation --> takes the best weights for the investment amount.
-        df = self.get_optimized_return_mean_matrix_fiability()
+        return weights, filtered_df
+
+    def get_parameters(self) -> dict:
+        """Parameters that determine the result of the optimization, for a given data version"""
+        return {
+            'amount_to_invest': self.amount_to_invest,
+            'critical_sales_threshold': self.critical_sales_threshold,
+            'sales_volume_sensitivity': self.sales_volume_sensitivity,
+            'covariance_estimator': self.covariance_estimator,
+            'max_volume_fraction': self.max_volume_fraction,
+            'candidate_selection': self.candidate_selection,
+            'estimator': None if self.estimator is None else {'window': self.estimator.window, 'decay': self.estimator.decay},
+            'n_cards': len(self.df)
+        }
+
+    @timed('markowitz.solve')
+    def solve(self, store: ResultStore = None) -> OptimizationResult:
+        """
+        Markowitz adaptation --> takes the best weights for the investment amount.
+
+        Args:
+            store: If given, the result is read from the store when the same parameters were already
+                solved on the same data version, and stored otherwise
+
+        Returns:
+            OptimizationResult: card_indices are the integer indices of the selected cards in the
+                universe (positions in dataframe_cards_info)
+        """
+        if store is not None:
+            if self.data_version is None:
+                self.data_version = get_data_version(self.folder_path)
+            parameters, data_version = self.get_parameters(), self.data_version
+            result = store.get(parameters, data_version)
+            if result is not None:
+                self.add_fiability_metrics()
+                return result
+
+        start = time.perf_counter()
+        weights, df = self.optimize_portfolio()
         prices = df["last_price"].values
-        weights, _ = self.optimize_portfolio()
-        
-        sorted_indices = np.argsort(weights)[::-1]
-        
-        total_investment = 0
-        selected_indices = []
-        
-        for idx in sorted_indices:
-            if total_investment + prices[idx] <= self.amount_to_invest:
-                total_investment += prices[idx]
-                selected_indices.append(idx)
-            else:
-                if abs(self.amount_to_invest - (total_investment + prices[idx])) < abs(self.amount_to_invest - total_investment):
-                    total_investment += prices[idx]
-                    selected_indices.append(idx)
-                break
         
-        binary_selection = np.zeros(len(weights))
-        binary_selection[selected_indices] = 1
+        total_investment, selected_indices = discretize_weights(weights, prices, self.amount_to_invest)
         mean_return= np.mean(df.iloc[selected_indices]["Return x Fiability"])
+        card_indices = self.df.index.get_indexer(df.index[selected_indices])
         
-        return round(total_investment,2),  round(mean_return,3), df.iloc[selected_indices]
+        result = OptimizationResult(card_indices, weights[selected_indices], round(total_investment,2), round(mean_return,3),
+                                    {**self.solver_stats, 'n_candidates': len(df), 'duration': time.perf_counter() - start})
+        if store is not None:
+            store.put(parameters, data_version, result)
+        return result
+
+    def select_cards(self, store: ResultStore = None):
+        """
+        Returns:
+            tuple: (total_investment, mean_return, card_indices), see solve()
+        """
+        result = self.solve(store)
+        return result.total_investment, result.mean_return, result.card_indices
+
+    @timed('markowitz.optimize_cards_sell')
+    def optimize_cards_sell(self):
+        total_investment, mean_return, card_indices = self.select_cards()
+        return total_investment, mean_return, self.df.iloc[card_indices]
     
-    def get_streamlit_database_markowitz(self, path_database="datas/pokemon_cards.csv"):
+    @timed('markowitz.get_streamlit_database_markowitz')
+    def get_streamlit_database_markowitz(self, path_database="datas/pokemon_cards.csv", store: ResultStore = None):
         """
-        Returns the ideal dataframe for Streamlit Interface ! Join the `pokemon_cards.csv` file and the selected cards from Markowitz.
+        Returns the ideal dataframe for Streamlit Interface ! The selected cards from Markowitz are enriched
+        with the catalog metadata of the universe table (joined once, see load_universe_table).
+        Results are reused from the store when given (see solve()).
         """
-        pokemon_cards_df=pd.read_csv(path_database)
-        total_investment, mean_return, df = self.optimize_cards_sell()
-        df['base_id'] = df['card_id'].str.split('_').str[0]
-        
-        pokemon_info = pokemon_cards_df[['id', 'name', 'rarity', 'collection', 'release_date', 'images_url']]
+        total_investment, mean_return, card_indices = self.select_cards(store)
+        universe = load_universe_table(self.df, self.folder_path, path_database,
+                                       data_version=self.data_version).take(card_indices)
+        selection = self.df.iloc[card_indices]
         
-        result_df = pd.merge(
-            df[['base_id', 'last_price',"Fiability", "Return x Fiability", "Card Info"]],
-            pokemon_info,
-            left_on='base_id',
-            right_on='id',
-            how='left'
-        )
+        result_df = pd.DataFrame({
+            'id': universe['base_id'].values,
+            'name': universe['name'].values,
+            'rarity': universe['rarity'].values,
+            'last_price': selection['last_price'].values,
+            'Fiability': selection['Fiability'].values,
+            'Return x Fiability': selection['Return x Fiability'].values,
+            'collection': universe['collection'].values,
+            'release_date': universe['release_date'].values,
+            'images_url': universe['images_url'].values,
+            'Card Info': selection['Card Info'].values
+        })
         
-        return total_investment, mean_return, result_df[['id', 'name', 'rarity', 'last_price',"Fiability", "Return x Fiability", 'collection', 'release_date', 'images_url', "Card Info"]]
+        return total_investment, mean_return, result_df
 
             
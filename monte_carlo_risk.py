@@ -0,0 +1,141 @@
+import os
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict
+from useful_functions_for_models import get_price_panel
+from streaming_estimator import get_log_returns
+
+
+@dataclass
+class RiskReport:
+    initial_value: float
+    horizon_weeks: int
+    confidence: float
+    value_at_risk: float          # loss not exceeded with probability `confidence`
+    conditional_value_at_risk: float  # mean loss beyond the VaR (expected shortfall)
+    expected_value: float
+    quantiles: Dict[float, float] = field(default_factory=dict)
+    values: np.ndarray = None     # simulated portfolio values at the horizon
+
+
+def _simulate_chunk(method, mean, factor, history, initial_prices, horizon, n_paths, dof, seed):
+    """
+    Simulates n_paths portfolio values at the horizon. Only a (n_paths, n_cards) array of
+    cumulative log returns is kept in memory, the horizon is accumulated week by week.
+    """
+    rng = np.random.default_rng(seed)
+    n_cards = len(initial_prices)
+    cumulative = np.zeros((n_paths, n_cards))
+
+    for _ in range(horizon):
+        if method == 'bootstrap':
+            # Whole historical weeks are resampled: the cross-section dependence is kept
+            cumulative += history[rng.integers(0, len(history), size=n_paths)]
+        else:
+            shocks = rng.standard_normal((n_paths, factor.shape[1])) @ factor.T
+            if method == 't':
+                # Scaled so that the covariance stays the estimated one
+                scale = np.sqrt(rng.chisquare(dof, size=(n_paths, 1)) / (dof - 2))
+                shocks /= scale
+            cumulative += mean + shocks
+
+    return np.exp(cumulative) @ initial_prices
+
+
+class MonteCarloRiskEngine:
+    def __init__(self, portfolio: pd.DataFrame, method: str = 'bootstrap', dof: float = 5):
+        """
+        Forward risk of a card portfolio by Monte Carlo simulation of the joint weekly log returns.
+
+        Args:
+            portfolio: Selected cards, e.g. the output of get_streamlit_database_markowitz
+                (columns 'last_price' and 'Card Info'), one copy of each card is held
+            method: 'bootstrap' (resampling of historical weeks), 'normal' or 't'
+                (multivariate normal / Student with the historical mean and covariance)
+            dof: Degrees of freedom of the Student distribution (> 2)
+        """
+        if method not in ('bootstrap', 'normal', 't'):
+            raise ValueError("method must be 'bootstrap', 'normal' or 't'")
+        if method == 't' and dof <= 2:
+            raise ValueError("The Student distribution needs more than 2 degrees of freedom")
+
+        self.method = method
+        self.dof = dof
+        self.initial_prices = portfolio['last_price'].values.astype(float)
+
+        cards = portfolio.assign(card_id=np.arange(len(portfolio)).astype(str))
+        prices, _ = get_price_panel(cards)
+        self.history = get_log_returns(prices).values
+        self.mean = self.history.mean(axis=0)
+
+        # Σ = L·Lᵀ through the eigen decomposition: works for singular covariances
+        covariance = np.atleast_2d(np.cov(self.history, rowvar=False))
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        self.factor = eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+
+    def simulate(self, horizon_weeks: int = 12, n_paths: int = 10000, batch_size: int = 20000,
+                 max_workers: int = None, seed: int = 42) -> np.ndarray:
+        """
+        Simulates the portfolio value at the horizon.
+
+        Args:
+            horizon_weeks: Horizon of the simulation
+            n_paths: Number of simulated paths
+            batch_size: Paths simulated at once, bounds the memory to batch_size x n_cards floats
+            max_workers: Processes used when there is more than one batch. Defaults to the number of cores.
+            seed: Seed of the random generator (each batch gets an independent child seed)
+
+        Returns:
+            np.ndarray: Simulated portfolio values (n_paths,)
+        """
+        sizes = [batch_size] * (n_paths // batch_size)
+        if n_paths % batch_size:
+            sizes.append(n_paths % batch_size)
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        args = [(self.method, self.mean, self.factor, self.history, self.initial_prices,
+                 horizon_weeks, size, self.dof, child) for size, child in zip(sizes, seeds)]
+
+        if len(args) == 1:
+            return _simulate_chunk(*args[0])
+
+        max_workers = min(max_workers or os.cpu_count(), len(args))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            values = list(executor.map(_simulate_chunk, *zip(*args)))
+        return np.concatenate(values)
+
+    def risk_report(self, horizon_weeks: int = 12, n_paths: int = 10000, confidence: float = 0.95,
+                    **simulation_kwargs) -> RiskReport:
+        """
+        VaR, CVaR and distribution of the portfolio value at the horizon.
+
+        Args:
+            horizon_weeks: Horizon of the simulation
+            n_paths: Number of simulated paths
+            confidence: Confidence level of the VaR and CVaR (e.g. 0.95)
+            **simulation_kwargs: batch_size, max_workers and seed, see simulate()
+
+        Returns:
+            RiskReport: Losses are expressed in $ (positive = loss)
+
+        Example:
+            >>> _, _, portfolio = markowitz.get_streamlit_database_markowitz()
+            >>> report = MonteCarloRiskEngine(portfolio).risk_report(horizon_weeks=12)
+            >>> print(f"95% VaR: {report.value_at_risk:.2f}$")
+        """
+        values = self.simulate(horizon_weeks, n_paths, **simulation_kwargs)
+        initial_value = float(self.initial_prices.sum())
+        losses = initial_value - values
+        value_at_risk = float(np.quantile(losses, confidence))
+
+        return RiskReport(
+            initial_value=round(initial_value, 2),
+            horizon_weeks=horizon_weeks,
+            confidence=confidence,
+            value_at_risk=round(value_at_risk, 2),
+            conditional_value_at_risk=round(float(losses[losses >= value_at_risk].mean()), 2),
+            expected_value=round(float(values.mean()), 2),
+            quantiles={q: round(float(np.quantile(values, q)), 2) for q in (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)},
+            values=values
+        )
@@ -0,0 +1,296 @@
+"""
+Local optimization service: the universe is loaded once and kept in memory, and several dashboards
+or batch jobs share the same warm engine over HTTP.
+
+Usage:
+    python optimization_service.py --port 8000
+
+Endpoints:
+    GET  /optimize?amount_to_invest=500&critical_sales_threshold=0.5&sales_volume_sensitivity=0.5
+    POST /optimize with the same parameters as a JSON body (also covariance_estimator, max_volume_fraction,
+         candidate_selection, allocator: 'markowitz' or 'hrp')
+    GET  /card/{card_id}/history   (a catalog id returns every variant of the card)
+    GET  /universe/stats
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+from markowitz_portfolio_optimizer import MarkowitzOptimizer
+from risk_parity import HierarchicalRiskParityOptimizer
+from streaming_estimator import StreamingCovarianceEstimator
+from useful_functions_for_models import get_dataframe_cards_matrix, get_data_version
+from shared_panel import SHARED_ROOT, get_shared_price_panel, get_shared_estimator, attach_price_panel
+from universe_table import load_universe_table
+from result_store import OptimizationResult, ResultStore
+from instrumentation import timed, increment
+
+REQUIRED = object()
+# Parameters accepted by /optimize, with their type and default value
+OPTIMIZE_PARAMETERS = {
+    'amount_to_invest': (float, REQUIRED),
+    'critical_sales_threshold': (float, 0.5),
+    'sales_volume_sensitivity': (float, 0.5),
+    'covariance_estimator': (str, 'sample'),
+    'max_volume_fraction': (float, None),
+    'candidate_selection': (str, 'clusters'),
+    'allocator': (str, 'markowitz')
+}
+ALLOCATORS = {'markowitz': MarkowitzOptimizer, 'hrp': HierarchicalRiskParityOptimizer}
+
+_worker_state = {}
+
+def _init_worker(cards_df, panel_directory, estimator_directory, data_version, folder_path, store_path):
+    # Workers receive the card statistics without the histories, and attach the price panel and the
+    # moments from shared memory maps: memory does not grow with the number of workers
+    _worker_state.update(cards_df=cards_df, price_panel=attach_price_panel(panel_directory),
+                         estimator=StreamingCovarianceEstimator.attach(estimator_directory),
+                         data_version=data_version, folder_path=folder_path,
+                         store=ResultStore(store_path) if store_path else None)
+
+
+def _solve(parameters: dict) -> OptimizationResult:
+    state = _worker_state
+    allocator = ALLOCATORS[parameters['allocator']]
+    optimizer = allocator(parameters['amount_to_invest'], parameters['critical_sales_threshold'],
+                          parameters['sales_volume_sensitivity'], dataframe_cards_info=state['cards_df'],
+                          estimator=state['estimator'], covariance_estimator=parameters['covariance_estimator'],
+                          max_volume_fraction=parameters['max_volume_fraction'],
+                          folder_path=state['folder_path'], data_version=state['data_version'],
+                          price_panel=state['price_panel'], candidate_selection=parameters['candidate_selection'])
+    return optimizer.solve(state['store'])
+
+
+class OptimizationEngine:
+    def __init__(self, folder_path: str = 'datas/price_history', catalog_path: str = 'datas/pokemon_cards.csv',
+                 max_workers: int = None, store_path: str = 'datas/optimizer_results.sqlite',
+                 shared_root: str = SHARED_ROOT):
+        """
+        Loads the universe, its price panel, its streaming moments and its catalog join once.
+        The panel and the moments are published as memory-mapped files that the workers attach.
+
+        Args:
+            folder_path: Price history folder
+            catalog_path: Card catalog
+            max_workers: Processes solving the optimizations. Defaults to the number of cores,
+                0 solves in the calling thread
+            store_path: Result store shared by the workers (None: no store)
+            shared_root: Folder of the published panels and moments (see shared_panel.py)
+        """
+        start = time.perf_counter()
+        self.folder_path = folder_path
+        self.cards_df, self.diagnostics = get_dataframe_cards_matrix(folder_path, return_diagnostics=True)
+        self.data_version = get_data_version(folder_path)
+        self.prices, self.volumes, panel_directory = get_shared_price_panel(self.cards_df, self.data_version, shared_root)
+        self.estimator, estimator_directory = get_shared_estimator(self.prices, panel_directory)
+        self.universe = load_universe_table(self.cards_df, folder_path, catalog_path, data_version=self.data_version)
+        self._positions = {card_id: i for i, card_id in enumerate(self.cards_df['card_id'])}
+        self._variants = self.universe.groupby('base_id', sort=False).indices
+
+        initargs = (self.cards_df.drop(columns=['Card Info']), panel_directory, estimator_directory,
+                    self.data_version, folder_path, store_path)
+        max_workers = os.cpu_count() if max_workers is None else max_workers
+        if max_workers > 0:
+            self._pool = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=initargs)
+        else:
+            self._pool = None
+            _init_worker(*initargs)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.loaded_at = datetime.now().isoformat(timespec='seconds')
+        self.load_seconds = round(time.perf_counter() - start, 3)
+
+    @staticmethod
+    def parse_parameters(raw: dict) -> dict:
+        """
+        Validates and completes the /optimize parameters.
+
+        Raises:
+            ValueError: Missing, unknown or malformed parameter
+        """
+        unknown = set(raw) - set(OPTIMIZE_PARAMETERS)
+        if unknown:
+            raise ValueError(f"Unknown parameters: {sorted(unknown)}")
+        parameters = {}
+        for name, (cast, default) in OPTIMIZE_PARAMETERS.items():
+            value = raw.get(name)
+            if value is None:
+                if default is REQUIRED:
+                    raise ValueError(f"{name} is required")
+                parameters[name] = default
+                continue
+            try:
+                parameters[name] = cast(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid value for {name}: {value!r}")
+        if parameters['allocator'] not in ALLOCATORS:
+            raise ValueError(f"Unknown allocator '{parameters['allocator']}', choose among {list(ALLOCATORS)}")
+        return parameters
+
+    @timed('service.optimize')
+    def optimize(self, raw_parameters: dict) -> dict:
+        """
+        Solves (or reuses) the optimization for the given parameters.
+
+        Identical requests received while a solve is running wait for that solve instead of starting
+        their own. Solves run on the process pool, results are shared through the result store.
+
+        Returns:
+            dict: total_investment, mean_return, solver_stats and the selected cards with their catalog
+                metadata and weight
+        """
+        parameters = self.parse_parameters(raw_parameters)
+        key = json.dumps(parameters, sort_keys=True)
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._pool.submit(_solve, parameters) if self._pool else Future()
+                self._in_flight[key] = future
+            else:
+                increment('service_coalesced_requests')
+
+        if owner and self._pool is None:
+            try:
+                future.set_result(_solve(parameters))
+            except Exception as e:
+                future.set_exception(e)
+        try:
+            result = future.result()
+        finally:
+            if owner:
+                with self._lock:
+                    self._in_flight.pop(key, None)
+
+        cards = self.universe.take(result.card_indices)[['card_id', 'name', 'rarity', 'collection', 'last_price', 'mean_return']]
+        cards = cards.assign(weight=result.weights, release_date=self.universe['release_date'].take(result.card_indices).dt.strftime('%Y/%m/%d').values)
+        return {
+            'parameters': parameters,
+            'data_version': self.data_version,
+            'total_investment': result.total_investment,
+            'mean_return': result.mean_return,
+            'solver_stats': result.solver_stats,
+            'cards': cards.astype(object).where(cards.notna(), None).to_dict(orient='records')
+        }
+
+    def card_history(self, card_id: str) -> dict:
+        """
+        Returns:
+            dict: {card_id: [weekly records]} for the card, or for every variant of a catalog id.
+                None if the card is unknown
+        """
+        if card_id in self._positions:
+            positions = [self._positions[card_id]]
+        elif card_id in self._variants:
+            positions = self._variants[card_id]
+        else:
+            return None
+        return {self.cards_df['card_id'].iat[i]: self.cards_df['Card Info'].iat[i].to_dict(orient='records')
+                for i in positions}
+
+    def universe_stats(self) -> dict:
+        valid = self.cards_df['valid'].values
+        return {
+            'data_version': self.data_version,
+            'loaded_at': self.loaded_at,
+            'load_seconds': self.load_seconds,
+            'n_cards': len(self.cards_df),
+            'n_valid_cards': int(valid.sum()),
+            'n_catalog_ids': len(self._variants),
+            'variants': self.universe['variant'].value_counts().to_dict(),
+            'n_weeks': len(self.prices),
+            'first_week': str(self.prices.index[0]) if len(self.prices) else None,
+            'last_week': str(self.prices.index[-1]) if len(self.prices) else None,
+            'median_last_price': float(np.median(self.cards_df['last_price'].values[valid])) if valid.any() else None,
+            'total_quantity_sold': int(self.cards_df['Quantity Sold'].sum()),
+            'loading_issues': self.diagnostics['issue'].value_counts().to_dict(),
+            'in_flight_requests': len(self._in_flight)
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+def make_server(engine: OptimizationEngine, host: str = '127.0.0.1', port: int = 8000) -> ThreadingHTTPServer:
+    """HTTP server of the engine (call serve_forever() to run it)"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, status, payload):
+            body = json.dumps(payload, default=lambda value: value.item() if hasattr(value, 'item') else str(value)).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def route(self, raw_parameters):
+            increment('service_requests')
+            url = urlparse(self.path)
+            parts = [part for part in url.path.split('/') if part]
+            try:
+                if parts == ['optimize']:
+                    if raw_parameters is None:
+                        raw_parameters = {name: values[-1] for name, values in parse_qs(url.query).items()}
+                    return self.send_json(200, engine.optimize(raw_parameters))
+                if len(parts) == 3 and parts[0] == 'card' and parts[2] == 'history':
+                    history = engine.card_history(parts[1])
+                    if history is None:
+                        return self.send_json(404, {'error': f"Unknown card {parts[1]}"})
+                    return self.send_json(200, history)
+                if parts == ['universe', 'stats']:
+                    return self.send_json(200, engine.universe_stats())
+                return self.send_json(404, {'error': f"Unknown endpoint {url.path}"})
+            except ValueError as e:
+                return self.send_json(400, {'error': str(e)})
+            except Exception as e:
+                return self.send_json(500, {'error': f"{type(e).__name__}: {e}"})
+
+        def do_GET(self):
+            self.route(None)
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                raw_parameters = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                return self.send_json(400, {'error': 'The body must be a JSON object'})
+            if not isinstance(raw_parameters, dict):
+                return self.send_json(400, {'error': 'The body must be a JSON object'})
+            self.route(raw_parameters)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--folder', default='datas/price_history', help='Price history folder')
+    parser.add_argument('--workers', type=int, help='Solver processes (default: number of cores, 0: in-process)')
+    parser.add_argument('--store', default='datas/optimizer_results.sqlite', help='Result store ("" to disable)')
+    args = parser.parse_args()
+
+    engine = OptimizationEngine(args.folder, max_workers=args.workers, store_path=args.store or None)
+    server = make_server(engine, args.host, args.port)
+    print(f"Universe of {len(engine.cards_df)} cards loaded in {engine.load_seconds}s, "
+          f"serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        engine.shutdown()
@@ -0,0 +1,215 @@
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+from dataclasses import dataclass
+from instrumentation import timed, increment
+
+PAGE_CACHE_ROOT = 'datas/page_cache'
+
+
+def get_compressor(level: int = None):
+    """
+    Returns:
+        tuple: (codec, compress). zstd if the zstandard package is installed, zlib otherwise
+    """
+    try:
+        import zstandard
+    except ImportError:
+        level = 6 if level is None else level
+        return 'zlib', lambda data: zlib.compress(data, level)
+    return 'zstd', zstandard.ZstdCompressor(level=10 if level is None else level).compress
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    """Decompresses an object written with the given codec (objects keep the codec they were written with)"""
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    import zstandard
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+@dataclass
+class CachedPage:
+    card_id: str
+    variant: str  # Card state of the page (e.g. "Holofoil")
+    fetched_at: datetime
+    digest: str  # sha1 of the raw page, name of the compressed object
+    url: str = None
+    complete: bool = False  # Stored by a fetch of every variant of the card page
+
+
+class PageCache:
+    """
+    On-disk cache of the raw scraped pages, so that the parsing can be re-run offline (see reparse_pages)
+    and recent fetches are not repeated.
+
+    Pages are indexed by (card_id, variant, fetch date) in SQLite and stored once per content
+    (content-addressed, compressed with zstd when available, zlib otherwise) in objects/. Beyond
+    max_bytes of compressed objects, the least recently used ones are evicted.
+
+    Example:
+        >>> cache = PageCache()
+        >>> cache.put('swsh6-207', 'Holofoil', html_content)
+        >>> pages = cache.get_card('swsh6-207', max_age=7 * 24 * 3600)  # {variant: CachedPage} fetched within a week
+        >>> html_content = cache.read(pages['Holofoil'])
+    """
+    def __init__(self, root: str = PAGE_CACHE_ROOT, max_bytes: int = 2 * 1024 ** 3, level: int = None):
+        """
+        Args:
+            root: Folder of the cache (index.sqlite and objects/)
+            max_bytes: Maximum size of the compressed objects
+            level: Compression level (defaults: 10 for zstd, 6 for zlib)
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.codec, self._compress = get_compressor(level)
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(root, 'index.sqlite'), check_same_thread=False,
+                                           isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                card_id TEXT NOT NULL,
+                variant TEXT NOT NULL,
+                fetch_date TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                digest TEXT NOT NULL,
+                url TEXT,
+                complete INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (card_id, variant, fetch_date)
+            )""")
+        if 'complete' not in [row[1] for row in self._connection.execute("PRAGMA table_info(pages)")]:
+            # Index created before the fetches of every variant were flagged
+            self._connection.execute("ALTER TABLE pages ADD COLUMN complete INTEGER NOT NULL DEFAULT 0")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS objects (
+                digest TEXT PRIMARY KEY,
+                codec TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                raw_size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )""")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS pages_digest ON pages (digest)")
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    @timed('page_cache.put')
+    def put(self, card_id: str, variant: str, content: str, fetched_at: datetime = None, url: str = None,
+            complete: bool = False) -> str:
+        """
+        Stores a raw page. A page with the same content is only stored once, and a second fetch of the
+        same card and variant on the same day replaces the first one.
+
+        Args:
+            complete: The page was fetched with every other variant of the card (see get_card)
+
+        Returns:
+            str: Digest of the page
+        """
+        fetched_at = fetched_at or datetime.now()
+        raw = content.encode('utf-8')
+        digest = hashlib.sha1(raw).hexdigest()
+        with self._lock:
+            known = self._connection.execute("SELECT 1 FROM objects WHERE digest = ?", (digest,)).fetchone()
+            if known is None:
+                compressed = self._compress(raw)
+                path = self._object_path(digest)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temporary = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+                with open(temporary, 'wb') as file:
+                    file.write(compressed)
+                os.replace(temporary, path)
+                self._connection.execute("INSERT INTO objects VALUES (?, ?, ?, ?, ?)",
+                                         (digest, self.codec, len(compressed), len(raw), time.time()))
+                increment('page_cache_bytes_written', len(compressed))
+            self._connection.execute(
+                "INSERT OR REPLACE INTO pages (card_id, variant, fetch_date, fetched_at, digest, url, complete) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", (card_id, variant, fetched_at.strftime('%Y-%m-%d'),
+                                                 fetched_at.timestamp(), digest, url, int(complete)))
+            self._evict()
+        return digest
+
+    def _evict(self):
+        orphans = [digest for digest, in self._connection.execute(
+            "SELECT digest FROM objects WHERE digest NOT IN (SELECT digest FROM pages)")]
+        total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+        if total > self.max_bytes:
+            for digest, size in self._connection.execute(
+                    "SELECT digest, size FROM objects ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                if digest not in orphans:
+                    orphans.append(digest)
+                    total -= size
+        for digest in orphans:
+            self._connection.execute("DELETE FROM pages WHERE digest = ?", (digest,))
+            self._connection.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+            try:
+                os.remove(self._object_path(digest))
+            except FileNotFoundError:
+                pass
+        increment('page_cache_evictions', len(orphans))
+
+    @timed('page_cache.read')
+    def read(self, page) -> str:
+        """Raw content of a CachedPage (or of a digest)"""
+        digest = page.digest if isinstance(page, CachedPage) else page
+        with self._lock:
+            row = self._connection.execute("SELECT codec FROM objects WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                raise KeyError(f"Page {digest} is not in the cache")
+            self._connection.execute("UPDATE objects SET last_access = ? WHERE digest = ?", (time.time(), digest))
+        with open(self._object_path(digest), 'rb') as file:
+            return decompress(row[0], file.read()).decode('utf-8')
+
+    def get_card(self, card_id: str, max_age: float = None) -> dict:
+        """
+        Args:
+            max_age: Freshness window in seconds, older fetches are ignored (None: any age)
+
+        Returns:
+            dict: {variant: CachedPage} of the latest fetch of every variant of the card. The cached
+                variants are every variant of the card only if all the pages are complete
+        """
+        oldest = 0 if max_age is None else time.time() - max_age
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT card_id, variant, fetched_at, digest, url, complete FROM pages WHERE card_id = ? "
+                "AND fetched_at >= ? ORDER BY fetched_at", (card_id, oldest)).fetchall()
+        pages = {row[1]: CachedPage(row[0], row[1], datetime.fromtimestamp(row[2]), row[3], row[4], bool(row[5]))
+                 for row in rows}
+        increment('page_cache_hits' if pages else 'page_cache_misses')
+        return pages
+
+    def pages(self, latest_only: bool = True) -> list:
+        """
+        Returns:
+            list: CachedPage of every cached fetch (only the latest one of each card and variant by
+                default), ordered by card_id and variant
+        """
+        query = "SELECT card_id, variant, fetched_at, digest, url, complete FROM pages"
+        if latest_only:
+            query += (" WHERE fetched_at = (SELECT MAX(fetched_at) FROM pages AS latest"
+                      " WHERE latest.card_id = pages.card_id AND latest.variant = pages.variant)")
+        with self._lock:
+            rows = self._connection.execute(query + " ORDER BY card_id, variant, fetched_at").fetchall()
+        return [CachedPage(card_id, variant, datetime.fromtimestamp(fetched_at), digest, url, bool(complete))
+                for card_id, variant, fetched_at, digest, url, complete in rows]
+
+    def size(self) -> int:
+        """Size of the compressed objects, in bytes"""
+        with self._lock:
+            return self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def close(self):
+        self._connection.close()
@@ -2,7 +2,9 @@ import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
+from instrumentation import timed
 
+@timed('plots.plot_analysis')
 def plot_analysis(portfolio):
     """Creates two interactive visualizations for Pokemon card portfolio analysis.
 
@@ -182,6 +184,7 @@ def plot_analysis(portfolio):
     return fig1, fig2
 
 
+@timed('plots.plot_pie')
 def plot_pie(portfolio):
     """
     Args:
@@ -247,3 +250,48 @@ Returns:
     )
 
     return fig
+
+
+@timed('plots.plot_value_distribution')
+def plot_value_distribution(report):
+    """
+    Args:
+    report (RiskReport): Monte Carlo risk report of the portfolio (see monte_carlo_risk.py)
+
+Returns:
+    plotly.graph_objects.Figure: Histogram of the simulated portfolio values at the horizon, with:
+        - The current portfolio value
+        - The VaR threshold (current value - VaR)
+    """
+    fig = go.Figure(data=[go.Histogram(
+        x=report.values,
+        nbinsx=100,
+        name='Simulated value',
+        marker_color='rgba(0, 183, 255, 0.6)'
+    )])
+
+    fig.add_vline(x=report.initial_value, line_dash="dash", line_color="white", opacity=0.7,
+                  annotation_text="Current value")
+    fig.add_vline(x=report.initial_value - report.value_at_risk, line_dash="dash", line_color="red", opacity=0.7,
+                  annotation_text=f"VaR {report.confidence:.0%}")
+
+    fig.update_layout(
+        title={
+            'text': f'Portfolio Value in {report.horizon_weeks} Weeks 🎲',
+            'y': 0.95,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',
+            'font': dict(family='Courier New', size=18, color='white')
+        },
+        paper_bgcolor='rgb(13, 13, 13)',
+        plot_bgcolor='rgb(13, 13, 13)',
+        font=dict(family='Courier New', size=10, color='white'),
+        height=500,
+        showlegend=False,
+        xaxis=dict(title='Portfolio value ($)', showgrid=True, gridwidth=0.3, gridcolor='rgba(255, 255, 255, 0.03)'),
+        yaxis=dict(title='Number of paths', showgrid=True, gridwidth=0.3, gridcolor='rgba(255, 255, 255, 0.03)'),
+        margin=dict(t=80, l=60, r=60, b=50)
+    )
+
+    return fig
@@ -1,9 +1,16 @@
 import requests
 from bs4 import BeautifulSoup
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import os
+import pickle
 from tqdm import tqdm
+from instrumentation import timed, increment
+from page_cache import get_compressor, decompress
+
+SNAPSHOT_ROOT = 'datas/catalog_snapshots'
+SNAPSHOT_FORMAT = '%Y%m%d_%H%M%S_%f'
 
 class PokemonCardAPI:
     def __init__(self, api_url="https://api.pokemontcg.io/v2/cards"):
@@ -20,6 +27,7 @@ class PokemonCardAPI:
             "reverse_holofoil_price", "release_date", "nationalPokedexNumbers", "artist", "images_url"
         ]
 
+    @timed('catalog.import_data')
     def import_data(self):
         """
         Retrieves all available cards from the Pokemon TCG API.
@@ -35,12 +43,14 @@ class PokemonCardAPI:
         page = 1
         all_cards = []
         
+        increment('http_requests')
         response = requests.get(self.api_url, params={"page": 1, "pageSize": 250})
         total_count = response.json()["totalCount"]
         total_pages = (total_count + 249) // 250
         
         for page in tqdm(range(1, total_pages + 1), desc="Importing cards"):
             params = {"page": page, "pageSize": 250}
+            increment('http_requests')
             response = requests.get(self.api_url, params=params)
             if response.status_code == 200:
                 data = response.json()["data"]
@@ -77,6 +87,7 @@ class PokemonCardAPI:
             return card["tcgplayer"].get("url", None), holofoil_price, reverse_holofoil_price
         return None, None, None
 
+    @timed('catalog.filter_cards')
     def filter_cards(self, df, threshold=5):
         """
         Cleans and filters card data based on rarity and price.
@@ -124,12 +135,171 @@ class PokemonCardAPI:
         return df_cleaned[self.columns_order]
 
 
+def get_catalog_delta(previous: pd.DataFrame, current: pd.DataFrame, key: str = 'id') -> dict:
+    """
+    Column-wise difference between two states of the catalog.
+
+    Returns:
+        dict: {'columns': column order, 'removed': removed keys, 'added': rows of the new cards,
+            'changes': {column: (keys, new values)} of the changed cells of the other cards,
+            'order': keys in order, only if the order is not the previous one minus the removed cards
+            plus the added ones (None otherwise)}
+    """
+    previous_rows, current_rows = previous.set_index(key), current.set_index(key)
+    kept = previous_rows.index.isin(current_rows.index)
+    added = current[~current[key].isin(previous_rows.index)]
+    common = current_rows.index[current_rows.index.isin(previous_rows.index)]
+
+    changes = {}
+    for column in current_rows.columns:
+        new = current_rows.loc[common, column].astype(object).values
+        if column in previous_rows.columns:
+            old = previous_rows.loc[common, column].astype(object).values
+            differs = ~((old == new) | (pd.isna(old) & pd.isna(new)))
+        else:
+            differs = np.ones(len(common), dtype=bool)
+        if differs.any():
+            changes[column] = (common.values[differs], new[differs])
+
+    expected = np.concatenate([previous_rows.index.values[kept], added[key].values])
+    order = None if np.array_equal(expected, current[key].values) else current[key].values
+    return {'columns': list(current.columns), 'removed': previous_rows.index.values[~kept], 'added': added,
+            'changes': changes, 'order': order}
+
+
+def apply_catalog_delta(previous: pd.DataFrame, delta: dict, key: str = 'id') -> pd.DataFrame:
+    """Catalog state obtained by applying a get_catalog_delta() result to the previous state"""
+    rows = previous.set_index(key).drop(index=delta['removed'])
+    for column, (keys, values) in delta['changes'].items():
+        update = pd.Series(values, index=keys, dtype=object).reindex(rows.index)
+        changed = rows.index.isin(keys)
+        if column in rows.columns:
+            rows[column] = rows[column].where(~changed, update)
+        else:
+            rows[column] = update
+    rows = pd.concat([rows, delta['added'].set_index(key)])
+    if delta['order'] is not None:
+        rows = rows.loc[delta['order']]
+    current = rows.reset_index()[delta['columns']]
+    # Columns come back as object after the cell updates: restore the types inferred by a CSV read
+    return current.infer_objects()
+
+
+class CatalogSnapshots:
+    """
+    Timestamped snapshots of the card catalog, so that older states can be read back without keeping
+    full copies: each snapshot is stored as the column-wise difference with the previous one (see
+    get_catalog_delta), pickled and compressed (zstd when available, zlib otherwise). A full snapshot is
+    written every full_every snapshots, which bounds the number of deltas replayed by a read.
+
+    Files are named {timestamp}.full or {timestamp}.delta, timestamps sort chronologically.
+
+    Example:
+        >>> snapshots = CatalogSnapshots()
+        >>> snapshots.save(df)
+        >>> previous_df = snapshots.load(datetime(2024, 3, 2))  # Catalog as of March 2nd 2024
+    """
+    def __init__(self, directory: str = SNAPSHOT_ROOT, key: str = 'id', full_every: int = 50):
+        """
+        Args:
+            directory: Folder of the snapshots
+            key: Column identifying a card, it must be unique
+            full_every: Number of snapshots between two full ones
+        """
+        self.directory = directory
+        self.key = key
+        self.full_every = full_every
+        self.codec, self._compress = get_compressor()
+
+    def list(self) -> list:
+        """
+        Returns:
+            list: Timestamps of the snapshots, oldest first
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(os.path.splitext(name)[0] for name in os.listdir(self.directory)
+                      if name.endswith(('.full', '.delta')))
+
+    def _path(self, timestamp: str) -> str:
+        full_path = os.path.join(self.directory, f'{timestamp}.full')
+        return full_path if os.path.exists(full_path) else os.path.join(self.directory, f'{timestamp}.delta')
+
+    def _read(self, timestamp: str):
+        with open(self._path(timestamp), 'rb') as file:
+            codec, data = file.read().split(b'\n', 1)
+        return pickle.loads(decompress(codec.decode(), data))
+
+    def _write(self, path: str, payload):
+        data = self.codec.encode() + b'\n' + self._compress(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+        temporary = f'{path}.tmp-{os.getpid()}'
+        with open(temporary, 'wb') as file:
+            file.write(data)
+        os.replace(temporary, path)
+        increment('catalog_snapshot_bytes_written', len(data))
+
+    @timed('catalog.load_snapshot')
+    def load(self, timestamp=None) -> pd.DataFrame:
+        """
+        Args:
+            timestamp: Timestamp of a snapshot (see list) or datetime, the latest snapshot taken at or
+                before it is read. The latest snapshot by default
+
+        Returns:
+            pd.DataFrame: Catalog as it was saved
+
+        Raises:
+            FileNotFoundError: No snapshot was taken at or before timestamp
+        """
+        timestamps = self.list()
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.strftime(SNAPSHOT_FORMAT)
+        if timestamp is not None:
+            timestamps = [name for name in timestamps if name <= timestamp]
+        full = [position for position, name in enumerate(timestamps) if self._path(name).endswith('.full')]
+        if not full:
+            raise FileNotFoundError(f"No catalog snapshot in {self.directory} at or before {timestamp}")
+
+        df = self._read(timestamps[full[-1]])
+        for name in timestamps[full[-1] + 1:]:
+            df = apply_catalog_delta(df, self._read(name), self.key)
+        return df
+
+    @timed('catalog.save_snapshot')
+    def save(self, df: pd.DataFrame, timestamp: datetime = None) -> str:
+        """
+        Takes a snapshot of the catalog: a delta against the previous snapshot, or a full copy for the
+        first one, every full_every snapshots, or if the key is not unique.
+
+        Returns:
+            str: Path of the snapshot
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        timestamps = self.list()
+        name = (timestamp or datetime.now()).strftime(SNAPSHOT_FORMAT)
+        since_full = 0
+        for previous in reversed(timestamps):
+            if self._path(previous).endswith('.full'):
+                break
+            since_full += 1
+
+        if timestamps and since_full + 1 < self.full_every and df[self.key].is_unique:
+            path = os.path.join(self.directory, f'{name}.delta')
+            self._write(path, get_catalog_delta(self.load(), df, self.key))
+        else:
+            path = os.path.join(self.directory, f'{name}.full')
+            self._write(path, df)
+        return path
+
+
 class PokemonCardDatabase:
     """Class to handle Pokemon card database operations"""
     def __init__(self, api_handler: PokemonCardAPI):
         self.api_handler = api_handler
         self.data_dir = 'datas' 
+        self.snapshots = CatalogSnapshots(os.path.join(self.data_dir, 'catalog_snapshots'))
 
+    @timed('catalog.update_database')
     def update_database(self, csv_filename='pokemon_cards.csv', popularity_csv_filemane="pokemon_data_popularity.csv"):
         """
     Creates or updates the Pokemon cards CSV file with current market prices.
@@ -139,7 +309,7 @@ class PokemonCardDatabase:
     2. Cleans and filters the data based on rarity and price thresholds
     3. Updates prices for existing cards
     4. Adds new cards to the database
-    5. Saves both a main file and a timestamped backup
+    5. Saves the main file atomically and a timestamped snapshot (see CatalogSnapshots)
     
     Args:
         csv_path (str, optional): Path to the main CSV file. 
@@ -165,7 +335,7 @@ class PokemonCardDatabase:
         >>> df = update_pokemon_cardsultimate()
         Base de données mise à jour : 3955 cartes
         Fichier principal : pokemon_cards.csv
-        Copie de sauvegarde : pokemon_cards_20240302_1430.csv
+        >>> previous_df = CatalogSnapshots().load(datetime(2024, 3, 2))  # Catalog before the update
     """
         csv_path = os.path.join(self.data_dir, csv_filename)
         popularity_csv_path = os.path.join(self.data_dir, popularity_csv_filemane)
@@ -202,18 +372,22 @@ class PokemonCardDatabase:
             return None
         
         
+    @timed('catalog.save_database')
     def save_database(self, df, csv_path):
-        """Saves the database"""
-        if os.path.exists(csv_path):
-            os.remove(csv_path)
-        backup_path = os.path.join(self.data_dir, 'pokemon_cards.csv')
-        
-        for file_path in tqdm([csv_path, backup_path], desc="Saving files"):
-            df.to_csv(file_path, index=False, encoding='utf-8', float_format='%.2f')
-
-
+        """
+        Saves the database: written to a temporary file renamed over csv_path, so an interrupted save
+        never leaves a partial catalog, then snapshotted (see CatalogSnapshots)
 
+        Returns:
+            str: Path of the snapshot
+        """
+        temporary = f"{csv_path}.tmp-{os.getpid()}"
+        df.to_csv(temporary, index=False, encoding='utf-8', float_format='%.2f')
+        os.replace(temporary, csv_path)
+        # The snapshot is the catalog as saved (prices rounded by float_format, types of a CSV read)
+        return self.snapshots.save(pd.read_csv(csv_path))
 
+    @timed('catalog.add_popularity_rank')
     def add_popularity_rank(self, df, popularity_csv):
             """
             Adds a popularity rank column to the Pokémon card DataFrame based on external popularity data.
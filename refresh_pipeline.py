@@ -0,0 +1,346 @@
+"""
+Refresh pipeline: the catalog update, the price scraping and every derived artifact (card statistics,
+universe table, shared panel and moments, cold tier) are stages with declared inputs and outputs.
+A stage only runs when the content of one of its inputs changed since its last successful run,
+independent stages run in parallel, and the time of every stage is reported.
+
+Usage:
+    python refresh_pipeline.py                    # Recomputes what the files on disk invalidate
+    python refresh_pipeline.py --scrape           # Also updates the catalog and scrapes the new price histories
+    python refresh_pipeline.py --stages universe_table --force
+"""
+import os
+import json
+import time
+import pickle
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import pandas as pd
+from useful_functions_for_models import _load_chunk, split_card_id, get_data_version, get_dataframe_cards_matrix
+from card_catalog import CATALOG_PATH, load_card_catalog
+from instrumentation import record_time
+
+FOLDER_PATH = 'datas/price_history'
+POPULARITY_PATH = 'datas/pokemon_data_popularity.csv'
+STATISTICS_PATH = 'datas/card_statistics.pkl'
+UNIVERSE_TABLE_PATH = 'datas/universe_table.pkl'
+MANIFEST_PATH = 'datas/refresh_manifest.json'
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_input(path: str) -> Dict[str, str]:
+    """
+    Content hashes of an input.
+
+    Returns:
+        dict: {path relative to the input: sha1} for every file of a directory, {'': sha1} for a
+            file, empty if the input does not exist
+    """
+    if os.path.isfile(path):
+        return {'': hash_file(path)}
+    hashes = {}
+    for root, _, files in os.walk(path):
+        for file in files:
+            file_path = os.path.join(root, file)
+            hashes[os.path.relpath(file_path, path)] = hash_file(file_path)
+    return dict(sorted(hashes.items()))
+
+
+@dataclass
+class StageContext:
+    # {input: (added or modified files, removed files)} since the last successful run, relative to the input
+    changes: Dict[str, Tuple[List[str], List[str]]]
+    full: bool  # First run or forced: everything must be recomputed
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[[StageContext], str]  # Returns a short description of what was done
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+    external: bool = False  # Reads a remote source (API, website): only run on request, and then always run
+
+
+@dataclass
+class StageReport:
+    name: str
+    status: str  # 'ran', 'up to date', 'failed' or 'blocked'
+    seconds: float = 0.0
+    detail: str = ''
+
+
+class RefreshPipeline:
+    def __init__(self, stages: List[Stage], manifest_path: str = MANIFEST_PATH, max_workers: int = None):
+        """
+        Args:
+            stages: Stages of the pipeline. A stage depends on the stages producing one of its inputs
+            manifest_path: JSON file of the input hashes of the last successful run of every stage
+            max_workers: Stages running at the same time (defaults to the number of cores)
+
+        Raises:
+            ValueError: Duplicate stage names or cyclic dependencies
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Stage names must be unique")
+        self.dependencies = {stage.name: {other.name for other in stages
+                                          if other is not stage and set(other.outputs) & set(stage.inputs)}
+                             for stage in stages}
+        self.order = self._topological_order()
+        self.manifest_path = manifest_path
+        self.max_workers = max_workers or os.cpu_count()
+        self._lock = threading.Lock()
+        self._hashes = {}
+        self.manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as file:
+                self.manifest = json.load(file)
+
+    def _topological_order(self):
+        order, visiting, visited = [], set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Cyclic dependency through stage '{name}'")
+            visiting.add(name)
+            for dependency in sorted(self.dependencies[name]):
+                visit(dependency)
+            visiting.discard(name)
+            visited.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def downstream(self, names) -> List[str]:
+        """The given stages and every stage depending on them, in execution order"""
+        selected = set(names)
+        for name in self.order:
+            if self.dependencies[name] & selected:
+                selected.add(name)
+        return [name for name in self.order if name in selected]
+
+    def _hash(self, path):
+        # Hashed once per run, forgotten when a stage rewrites the path
+        with self._lock:
+            if path not in self._hashes:
+                self._hashes[path] = hash_input(path)
+            return self._hashes[path]
+
+    def _save_manifest(self):
+        directory = os.path.dirname(self.manifest_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.manifest_path}.tmp-{os.getpid()}"
+        with open(temporary, 'w') as file:
+            json.dump(self.manifest, file)
+        os.replace(temporary, self.manifest_path)
+
+    def _run_stage(self, stage: Stage, force: bool) -> StageReport:
+        start = time.perf_counter()
+        hashes = {path: self._hash(path) for path in stage.inputs}
+        previous = self.manifest.get(stage.name)
+        # A remote source can change without any local input changing: external stages are never up to date,
+        # the stages downstream are still gated by the content hashes of their outputs
+        if (not force and not stage.external and previous is not None and previous['inputs'] == hashes
+                and all(os.path.exists(path) for path in stage.outputs)):
+            return StageReport(stage.name, 'up to date', time.perf_counter() - start)
+
+        changes = {}
+        for path, current in hashes.items():
+            before = previous['inputs'].get(path, {}) if previous else {}
+            changes[path] = ([name for name, digest in current.items() if before.get(name) != digest],
+                             [name for name in before if name not in current])
+        try:
+            detail = stage.run(StageContext(changes, full=force or previous is None))
+        except Exception as e:
+            return StageReport(stage.name, 'failed', time.perf_counter() - start, f"{type(e).__name__}: {e}")
+
+        seconds = time.perf_counter() - start
+        record_time(f'refresh.{stage.name}', seconds)
+        with self._lock:
+            for path in stage.outputs:
+                self._hashes.pop(path, None)
+            self.manifest[stage.name] = {'inputs': hashes, 'completed_at': datetime.now().isoformat(timespec='seconds'),
+                                         'seconds': round(seconds, 3)}
+            self._save_manifest()
+        return StageReport(stage.name, 'ran', seconds, detail or '')
+
+    def run(self, names: List[str] = None, force: bool = False, include_external: bool = False) -> List[StageReport]:
+        """
+        Runs the stages whose inputs changed, each one as soon as the stages it depends on are done.
+
+        Args:
+            names: Stages to consider, with everything downstream of them (default: every stage)
+            force: Run the stages even if their inputs did not change
+            include_external: Also run the stages reading a remote source (catalog API, price website),
+                whether or not their inputs changed. Otherwise their outputs are taken as they are on disk
+
+        Returns:
+            list: StageReport of every considered stage, in execution order. The stages depending on
+                a failed stage are 'blocked'
+        """
+        selected = self.downstream(names) if names else list(self.order)
+        if not include_external:
+            selected = [name for name in selected if not self.stages[name].external]
+        self._hashes = {}
+        pending, running, reports = list(selected), {}, {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name in list(pending):
+                    dependencies = self.dependencies[name] & set(selected)
+                    if not dependencies <= set(reports):
+                        continue
+                    pending.remove(name)
+                    if any(reports[dependency].status in ('failed', 'blocked') for dependency in dependencies):
+                        reports[name] = StageReport(name, 'blocked')
+                    else:
+                        running[executor.submit(self._run_stage, self.stages[name], force)] = name
+                if running:
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        reports[running.pop(future)] = future.result()
+        return [reports[name] for name in selected]
+
+
+def load_card_statistics(path: str = STATISTICS_PATH) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Returns:
+        tuple: (statistics, diagnostics) written by the card_statistics stage: statistics has the
+            columns of get_dataframe_cards_matrix() without 'Card Info', plus 'path'
+    """
+    with open(path, 'rb') as file:
+        return pickle.load(file)
+
+
+def refresh_catalog(context: StageContext) -> str:
+    from pokemon_card_manager import PokemonCardAPI, PokemonCardDatabase
+
+    catalog = PokemonCardDatabase(PokemonCardAPI()).update_database()
+    if catalog is None:
+        raise RuntimeError("The catalog update failed")
+    return f"{len(catalog)} cards"
+
+
+def refresh_price_history(context: StageContext) -> str:
+    from get_historic_card_prices import save_historic_prices
+
+    before = len(hash_input(FOLDER_PATH))
+    # Cards that already have a price history are skipped: only the new cards are scraped
+    save_historic_prices(pd.read_csv(CATALOG_PATH), FOLDER_PATH)
+    return f"{len(hash_input(FOLDER_PATH)) - before} new price histories"
+
+
+def refresh_catalog_cache(context: StageContext) -> str:
+    return f"{len(load_card_catalog(CATALOG_PATH))} cards"
+
+
+def refresh_card_statistics(context: StageContext) -> str:
+    """Per card: only the added or modified price histories are read again"""
+    changed, removed = context.changes[FOLDER_PATH]
+    paths = [os.path.join(root, file) for root, _, files in os.walk(FOLDER_PATH) for file in files if file.endswith('.csv')]
+    if context.full or not os.path.exists(STATISTICS_PATH):
+        to_read = paths
+        statistics, diagnostics = pd.DataFrame(), pd.DataFrame(columns=['card_id', 'path', 'issue', 'detail'])
+    else:
+        to_read = [os.path.join(FOLDER_PATH, name) for name in changed if name.endswith('.csv')]
+        stale = set(to_read) | {os.path.join(FOLDER_PATH, name) for name in removed}
+        statistics, diagnostics = load_card_statistics()
+        statistics = statistics[~statistics['path'].isin(stale)]
+        diagnostics = diagnostics[~diagnostics['path'].isin(stale)]
+
+    columns, new_diagnostics = _load_chunk(to_read)
+    card_paths = {os.path.basename(path)[:-len('.csv')]: path for path in to_read}
+    new = pd.DataFrame(columns).drop(columns=['Card Info'])
+    new['valid'] = new['valid'].astype(bool)
+    new[['base_id', 'variant']] = pd.DataFrame([split_card_id(card_id) for card_id in new['card_id']],
+                                               index=new.index, columns=['base_id', 'variant'])
+    new['path'] = new['card_id'].map(card_paths)
+
+    # Same order as get_dataframe_cards_matrix (file walk), so that the universe table matches it
+    position = {path: i for i, path in enumerate(paths)}
+    statistics = pd.concat([statistics, new], ignore_index=True)
+    statistics = statistics.iloc[statistics['path'].map(position).values.argsort(kind='stable')].reset_index(drop=True)
+    diagnostics = pd.concat([diagnostics, pd.DataFrame(new_diagnostics, columns=diagnostics.columns)], ignore_index=True)
+
+    temporary = f"{STATISTICS_PATH}.tmp-{os.getpid()}"
+    with open(temporary, 'wb') as file:
+        pickle.dump((statistics, diagnostics), file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, STATISTICS_PATH)
+    return f"{len(to_read)} cards read, {len(removed)} removed, {len(statistics)} cards"
+
+
+def refresh_universe_table(context: StageContext) -> str:
+    from universe_table import load_universe_table
+
+    statistics, _ = load_card_statistics()
+    table = load_universe_table(statistics, FOLDER_PATH, CATALOG_PATH, UNIVERSE_TABLE_PATH)
+    return f"{len(table)} cards, {int(table['name'].notna().sum())} in the catalog"
+
+
+def refresh_shared_panel(context: StageContext) -> str:
+    from shared_panel import get_shared_price_panel, get_shared_estimator
+
+    cards_df, _ = get_dataframe_cards_matrix(FOLDER_PATH, return_diagnostics=True)
+    prices, _, directory = get_shared_price_panel(cards_df, get_data_version(FOLDER_PATH))
+    get_shared_estimator(prices, directory)
+    return f"{prices.shape[1]} cards x {prices.shape[0]} weeks"
+
+
+def refresh_cold_tier(context: StageContext) -> str:
+    from tiered_universe import TIER_ROOT, build_tiers
+
+    directory = os.path.join(TIER_ROOT, get_data_version(FOLDER_PATH))
+    if os.path.exists(os.path.join(directory, 'summary.pkl')):
+        return 'already built for this data version'
+    summary, _, hot = build_tiers(FOLDER_PATH, directory)
+    return f"{len(hot)} hot / {len(summary) - len(hot)} cold cards"
+
+
+STAGES = [
+    Stage('catalog', refresh_catalog, inputs=(POPULARITY_PATH,), outputs=(CATALOG_PATH,), external=True),
+    Stage('price_history', refresh_price_history, inputs=(CATALOG_PATH,), outputs=(FOLDER_PATH,), external=True),
+    Stage('catalog_cache', refresh_catalog_cache, inputs=(CATALOG_PATH,), outputs=('datas/pokemon_cards.pkl',)),
+    Stage('card_statistics', refresh_card_statistics, inputs=(FOLDER_PATH,), outputs=(STATISTICS_PATH,)),
+    Stage('universe_table', refresh_universe_table, inputs=(STATISTICS_PATH, CATALOG_PATH), outputs=(UNIVERSE_TABLE_PATH,)),
+    Stage('shared_panel', refresh_shared_panel, inputs=(FOLDER_PATH,), outputs=('datas/shared_panel',)),
+    Stage('cold_tier', refresh_cold_tier, inputs=(FOLDER_PATH,), outputs=('datas/cold_tier',)),
+]
+
+
+def print_report(reports: List[StageReport]):
+    for report in reports:
+        print(f"{report.name:<16} {report.status:<11} {report.seconds:>8.2f}s  {report.detail}")
+    print(f"{'total':<16} {'':<11} {sum(report.seconds for report in reports):>8.2f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stages', nargs='+', choices=[stage.name for stage in STAGES],
+                        help='Stages to run, with everything downstream of them (default: all)')
+    parser.add_argument('--scrape', action='store_true', help='Also run the catalog update and the price scraping')
+    parser.add_argument('--force', action='store_true', help='Run the stages even if their inputs did not change')
+    parser.add_argument('--workers', type=int, help='Stages running at the same time')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    reports = RefreshPipeline(STAGES, max_workers=args.workers).run(args.stages, args.force, args.scrape)
+    print_report(reports)
+    print(f"Wall time {time.perf_counter() - start:.2f}s")
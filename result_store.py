@@ -0,0 +1,150 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from dataclasses import dataclass, field
+from instrumentation import timed, increment
+
+
+@dataclass
+class OptimizationResult:
+    """Output of MarkowitzOptimizer.solve()"""
+    card_indices: np.ndarray  # Integer indices of the selected cards in the universe
+    weights: np.ndarray  # Optimal (continuous) weights of the selected cards
+    total_investment: float
+    mean_return: float
+    solver_stats: dict = field(default_factory=dict)  # Candidates, iterations, evaluations, success, duration
+
+
+class ResultStore:
+    """
+    SQLite store of the optimizer results, keyed by a hash of the parameters and of the data version.
+
+    Every result is kept with its parameters and creation date, so that the history of the results
+    can be audited (see history()). Expired entries are dropped on lookup and the least recently
+    used entries are evicted beyond max_entries.
+
+    Example:
+        >>> store = ResultStore()
+        >>> result = MarkowitzOptimizer(500, 0.5, 0.5).solve(store)  # Computed and stored
+        >>> result = MarkowitzOptimizer(500, 0.5, 0.5).solve(store)  # Read from the store
+    """
+    def __init__(self, path: str = 'datas/optimizer_results.sqlite', ttl: float = 7 * 24 * 3600,
+                 max_entries: int = 10000):
+        """
+        Args:
+            path: SQLite file (':memory:' for a store that is not persisted)
+            ttl: Lifetime of an entry in seconds (None: no expiry)
+            max_entries: Maximum number of entries kept
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._memory = {}
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                data_version TEXT NOT NULL,
+                parameters TEXT NOT NULL,
+                card_indices BLOB NOT NULL,
+                weights BLOB NOT NULL,
+                total_investment REAL NOT NULL,
+                mean_return REAL NOT NULL,
+                solver_stats TEXT NOT NULL
+            )""")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+
+    @staticmethod
+    def make_key(parameters: dict, data_version: str) -> str:
+        """Hash of the parameters (order independent) and of the data version"""
+        payload = json.dumps(parameters, sort_keys=True, default=str) + '|' + data_version
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def _is_expired(self, created_at, now):
+        return self.ttl is not None and now - created_at > self.ttl
+
+    @timed('result_store.get')
+    def get(self, parameters: dict, data_version: str) -> OptimizationResult:
+        """
+        Returns:
+            OptimizationResult: Stored result, None if absent or expired
+        """
+        key = self.make_key(parameters, data_version)
+        now = time.time()
+        with self._lock:
+            if key in self._memory:
+                created_at, result = self._memory[key]
+                if not self._is_expired(created_at, now):
+                    increment('result_store_hits')
+                    return result
+                del self._memory[key]
+
+            row = self._connection.execute(
+                "SELECT created_at, card_indices, weights, total_investment, mean_return, solver_stats "
+                "FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None or self._is_expired(row[0], now):
+                if row is not None:
+                    self._connection.execute("DELETE FROM results WHERE key = ?", (key,))
+                increment('result_store_misses')
+                return None
+
+            self._connection.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+            result = OptimizationResult(np.frombuffer(row[1], dtype=np.int64), np.frombuffer(row[2], dtype=np.float64),
+                                        row[3], row[4], json.loads(row[5]))
+            self._memory[key] = (row[0], result)
+            increment('result_store_hits')
+            return result
+
+    @timed('result_store.put')
+    def put(self, parameters: dict, data_version: str, result: OptimizationResult):
+        """Stores a result, replacing the previous one with the same key, then applies the size limit"""
+        key = self.make_key(parameters, data_version)
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, now, now, data_version, json.dumps(parameters, sort_keys=True, default=str),
+                 np.asarray(result.card_indices, dtype=np.int64).tobytes(),
+                 np.asarray(result.weights, dtype=np.float64).tobytes(),
+                 float(result.total_investment), float(result.mean_return),
+                 json.dumps(result.solver_stats, default=float)))
+            self._memory[key] = (now, result)
+            self._evict()
+
+    def _evict(self):
+        count = self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            keys = [key for key, in self._connection.execute(
+                "SELECT key FROM results ORDER BY last_access LIMIT ?", (count - self.max_entries,))]
+            self._connection.executemany("DELETE FROM results WHERE key = ?", [(key,) for key in keys])
+            for key in keys:
+                self._memory.pop(key, None)
+        if self.ttl is not None:
+            self._connection.execute("DELETE FROM results WHERE created_at < ?", (time.time() - self.ttl,))
+
+    def history(self):
+        """
+        Returns:
+            list: (created_at, data_version, parameters, total_investment, mean_return, solver_stats)
+                of every stored result, oldest first
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT created_at, data_version, parameters, total_investment, mean_return, solver_stats "
+                "FROM results ORDER BY created_at").fetchall()
+        return [(created_at, version, json.loads(parameters), total, mean, json.loads(stats))
+                for created_at, version, parameters, total, mean, stats in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        self._connection.close()
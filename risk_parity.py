@@ -0,0 +1,130 @@
+import numpy as np
+from markowitz_portfolio_optimizer import MarkowitzOptimizer
+from covariance_estimators import FactorCovariance
+from useful_functions_for_models import correlation_distance
+from liquidity import get_position_limits
+from instrumentation import timed
+
+
+def get_cluster_variance(covariance: np.ndarray, variances: np.ndarray, start: int, end: int) -> float:
+    """Variance of the inverse-variance portfolio of the cards start:end (contiguous in the clustering order)"""
+    weights = 1 / variances[start:end]
+    weights /= weights.sum()
+    return weights @ covariance[start:end, start:end] @ weights
+
+
+@timed('risk_parity.hrp_weights')
+def hrp_weights(covariance, return_info: bool = False):
+    """
+    Hierarchical risk parity (López de Prado): the cards are ordered by a single linkage clustering of
+    their correlation distance, then the weight is split recursively between the two halves of each
+    cluster in inverse proportion to their variance. No matrix is inverted, so a singular covariance
+    (more cards than weeks) is not an issue, and the cost is O(n² log n).
+
+    Args:
+        covariance: Covariance matrix of the candidate cards (n x n), dense or FactorCovariance
+        return_info: Also return the allocation statistics
+
+    Returns:
+        np.ndarray: Long-only weights summing to 1. Cards with a zero variance are given the smallest
+            positive variance. With return_info, (weights, {'iterations', 'evaluations', 'success', 'message'})
+    """
+    from scipy.cluster.hierarchy import linkage, leaves_list
+    from scipy.spatial.distance import squareform
+
+    if isinstance(covariance, FactorCovariance):
+        covariance = covariance.to_dense()
+    covariance = np.asarray(covariance, dtype=np.float64)
+    n_cards = len(covariance)
+    weights = np.ones(n_cards)
+    levels = 0
+    if n_cards > 1:
+        variances = np.diag(covariance).copy()
+        positive = variances > 0
+        variances[~positive] = variances[positive].min() if positive.any() else 1.0
+
+        order = leaves_list(linkage(squareform(correlation_distance(covariance), checks=False), method='single'))
+        # Reordered once: every cluster of the bisection is then a contiguous block (views, no copies)
+        covariance, variances = covariance[np.ix_(order, order)], variances[order]
+        ordered_weights = np.ones(n_cards)
+        clusters = [(0, n_cards)]
+        while clusters:
+            levels += 1
+            bisected = []
+            for start, end in clusters:
+                middle = (start + end) // 2
+                left_variance = get_cluster_variance(covariance, variances, start, middle)
+                right_variance = get_cluster_variance(covariance, variances, middle, end)
+                total = left_variance + right_variance
+                alpha = 1 - left_variance / total if total > 0 else 0.5
+                ordered_weights[start:middle] *= alpha
+                ordered_weights[middle:end] *= 1 - alpha
+                bisected += [(a, b) for a, b in ((start, middle), (middle, end)) if b - a > 1]
+            clusters = bisected
+        weights[order] = ordered_weights
+    weights /= weights.sum()
+    if return_info:
+        return weights, {'iterations': levels, 'evaluations': 0, 'success': True,
+                         'message': 'Hierarchical risk parity'}
+    return weights
+
+
+def cap_weights(weights: np.ndarray, upper_bounds: np.ndarray) -> np.ndarray:
+    """
+    Caps the weights to their upper bounds, the excess being spread over the uncapped cards in
+    proportion to their weights.
+
+    Raises:
+        ValueError: The upper bounds sum to less than 1
+    """
+    if np.sum(upper_bounds) < 1:
+        raise ValueError("The position limits are too tight to invest the whole amount")
+    weights = weights.copy()
+    for _ in range(len(weights)):
+        over = weights > upper_bounds
+        if not over.any():
+            break
+        excess = (weights[over] - upper_bounds[over]).sum()
+        weights[over] = upper_bounds[over]
+        free = weights < upper_bounds
+        if weights[free].sum() > 0:
+            weights[free] += excess * weights[free] / weights[free].sum()
+        else:
+            room = upper_bounds[free] - weights[free]
+            weights[free] += excess * room / room.sum()
+    return weights
+
+
+class HierarchicalRiskParityOptimizer(MarkowitzOptimizer):
+    def __init__(self, *args, max_candidates: int = None, **kwargs):
+        """
+        Same filters, covariance estimators, budget discretization and result store as MarkowitzOptimizer,
+        with the hierarchical risk parity allocation instead of the SLSQP minimum variance problem.
+
+        Args:
+            max_candidates: If set, the candidates are reduced to max_candidates cards (see
+                candidate_selection). By default every card passing the filters is allocated: the
+                allocation stays well under a second for thousands of cards
+            Other arguments: see MarkowitzOptimizer
+
+        Example:
+            >>> total_investment, mean_return, portfolio = HierarchicalRiskParityOptimizer(500, 0.5, 0.5).optimize_cards_sell()
+        """
+        super().__init__(*args, **kwargs)
+        self.max_candidates = max_candidates
+
+    @timed('risk_parity.optimize_portfolio')
+    def optimize_portfolio(self):
+        filtered_df = self.get_optimized_return_mean_matrix_fiability(N=self.max_candidates or len(self.df))
+        if len(filtered_df) == 0:
+            raise ValueError("No cards correspond to the filter criterias")
+
+        weights, self.solver_stats = hrp_weights(self.calculate_covariance(filtered_df), return_info=True)
+        if self.liquidity is not None:
+            upper_bounds = get_position_limits(self.liquidity.loc[filtered_df.index], filtered_df['last_price'].values,
+                                               self.amount_to_invest, self.max_volume_fraction)
+            weights = cap_weights(weights, upper_bounds)
+        return weights, filtered_df
+
+    def get_parameters(self) -> dict:
+        return {**super().get_parameters(), 'allocator': 'hrp', 'max_candidates': self.max_candidates}
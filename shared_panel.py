@@ -0,0 +1,186 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+from typing import Tuple
+from instrumentation import timed, increment
+
+SHARED_ROOT = 'datas/shared_panel'
+# Number of data versions kept under the root, the least recently published or attached ones are deleted
+KEEP_VERSIONS = 3
+
+
+def publish_arrays(directory: str, arrays: dict, metadata: dict) -> str:
+    """
+    Writes arrays as .npy files with a JSON metadata file, atomically: the directory either does not
+    exist or is complete, and a directory already published is never rewritten.
+
+    Args:
+        directory: Target directory (one directory per version of the data)
+        arrays: {name: np.ndarray}
+        metadata: JSON serializable description of the arrays (labels, parameters...)
+
+    Returns:
+        str: directory
+    """
+    if os.path.exists(os.path.join(directory, 'metadata.json')):
+        return directory
+    temporary = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+    for name, array in arrays.items():
+        np.save(os.path.join(temporary, f'{name}.npy'), np.ascontiguousarray(array))
+    with open(os.path.join(temporary, 'metadata.json'), 'w') as file:
+        json.dump({**metadata, 'arrays': list(arrays)}, file)
+    try:
+        os.rename(temporary, directory)
+    except OSError:
+        # Published meanwhile by another process
+        shutil.rmtree(temporary, ignore_errors=True)
+    return directory
+
+
+def attach_arrays(directory: str) -> Tuple[dict, dict]:
+    """
+    Maps published arrays in memory, read-only: the pages are shared by every process that
+    attaches the same directory, nothing is copied.
+
+    Returns:
+        tuple: ({name: read-only np.memmap}, metadata)
+    """
+    with open(os.path.join(directory, 'metadata.json')) as file:
+        metadata = json.load(file)
+    arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in metadata['arrays']}
+    increment('shared_panel_attachments')
+    return arrays, metadata
+
+
+def prune_versions(root: str = SHARED_ROOT, keep: int = KEEP_VERSIONS, current: str = None) -> list:
+    """
+    Deletes the versions published under root beyond the `keep` most recent ones (last publication or
+    attachment). Every version holds a panel and an n x n second moment matrix, so they are not kept
+    forever. A process still mapping a deleted version keeps reading it: the files are only freed once
+    unmapped.
+
+    Args:
+        current: Version that is never deleted (e.g. the one just published), it counts in keep
+
+    Returns:
+        list: Deleted versions
+    """
+    if not os.path.isdir(root):
+        return []
+    versions = [name for name in os.listdir(root) if name != current and os.path.isdir(os.path.join(root, name))]
+    versions.sort(key=lambda name: os.path.getmtime(os.path.join(root, name)), reverse=True)
+    deleted = versions[max(keep - (current is not None), 0):]
+    for name in deleted:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    increment('shared_panel_versions_pruned', len(deleted))
+    return deleted
+
+
+def get_panel_version(prices: pd.DataFrame, volumes: pd.DataFrame) -> str:
+    """Fingerprint of the content of a price/volume panel"""
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(prices.values).tobytes())
+    digest.update(np.ascontiguousarray(volumes.values).tobytes())
+    digest.update('\n'.join(map(str, prices.columns)).encode())
+    return digest.hexdigest()[:16]
+
+
+@timed('shared_panel.publish_price_panel')
+def publish_price_panel(prices: pd.DataFrame, volumes: pd.DataFrame, root: str = SHARED_ROOT, version: str = None,
+                        keep_versions: int = KEEP_VERSIONS) -> str:
+    """
+    Publishes the aligned price/volume panel (see get_price_panel) as memory-mapped files.
+
+    Args:
+        prices, volumes: Output of get_price_panel
+        root: Folder of the published panels
+        version: Version of the data (e.g. get_data_version), defaults to a fingerprint of the panel
+        keep_versions: Number of versions kept under root, older ones are deleted (see prune_versions)
+
+    Returns:
+        str: Directory of the panel, to be given to attach_price_panel (e.g. in worker processes)
+    """
+    version = version or get_panel_version(prices, volumes)
+    metadata = {'card_ids': [str(card_id) for card_id in prices.columns],
+                'weeks': [str(week) for week in prices.index], 'version': version}
+    directory = publish_arrays(os.path.join(root, version, 'panel'),
+                               {'prices': prices.values.astype(np.float64), 'volumes': volumes.values.astype(np.float64)},
+                               metadata)
+    prune_versions(root, keep_versions, current=version)
+    return directory
+
+
+@timed('shared_panel.attach_price_panel')
+def attach_price_panel(directory: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Returns:
+        tuple(pd.DataFrame, pd.DataFrame): (prices, volumes) as published, backed by read-only
+            memory maps (no copy: writing into them raises an error)
+    """
+    arrays, metadata = attach_arrays(directory)
+    index = pd.to_datetime(metadata['weeks'])
+    columns = metadata['card_ids']
+    return (pd.DataFrame(arrays['prices'], index=index, columns=columns, copy=False),
+            pd.DataFrame(arrays['volumes'], index=index, columns=columns, copy=False))
+
+
+def get_shared_price_panel(cards_df: pd.DataFrame, version: str = None, root: str = SHARED_ROOT):
+    """
+    Price/volume panel of the universe, computed and published by the first process, then attached
+    by the others.
+
+    Args:
+        cards_df: Output of get_dataframe_cards_matrix()
+        version: Version of the data (e.g. get_data_version(folder_path)). If not given, the panel
+            is computed to be fingerprinted
+        root: Folder of the published panels
+
+    Returns:
+        tuple: (prices, volumes, directory)
+    """
+    from useful_functions_for_models import get_price_panel
+
+    if version is not None:
+        directory = os.path.join(root, version, 'panel')
+        if os.path.exists(os.path.join(directory, 'metadata.json')):
+            prices, volumes = attach_price_panel(directory)
+            if list(prices.columns) == [str(card_id) for card_id in cards_df['card_id']]:
+                # Marked as recently used for prune_versions
+                os.utime(os.path.join(root, version))
+                return prices, volumes, directory
+            # Same files but another universe (e.g. a subset of the cards): published under its own fingerprint
+            version = None
+    prices, volumes = get_price_panel(cards_df)
+    directory = publish_price_panel(prices, volumes, root, version)
+    return (*attach_price_panel(directory), directory)
+
+
+def get_shared_estimator(prices: pd.DataFrame, panel_directory: str):
+    """
+    Streaming moments of the whole history of a published panel, computed and published next to
+    it by the first process, then attached read-only by the others.
+
+    Args:
+        prices: Prices of the panel (see get_shared_price_panel)
+        panel_directory: Directory of the published panel
+
+    Returns:
+        tuple: (StreamingCovarianceEstimator, directory)
+    """
+    from streaming_estimator import StreamingCovarianceEstimator
+
+    directory = os.path.join(os.path.dirname(panel_directory), 'estimator')
+    metadata_path = os.path.join(directory, 'metadata.json')
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as file:
+            if 'observed_sum' not in json.load(file)['arrays']:
+                # Published before the observed weeks of each card were tracked (see StreamingCovarianceEstimator.mean)
+                shutil.rmtree(directory, ignore_errors=True)
+    if not os.path.exists(metadata_path):
+        StreamingCovarianceEstimator.from_price_panel(prices).publish(directory)
+    return StreamingCovarianceEstimator.attach(directory), directory
@@ -0,0 +1,240 @@
+import numpy as np
+import pandas as pd
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional, Sequence
+from shared_panel import publish_arrays, attach_arrays
+
+
+def get_log_returns(prices: pd.DataFrame) -> pd.DataFrame:
+    """
+    Weekly log returns of an aligned price panel.
+
+    Prices are forward filled (never backward filled, it would leak future data). Weeks before a
+    card's first price and zero prices give a zero return instead of NaN/-inf.
+
+    Args:
+        prices: Weekly prices (weeks x cards), as returned by get_price_panel
+
+    Returns:
+        pd.DataFrame: Log returns (weeks - 1 x cards)
+    """
+    values = prices.ffill().values
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_returns = np.log(values[1:] / values[:-1])
+    log_returns = np.nan_to_num(log_returns, nan=0.0, posinf=0.0, neginf=0.0)
+    return pd.DataFrame(log_returns, index=prices.index[1:], columns=prices.columns)
+
+
+def get_observed_returns(prices: pd.DataFrame) -> np.ndarray:
+    """
+    Returns:
+        np.ndarray: Boolean mask (weeks - 1 x cards) of the log returns of get_log_returns that are
+            actual returns, False for the zero padding (weeks before a card's first price, zero prices)
+    """
+    values = prices.ffill().values
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.isfinite(np.log(values[1:] / values[:-1]))
+
+
+@dataclass
+class MomentsSnapshot:
+    mean: np.ndarray
+    covariance: np.ndarray
+    count: int
+    labels: np.ndarray
+
+    def to_frames(self):
+        """Returns (mean, covariance) as a pandas Series and DataFrame labelled by card_id"""
+        return (pd.Series(self.mean, index=self.labels),
+                pd.DataFrame(self.covariance, index=self.labels, columns=self.labels))
+
+
+class StreamingCovarianceEstimator:
+    def __init__(self, labels: Sequence[str], window: Optional[int] = None, decay: Optional[float] = None):
+        """
+        Streaming mean and covariance of the weekly returns of the card universe (Welford's algorithm).
+        Each new week is an O(n²) rank-1 update, the history is never re-read.
+
+        The covariance is computed on a common weekly axis, where unobserved returns count as zero.
+        The mean of each card only counts its observed weeks, so a card with a short history is not
+        diluted by the padding before its first price.
+
+        Args:
+            labels: card_id of each column of the return vectors
+            window: If set, only the last `window` weeks are kept (the oldest week is removed
+                with the inverse update when a new one arrives)
+            decay: If set, exponential forgetting factor in (0, 1): the weight of a week is
+                multiplied by `decay` each time a new week arrives
+
+        Example:
+            >>> estimator = StreamingCovarianceEstimator.from_price_panel(prices, window=26)
+            >>> estimator.update(new_week_returns)
+            >>> snapshot = estimator.snapshot()
+        """
+        if window is not None and decay is not None:
+            raise ValueError("Choose either a rolling window or an exponential decay, not both")
+        if decay is not None and not 0 < decay < 1:
+            raise ValueError("decay must be in (0, 1)")
+
+        self.labels = np.asarray(labels)
+        self.window = window
+        self.decay = decay
+        self._positions = {label: i for i, label in enumerate(self.labels)}
+
+        n = len(self.labels)
+        self.count = 0
+        self.weight = 0.0           # sum of the weights
+        self.squared_weight = 0.0   # sum of the squared weights (unbiased weighted covariance)
+        self._mean = np.zeros(n)
+        self._m2 = np.zeros((n, n))
+        # Weighted sum of the observed returns and weight of the observed weeks, per card (see mean)
+        self._observed_sum = np.zeros(n)
+        self._observed_weight = np.zeros(n)
+        self._buffer = deque()
+
+    @classmethod
+    def from_price_panel(cls, prices: pd.DataFrame, window: Optional[int] = None, decay: Optional[float] = None):
+        """Builds the estimator from a weekly price panel (see get_price_panel)"""
+        returns = get_log_returns(prices)
+        estimator = cls(returns.columns, window=window, decay=decay)
+        estimator.update_many(returns.values, get_observed_returns(prices))
+        return estimator
+
+    def update(self, x: np.ndarray, observed: np.ndarray = None):
+        """
+        Adds one week of returns.
+
+        Args:
+            x: Return of every card of the universe for the new week
+            observed: Cards with an actual return that week (see get_observed_returns). Defaults to the
+                non-NaN returns. Unobserved returns count as zero in the covariance, not in the mean
+        """
+        x = np.asarray(x, dtype=float)
+        observed = ~np.isnan(x) if observed is None else np.asarray(observed, dtype=bool)
+        x = np.nan_to_num(x)
+        if self.window is not None:
+            self._buffer.append((x, observed))
+            if len(self._buffer) > self.window:
+                self._remove(*self._buffer.popleft())
+
+        forget = self.decay if self.decay is not None else 1.0
+        self.count += 1
+        self.weight = forget * self.weight + 1
+        self.squared_weight = forget ** 2 * self.squared_weight + 1
+        self._observed_sum *= forget
+        self._observed_sum += np.where(observed, x, 0.0)
+        self._observed_weight *= forget
+        self._observed_weight += observed
+
+        delta = x - self._mean
+        self._mean += delta / self.weight
+        self._m2 *= forget
+        self._m2 += np.outer(delta, x - self._mean)
+
+    def update_many(self, X: np.ndarray, observed: np.ndarray = None):
+        """Adds several weeks of returns (weeks x cards), oldest first, see update"""
+        X = np.asarray(X, dtype=float)
+        observed = ~np.isnan(X) if observed is None else np.asarray(observed, dtype=bool)
+        X = np.nan_to_num(X)
+        if self.window is not None or self.decay is not None:
+            for x, observed_week in zip(X, observed):
+                self.update(x, observed_week)
+            return
+        self._observed_sum += np.where(observed, X, 0.0).sum(axis=0)
+        self._observed_weight += observed.sum(axis=0)
+
+        # Equal weights: the whole batch is merged at once (Chan et al.), one matrix product instead of T rank-1 updates
+        n_batch = len(X)
+        if n_batch == 0:
+            return
+        batch_mean = X.mean(axis=0)
+        centered = X - batch_mean
+        total = self.count + n_batch
+        delta = batch_mean - self._mean
+        self._m2 += centered.T @ centered + np.outer(delta, delta) * self.count * n_batch / total
+        self._mean += delta * n_batch / total
+        self.count = total
+        self.weight = float(total)
+        self.squared_weight = float(total)
+
+    def _remove(self, x: np.ndarray, observed: np.ndarray):
+        # Inverse Welford update, only used with an unweighted rolling window
+        self.count -= 1
+        self.weight -= 1
+        self.squared_weight -= 1
+        self._observed_sum -= np.where(observed, x, 0.0)
+        self._observed_weight -= observed
+        if self.count == 0:
+            self._mean[:] = 0
+            self._m2[:] = 0
+            self._observed_sum[:] = 0
+            return
+        delta = x - self._mean
+        self._mean -= delta / self.weight
+        self._m2 -= np.outer(delta, x - self._mean)
+
+    def indices_of(self, card_ids: Sequence[str]) -> np.ndarray:
+        """Column positions of the given card_id (KeyError if a card is not in the universe)"""
+        return np.array([self._positions[card_id] for card_id in card_ids], dtype=int)
+
+    def mean(self, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Mean weekly log return over the observed weeks of each card (of the given cards, or of the
+        whole universe), 0 for a card without any observed week
+        """
+        total = self._observed_sum if indices is None else self._observed_sum[indices]
+        weight = self._observed_weight if indices is None else self._observed_weight[indices]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(weight > 0, total / weight, 0.0)
+
+    def covariance(self, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Unbiased covariance of the weekly log returns, restricted to the given cards.
+        Only the requested block is copied, so small candidate sets stay cheap on large universes.
+        """
+        if self.weight <= 1:
+            raise ValueError("At least two weeks are needed to estimate a covariance")
+        m2 = self._m2 if indices is None else self._m2[np.ix_(indices, indices)]
+        # Reliability weights: reduces to M2 / (n - 1) without decay
+        return m2 / (self.weight - self.squared_weight / self.weight)
+
+    def publish(self, directory: str) -> str:
+        """
+        Writes the current moments as memory-mapped files, so that other processes can attach
+        them instead of receiving a copy of the n x n matrix (see attach).
+
+        Returns:
+            str: directory
+        """
+        metadata = {'labels': [str(label) for label in self.labels], 'window': self.window, 'decay': self.decay,
+                    'count': self.count, 'weight': self.weight, 'squared_weight': self.squared_weight}
+        return publish_arrays(directory, {'mean': self._mean, 'm2': self._m2, 'observed_sum': self._observed_sum,
+                                          'observed_weight': self._observed_weight}, metadata)
+
+    @classmethod
+    def attach(cls, directory: str):
+        """
+        Read-only estimator over published moments (see publish): mean, covariance and snapshot
+        work without copying the moments, update raises an error.
+        """
+        arrays, metadata = attach_arrays(directory)
+        estimator = cls.__new__(cls)
+        estimator.labels = np.asarray(metadata['labels'])
+        estimator.window = metadata['window']
+        estimator.decay = metadata['decay']
+        estimator._positions = {label: i for i, label in enumerate(estimator.labels)}
+        estimator.count = metadata['count']
+        estimator.weight = metadata['weight']
+        estimator.squared_weight = metadata['squared_weight']
+        estimator._mean = arrays['mean']
+        estimator._m2 = arrays['m2']
+        estimator._observed_sum = arrays['observed_sum']
+        estimator._observed_weight = arrays['observed_weight']
+        estimator._buffer = deque()
+        return estimator
+
+    def snapshot(self, indices: Optional[np.ndarray] = None) -> MomentsSnapshot:
+        """Frozen copy of the current estimate, independent of later updates"""
+        labels = self.labels if indices is None else self.labels[indices]
+        return MomentsSnapshot(self.mean(indices), self.covariance(indices).copy(), self.count, labels)
@@ -1,6 +1,9 @@
-from MarkowitzPortfolioOptimizer import MarkowitzOptimizer
-from UsefulFunctionsForModels import *
-from PlotsStreamlit import *
+from markowitz_portfolio_optimizer import MarkowitzOptimizer
+from shared_panel import get_shared_price_panel, get_shared_estimator
+from monte_carlo_risk import MonteCarloRiskEngine
+from result_store import ResultStore
+from useful_functions_for_models import *
+from plots_streamlit import *
 import pandas as pd
 import streamlit as st
 
@@ -13,6 +16,33 @@ def wide_space_default():
 
 wide_space_default()
 
+
+@st.cache_resource
+def load_universe():
+    """
+    Loads the card universe, its return estimate and its data version once, shared by every run and session.
+    The panel and the moments are memory-mapped files shared with the other processes (see shared_panel.py)
+    """
+    cards_df = get_dataframe_cards_matrix()
+    data_version = get_data_version()
+    prices, _, panel_directory = get_shared_price_panel(cards_df, data_version)
+    estimator, _ = get_shared_estimator(prices, panel_directory)
+    return cards_df, estimator, data_version
+
+
+@st.cache_resource
+def get_result_store():
+    """Optimizer results persisted between runs: the same parameters on the same data are not solved twice"""
+    return ResultStore()
+
+
+@st.cache_resource(max_entries=64)
+def get_candidate_index(critical_sales_threshold, sales_volume_sensitivity):
+    """Candidates sorted by price and score for the reliability sliders, reused while the amount slider moves"""
+    cards_df, estimator, _ = load_universe()
+    return MarkowitzOptimizer(0, critical_sales_threshold, sales_volume_sensitivity, dataframe_cards_info=cards_df,
+                              estimator=estimator).get_candidate_index()
+
 st.markdown(
     """
     <style>
@@ -65,13 +95,18 @@ k = st.sidebar.slider(
     step=0.01, 
 )
 
+# Live preview of the optimizer filter (Return x Fiability > 1%, price below half the amount), without solving
+candidate_index = get_candidate_index(x0, k)
+st.sidebar.markdown(f'<div class="sidebar-text"><b>{candidate_index.count(0.01, 0.5 * amount)}</b> cards eligible</div>',
+                    unsafe_allow_html=True)
+
 if st.sidebar.button("Run 🏃"):
     #Markovitz
-    df=pd.read_csv("datas/pokemon_cards.csv")
-
-    markowitz=MarkowitzOptimizer(amount,x0,k)
+    cards_df, estimator, data_version = load_universe()
+    markowitz=MarkowitzOptimizer(amount,x0,k,dataframe_cards_info=cards_df,estimator=estimator,data_version=data_version,
+                                 candidate_index=candidate_index)
 
-    amount_invested, mean_return, portfolio=markowitz.get_streamlit_database_markowitz()
+    amount_invested, mean_return, portfolio=markowitz.get_streamlit_database_markowitz(store=get_result_store())
 
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -90,6 +125,18 @@ if st.sidebar.button("Run 🏃"):
     st.plotly_chart(returns)
     st.plotly_chart(repartition)
 
+    #Forward risk
+    risk = MonteCarloRiskEngine(portfolio).risk_report(horizon_weeks=12, n_paths=20000, confidence=0.95)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric(label="VaR 95% - 12 weeks ($)", value=f"{risk.value_at_risk:.2f}")
+    with col2:
+        st.metric(label="CVaR 95% - 12 weeks ($)", value=f"{risk.conditional_value_at_risk:.2f}")
+    with col3:
+        st.metric(label="Expected Value - 12 weeks ($)", value=f"{risk.expected_value:.2f}")
+    st.plotly_chart(plot_value_distribution(risk))
+
     #############################################################################################
     
     #Dataframe
@@ -117,7 +164,8 @@ if st.sidebar.button("Run 🏃"):
     portfolio_plot = portfolio_plot.style.format({
         'Price': "{:.2f}$",
         'Reliability': "{:.2%}",
-        'Mean Return' : "{:.2%}"
+        'Mean Return' : "{:.2%}",
+        'Release Date': lambda date: '' if pd.isna(date) else f"{date:%Y/%m/%d}"
     })
 
     portfolio_plot = portfolio_plot.set_table_styles(
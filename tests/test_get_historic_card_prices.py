@@ -0,0 +1,32 @@
+from datetime import datetime
+from get_historic_card_prices import extract_price_history
+
+
+def render_table(rows):
+    return "<table><tr><th>Date</th><th>Price</th><th>Sold</th></tr>" + "".join(
+        f"<tr><td>{dates}</td><td>${price:.2f}</td><td>{quantity}</td></tr>" for dates, price, quantity in rows) + "</table>"
+
+
+def get_periods(df):
+    return [(start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')) for start, end in df.index]
+
+
+def test_current_week_ends_after_scrape_date():
+    html = render_table([("11/26 to 12/02", 10, 3), ("11/19 to 11/25", 9, 2), ("11/12 to 11/18", 8, 1)])
+    df = extract_price_history(html, 'Near Mint Holofoil', datetime(2024, 11, 30))
+    assert get_periods(df) == [('2024-11-12', '2024-11-18'), ('2024-11-19', '2024-11-25'),
+                               ('2024-11-26', '2024-12-02')]
+    assert df['price'].tolist() == [8, 9, 10]
+
+
+def test_year_boundary_oldest_first():
+    html = render_table([("12/25 to 12/31", 5, 1), ("01/01 to 01/07", 6, 2), ("01/08 to 01/14", 7, 3)])
+    df = extract_price_history(html, 'Near Mint Holofoil', datetime(2025, 1, 10))
+    assert get_periods(df) == [('2024-12-25', '2024-12-31'), ('2025-01-01', '2025-01-07'),
+                               ('2025-01-08', '2025-01-14')]
+
+
+def test_completed_weeks_before_scrape_date():
+    html = render_table([("11/19 to 11/25", 9, 2), ("11/12 to 11/18", 8, 1)])
+    df = extract_price_history(html, 'Near Mint Holofoil', datetime(2024, 11, 30))
+    assert get_periods(df) == [('2024-11-12', '2024-11-18'), ('2024-11-19', '2024-11-25')]
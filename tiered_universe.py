@@ -0,0 +1,149 @@
+import os
+import pickle
+import zipfile
+import numpy as np
+import pandas as pd
+from useful_functions_for_models import get_dataframe_cards_matrix, get_price_history_index, get_data_version
+from markowitz_portfolio_optimizer import MarkowitzOptimizer
+from instrumentation import timed, increment
+
+TIER_ROOT = 'datas/cold_tier'
+# Buckets kept in memory, the other ones stay in the compressed cold tier until a filter can admit their cards
+HOT_BUCKETS = ('high_sales',)
+
+
+@timed('tiered_universe.build_tiers')
+def build_tiers(folder_path: str, directory: str, hot_buckets=HOT_BUCKETS):
+    """
+    Builds the per-card summary index and the cold tier of a price history tree, in one full read.
+
+    Writes in directory:
+        - summary.pkl: (summary, diagnostics), where summary is get_dataframe_cards_matrix() without the
+          histories, plus the bucket and path of every card
+        - cold.zip: Compressed price histories of the cards that are not in hot_buckets ({card_id}.csv)
+
+    Returns:
+        tuple: (summary, diagnostics, {card_id: history} of the hot cards)
+    """
+    cards_df, diagnostics = get_dataframe_cards_matrix(folder_path, return_diagnostics=True)
+    locations = get_price_history_index(folder_path).set_index('card_id')[['bucket', 'path']]
+    summary = cards_df.drop(columns=['Card Info'])
+    summary[['bucket', 'path']] = locations.reindex(summary['card_id']).values
+
+    os.makedirs(directory, exist_ok=True)
+    cold = summary[~summary['bucket'].isin(hot_buckets)]
+    temporary = os.path.join(directory, f'cold.zip.tmp-{os.getpid()}')
+    with zipfile.ZipFile(temporary, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for card_id, path in zip(cold['card_id'], cold['path']):
+            archive.write(path, arcname=f'{card_id}.csv')
+    os.replace(temporary, os.path.join(directory, 'cold.zip'))
+    # The summary is written last: its presence means the tiers are complete
+    temporary = os.path.join(directory, f'summary.pkl.tmp-{os.getpid()}')
+    with open(temporary, 'wb') as file:
+        pickle.dump((summary, diagnostics), file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, os.path.join(directory, 'summary.pkl'))
+
+    hot = summary['bucket'].isin(hot_buckets).values
+    return summary, diagnostics, dict(zip(cards_df['card_id'].values[hot], cards_df['Card Info'].values[hot]))
+
+
+class TieredUniverse:
+    def __init__(self, folder_path: str = 'datas/price_history', hot_buckets=HOT_BUCKETS, root: str = TIER_ROOT,
+                 data_version: str = None):
+        """
+        Card universe split in two tiers: the histories of the liquid buckets are loaded in memory, the
+        illiquid ones stay in a compressed archive and are only read when a filter can admit them.
+        Which cards can be admitted is decided on a per-card summary (price, mean return, quantity sold,
+        validity) precomputed once per data version, so cold start and resident memory scale with the
+        liquid universe.
+
+        Args:
+            folder_path: Price history folder
+            hot_buckets: Sales buckets loaded in memory
+            root: Folder of the summaries and cold tiers, one directory per data version
+            data_version: Fingerprint of folder_path (see get_data_version), computed if not given
+
+        Example:
+            >>> universe = TieredUniverse()
+            >>> cards_df = universe.get_cards_dataframe(500, 0.5, 0.5)
+            >>> MarkowitzOptimizer(500, 0.5, 0.5, dataframe_cards_info=cards_df).optimize_cards_sell()
+        """
+        self.folder_path = folder_path
+        self.hot_buckets = tuple(hot_buckets)
+        self.data_version = data_version or get_data_version(folder_path)
+        self.directory = os.path.join(root, self.data_version)
+        self._cold = {}
+        self._archive = None
+
+        summary_path = os.path.join(self.directory, 'summary.pkl')
+        if os.path.exists(summary_path):
+            with open(summary_path, 'rb') as file:
+                self.summary, self.diagnostics = pickle.load(file)
+            self._hot = self._load_hot()
+        else:
+            self.summary, self.diagnostics, self._hot = build_tiers(folder_path, self.directory, self.hot_buckets)
+        self.hot = self.summary['bucket'].isin(self.hot_buckets).values
+
+    def _load_hot(self):
+        histories = {}
+        for bucket in self.hot_buckets:
+            bucket_path = os.path.join(self.folder_path, bucket)
+            if os.path.isdir(bucket_path):
+                cards_df = get_dataframe_cards_matrix(bucket_path, return_diagnostics=True)[0]
+                histories.update(zip(cards_df['card_id'].values, cards_df['Card Info'].values))
+        return histories
+
+    def _load_cold(self, card_id: str) -> pd.DataFrame:
+        if card_id not in self._cold:
+            if self._archive is None:
+                self._archive = zipfile.ZipFile(os.path.join(self.directory, 'cold.zip'))
+            with self._archive.open(f'{card_id}.csv') as file:
+                self._cold[card_id] = pd.read_csv(file)
+            increment('cold_cards_loaded')
+        return self._cold[card_id]
+
+    @property
+    def resident_cards(self) -> int:
+        """Number of price histories in memory"""
+        return len(self._hot) + len(self._cold)
+
+    def get_histories(self, positions) -> list:
+        """Price histories of the cards at the given positions of the summary (cold cards are read on demand)"""
+        card_ids = self.summary['card_id'].values[positions]
+        return [self._hot[card_id] if card_id in self._hot else self._load_cold(card_id) for card_id in card_ids]
+
+    def get_admissible(self, amount_to_invest: float, critical_sales_threshold: float, sales_volume_sensitivity: float,
+                       threshold=0.01, ratio=0.5) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: Positions in the summary of the cards passing the optimizer filters (see
+                MarkowitzOptimizer.get_optimized_return_mean_matrix_fiability) for these parameters,
+                computed on the summary statistics only
+        """
+        optimizer = MarkowitzOptimizer(amount_to_invest, critical_sales_threshold, sales_volume_sensitivity,
+                                       dataframe_cards_info=self.summary.assign(**{'Card Info': None}))
+        return optimizer.get_candidate_index().candidates(threshold, ratio * amount_to_invest)
+
+    @timed('tiered_universe.get_cards_dataframe')
+    def get_cards_dataframe(self, amount_to_invest: float, critical_sales_threshold: float,
+                            sales_volume_sensitivity: float, threshold=0.01, ratio=0.5) -> pd.DataFrame:
+        """
+        Universe for an optimization: every hot card, and the cold cards that the filters can admit.
+
+        Returns:
+            pd.DataFrame: Same columns as get_dataframe_cards_matrix() (plus bucket and path), cards in
+                the order of the summary. The optimizer filters select the same candidates as on the
+                whole universe
+        """
+        keep = self.hot.copy()
+        keep[self.get_admissible(amount_to_invest, critical_sales_threshold, sales_volume_sensitivity,
+                                 threshold, ratio)] = True
+        positions = np.flatnonzero(keep)
+        cards_df = self.summary.iloc[positions].reset_index(drop=True)
+        cards_df['Card Info'] = self.get_histories(positions)
+        return cards_df
+
+    def close(self):
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
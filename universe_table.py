@@ -0,0 +1,94 @@
+import os
+import pickle
+import threading
+import numpy as np
+import pandas as pd
+from useful_functions_for_models import split_card_id, get_data_version
+from card_catalog import load_card_catalog, CATALOG_PATH
+from instrumentation import timed
+
+CATALOG_COLUMNS = ('name', 'rarity', 'collection', 'series', 'release_date', 'images_url')
+STATISTICS_COLUMNS = ('last_price', 'mean_return', 'Quantity Sold')
+_cache = {}
+
+
+@timed('universe.build_universe_table')
+def build_universe_table(cards_df: pd.DataFrame, catalog: pd.DataFrame) -> pd.DataFrame:
+    """
+    Joins the price statistics of every card with its catalog metadata.
+
+    Args:
+        cards_df: Output of get_dataframe_cards_matrix()
+        catalog: Output of load_card_catalog()
+
+    Returns:
+        pd.DataFrame: One row per card, indexed by the integer card index (position of the card in
+            cards_df), with columns card_id, base_id, variant, last_price, mean_return, Quantity Sold,
+            name, rarity, collection, series, release_date and images_url (NaN for cards missing
+            from the catalog)
+    """
+    base_ids, variants = zip(*map(split_card_id, cards_df['card_id'])) if len(cards_df) else ((), ())
+    table = pd.DataFrame({'card_id': cards_df['card_id'].values, 'base_id': list(base_ids), 'variant': list(variants)})
+    table['variant'] = table['variant'].astype('category')
+    for column in STATISTICS_COLUMNS:
+        table[column] = cards_df[column].values
+
+    metadata = catalog.drop_duplicates('id').set_index('id')[list(CATALOG_COLUMNS)].reindex(table['base_id'].values)
+    for column in CATALOG_COLUMNS:
+        table[column] = metadata[column].values
+    return table
+
+
+def load_universe_table(cards_df: pd.DataFrame, folder_path: str = 'datas/price_history',
+                        csv_path: str = CATALOG_PATH, cache_path: str = 'datas/universe_table.pkl',
+                        data_version: str = None) -> pd.DataFrame:
+    """
+    Universe table (see build_universe_table), joined once per version of the price history tree and
+    catalog, then kept in memory and in a binary file.
+
+    Args:
+        cards_df: Output of get_dataframe_cards_matrix(folder_path)
+        folder_path: Price history folder, its fingerprint invalidates the table
+        csv_path: Card catalog, its size and modification time invalidate the table
+        cache_path: Binary file of the table (None to keep it in memory only)
+        data_version: Fingerprint of folder_path already held by the caller (see get_data_version),
+            the tree is only walked to compute it if not given
+
+    Returns:
+        pd.DataFrame: Universe table, row i describes cards_df.iloc[i]. Shared between callers:
+            do not modify it in place
+
+    Example:
+        >>> universe = load_universe_table(cards_df)
+        >>> universe.take(card_indices)[['name', 'rarity', 'images_url']]
+    """
+    stat = os.stat(csv_path)
+    version = (data_version or get_data_version(folder_path), stat.st_size, stat.st_mtime_ns)
+    card_ids = cards_df['card_id'].values
+
+    def is_current(entry):
+        # The order of the cards is part of the key: row i must be cards_df.iloc[i]
+        return entry is not None and entry[0] == version and np.array_equal(entry[1]['card_id'].values, card_ids)
+
+    entry = _cache.get('entry')
+    if not is_current(entry):
+        entry = None
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'rb') as file:
+                    entry = pickle.load(file)
+            except (OSError, pickle.UnpicklingError, EOFError, ValueError, AttributeError, ImportError):
+                entry = None
+        if not is_current(entry):
+            entry = (version, build_universe_table(cards_df, load_card_catalog(csv_path)))
+            if cache_path:
+                # One temporary file per writer: the refresh stages can write concurrently
+                temporary = f"{cache_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+                try:
+                    with open(temporary, 'wb') as file:
+                        pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(temporary, cache_path)
+                except OSError as e:
+                    print(f"Could not write the universe table: {str(e)}")
+        _cache['entry'] = entry
+    return entry[1]
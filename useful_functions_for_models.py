@@ -1,9 +1,13 @@
 import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 import glob
-import matplotlib.pyplot as plt
-from statsmodels.nonparametric.smoothers_lowess import lowess
+from instrumentation import timed, increment
+
+# matplotlib and statsmodels are only imported inside the plotting helpers, so that the optimizer,
+# the dashboard and the service do not load them
 
 def get_file_paths(directory):
     """
@@ -30,6 +34,28 @@ def get_file_paths(directory):
             file_paths.append(os.path.join(root, file))
     return file_paths
 
+def get_data_version(folder_path="datas/price_history"):
+    """
+    Returns a short fingerprint of the price history tree (file names, sizes and modification times).
+
+    It changes as soon as a price history file is added, removed or rewritten, and is used
+    as a cache key by the modules that derive statistics from the price histories.
+
+    Args:
+        folder_path (str): Path to the folder containing card CSV files.
+
+    Returns:
+        str: Hexadecimal fingerprint.
+    """
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(folder_path):
+        dirs.sort()
+        for file in sorted(files):
+            if file.endswith('.csv'):
+                stat = os.stat(os.path.join(root, file))
+                digest.update(f"{os.path.relpath(os.path.join(root, file), folder_path)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
 def get_last_price(df):
     """
     Extracts the last price from a DataFrame based on the column name ('Close' or 'price').
@@ -63,12 +89,148 @@ def get_mean_return_card (df):
     return round(mean_return,4)
 
 
-def get_dataframe_cards_matrix(folder_path="datas/price_history"):
+# Card states saved by the scraper, longest first ('Reverse_Holofoil' must be matched before 'Holofoil')
+KNOWN_VARIANTS = ['1st_Edition_Holofoil', '1st_Edition_Normal', 'Unlimited_Holofoil', 'Reverse_Holofoil', 'Holofoil', 'Normal']
+
+
+def split_card_id(card_id):
+    """
+    Splits a price history identifier into the catalog id and the variant.
+
+    Args:
+        card_id (str): File name without extension (ex: 'swsh6-207_Reverse_Holofoil').
+
+    Returns:
+        tuple: (base_id, variant), ex: ('swsh6-207', 'Reverse_Holofoil').
+            Catalog ids may contain '_' themselves, so known variants are matched first.
+    """
+    for variant in KNOWN_VARIANTS:
+        if card_id.endswith('_' + variant):
+            return card_id[:-len(variant) - 1], variant
+    base_id, _, variant = card_id.rpartition('_')
+    return (base_id, variant) if base_id else (card_id, '')
+
+
+def get_price_history_index(folder_path="datas/price_history"):
+    """
+    Indexes the price history store by (base_id, variant).
+
+    Every variant of a card is a separate file {base_id}_{variant}.csv in one of the sales buckets,
+    so each variant can be used as a separate asset.
+
+    Args:
+        folder_path (str): Path to the folder containing card CSV files.
+
+    Returns:
+        pd.DataFrame: Sorted MultiIndex (base_id, variant) with columns:
+            - card_id: File name without extension.
+            - bucket: Sales bucket (low_sales, medium_sales or high_sales).
+            - path: Path of the CSV file.
+
+    Example:
+        >>> index = get_price_history_index()
+        >>> index.loc[('swsh6-207', 'Holofoil'), 'path']
+    """
+    rows = []
+    for root, dirs, files in os.walk(folder_path):
+        for file in files:
+            if file.endswith('.csv'):
+                card_id = file[:-len('.csv')]
+                base_id, variant = split_card_id(card_id)
+                rows.append({'base_id': base_id, 'variant': variant, 'card_id': card_id,
+                             'bucket': os.path.basename(root), 'path': os.path.join(root, file)})
+
+    index = pd.DataFrame(rows, columns=['base_id', 'variant', 'card_id', 'bucket', 'path'])
+    return index.set_index(['base_id', 'variant']).sort_index()
+
+
+# Columns of the loading diagnostics table, see get_dataframe_cards_matrix(return_diagnostics=True)
+DIAGNOSTIC_COLUMNS = ['card_id', 'path', 'issue', 'detail']
+PRICE_HISTORY_COLUMNS = ['start_date', 'end_date', 'price', 'quantity_sold']
+
+
+def check_price_history(df):
+    """
+    Checks a price history that could be read.
+
+    Args:
+        df (pd.DataFrame): Content of a price history file.
+
+    Returns:
+        list: (issue, detail) pairs, empty if the history is usable. Issues are:
+            - 'missing_columns': A column among start_date, end_date, price, quantity_sold is absent
+            - 'empty': No week at all
+            - 'malformed_dates': Unparsable or unordered start dates
+            - 'zero_prices': Null or negative prices, their log returns are infinite
+    """
+    missing = [column for column in PRICE_HISTORY_COLUMNS if column not in df.columns]
+    if missing:
+        return [('missing_columns', ', '.join(missing))]
+    if df.empty:
+        return [('empty', 'no rows')]
+
+    issues = []
+    start_dates = pd.to_datetime(df['start_date'], format='%Y-%m-%d', errors='coerce')
+    n_unparsed = int(start_dates.isna().sum())
+    if n_unparsed:
+        issues.append(('malformed_dates', f'{n_unparsed} unparsable start dates'))
+    elif not start_dates.is_monotonic_increasing:
+        issues.append(('malformed_dates', 'start dates are not increasing'))
+    n_zero = int((df['price'] <= 0).sum())
+    if n_zero:
+        issues.append(('zero_prices', f'{n_zero} weeks with a null price'))
+    return issues
+
+
+def _load_chunk(paths):
+    """
+    Reads a chunk of price history files and aggregates their statistics (runs in a worker).
+
+    Returns:
+        tuple: (columns, diagnostics) where columns is a dict of lists (card_id, last_price, mean_return,
+            Quantity Sold, Card Info, valid) and diagnostics a list of (card_id, path, issue, detail).
+            Unreadable, empty or incomplete files are skipped, cards with malformed dates or null
+            prices are kept with valid=False
+    """
+    columns = {"card_id": [], "last_price": [], "mean_return": [], "Quantity Sold": [], "Card Info": [], "valid": []}
+    diagnostics = []
+    for path in paths:
+        card_id = os.path.basename(path).replace('.csv', '')
+        try:
+            df = pd.read_csv(path)
+        except Exception as e:
+            diagnostics.append((card_id, path, 'unreadable', f"{type(e).__name__}: {e}"))
+            continue
+        
+        issues = check_price_history(df)
+        diagnostics.extend((card_id, path, issue, detail) for issue, detail in issues)
+        if any(issue in ('missing_columns', 'empty') for issue, _ in issues):
+            continue
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_return = get_mean_return_card(df) * 100
+        columns["card_id"].append(card_id)
+        columns["last_price"].append(get_last_price(df))
+        columns["mean_return"].append(mean_return)
+        columns["Quantity Sold"].append(np.sum(df["quantity_sold"]))
+        columns["Card Info"].append(df)
+        columns["valid"].append(not issues)
+    return columns, diagnostics
+
+
+@timed('loading.get_dataframe_cards_matrix')
+def get_dataframe_cards_matrix(folder_path="datas/price_history", max_workers=None, chunk_size=256,
+                               return_diagnostics=False):
     """
     Generates a DataFrame summarizing all the information we need to compute the Markowitz model
 
     Args:
         folder_path (str): Path to the folder containing card CSV files.
+        max_workers (int, optional): Number of processes reading the files. Defaults to the
+            number of cores above 2 cores, 1 otherwise (the price histories are pickled back from the
+            workers, which only pays off with enough cores). 1 reads everything in the current process.
+        chunk_size (int, optional): Number of files sent to a worker at once.
+        return_diagnostics (bool, optional): Also return the table of the loading issues.
 
     Returns:
         pd.DataFrame: A DataFrame with columns:
@@ -76,6 +238,14 @@ def get_dataframe_cards_matrix(folder_path="datas/price_history"):
             - last_price: Last recorded price of each card.
             - mean_return: Mean logarithmic return of each card's prices.
             - Quantity Sold : Sum of the quantity sold over the past year.
+            - Card Info: Price history of the card.
+            - base_id, variant: Catalog id and variant of the card (see split_card_id).
+            - valid: False for cards with malformed dates or null prices (see check_price_history),
+              to be excluded with a mask: cards_df[cards_df['valid']]
+        The cards are in the order of the file walk, whatever the number of workers.
+        If return_diagnostics is True, returns (cards_df, diagnostics) where diagnostics has one
+        row per issue (columns card_id, path, issue, detail). A bad file never stops the loading
+        of the other cards.
 
     Example:
         >>> cards_df = get_dataframe_cards_matrix("path/to/folder")
@@ -89,69 +259,110 @@ def get_dataframe_cards_matrix(folder_path="datas/price_history"):
             if file.endswith('.csv'):
                 list_paths.append(os.path.join(root, file))
 
-    dataframe_cards = {
-        "card_id": [],
-        "last_price": [],
-        "mean_return": [],
-        "Quantity Sold": [],
-        "Card Info": []
-    }   
-    try:
-        for path in list_paths:
-            df = pd.read_csv(path)
-            card_id = os.path.basename(path).replace('.csv', '')
-            last_price = get_last_price(df)
-            mean_return = get_mean_return_card(df) * 100
-            sum_sales = np.sum(df["quantity_sold"])
-            
-            dataframe_cards["card_id"].append(card_id)
-            dataframe_cards["last_price"].append(last_price)
-            dataframe_cards["mean_return"].append(mean_return)
-            dataframe_cards["Quantity Sold"].append(sum_sales)
-            dataframe_cards["Card Info"].append(df)
-            
-    except Exception as e:
-        print(f"Error reading card {card_id}: {e}")
-    return pd.DataFrame(dataframe_cards)
+    chunks = [list_paths[i:i + chunk_size] for i in range(0, len(list_paths), chunk_size)]
+    if max_workers is None:
+        cores = os.cpu_count() or 1
+        max_workers = cores if cores > 2 else 1
+    max_workers = min(max_workers, len(chunks))
+    if max_workers > 1:
+        # map keeps the order of the chunks: the merge does not depend on which worker finishes first
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_load_chunk, chunks))
+    else:
+        results = [_load_chunk(chunk) for chunk in chunks]
+    increment('files_read', len(list_paths))
+
+    dataframe_cards = {"card_id": [], "last_price": [], "mean_return": [], "Quantity Sold": [], "Card Info": [], "valid": []}
+    diagnostics = []
+    for columns, chunk_diagnostics in results:
+        for name, values in columns.items():
+            dataframe_cards[name].extend(values)
+        diagnostics.extend(chunk_diagnostics)
+    cards_df = pd.DataFrame(dataframe_cards)
+    cards_df['valid'] = cards_df['valid'].astype(bool)
+    cards_df[['base_id', 'variant']] = pd.DataFrame(
+        [split_card_id(card_id) for card_id in cards_df['card_id']], index=cards_df.index, columns=['base_id', 'variant'])
+
+    if return_diagnostics:
+        return cards_df, pd.DataFrame(diagnostics, columns=DIAGNOSTIC_COLUMNS)
+    return cards_df
 
         
 
 
-def calculate_covariance_matrix(cards_df,folder_path = 'datas/price_history'):
+@timed('loading.get_price_panel')
+def get_price_panel(cards_df):
+    """
+    Aligns the price and volume histories of every card on a common weekly axis.
+
+    Histories are aligned on their most recent week (all scrapes end on the same
+    week), shorter histories are left-padded with NaN.
+
+    Args:
+        cards_df (pd.DataFrame): Output of get_dataframe_cards_matrix(), with columns
+                                 'card_id' and 'Card Info'.
+
+    Returns:
+        tuple(pd.DataFrame, pd.DataFrame): (prices, volumes), both indexed by the
+        weekly start_date of the longest history and with one column per card_id.
+    """
+    histories = cards_df['Card Info'].tolist()
+    n_weeks = max(len(df) for df in histories)
+    prices = np.full((n_weeks, len(histories)), np.nan)
+    volumes = np.full((n_weeks, len(histories)), np.nan)
+
+    longest = None
+    for j, df in enumerate(histories):
+        price_column = 'Close' if 'Close' in df.columns else 'price'
+        prices[n_weeks - len(df):, j] = df[price_column].values
+        volumes[n_weeks - len(df):, j] = df['quantity_sold'].values
+        if len(df) == n_weeks and longest is None:
+            longest = df
+
+    index = pd.to_datetime(longest['start_date']).values
+    prices = pd.DataFrame(prices, index=index, columns=cards_df['card_id'].values)
+    volumes = pd.DataFrame(volumes, index=index, columns=cards_df['card_id'].values)
+    return prices, volumes
+
+
+@timed('loading.calculate_covariance_matrix')
+def calculate_covariance_matrix(cards_df,folder_path = 'datas/price_history', diagnostics=None):
     """
     Computes the covariance matrix of card prices across multiple cards.
 
     Args:
         cards_df (pd.DataFrame): A DataFrame containing card IDs and related statistics.
         folder_path (str): Path to the folder containing CSV files for each card.
+        diagnostics (list, optional): If given, (card_id, path, issue, detail) tuples are appended
+            for the cards left out (issue 'missing_file' or 'unreadable', see DIAGNOSTIC_COLUMNS).
 
     Returns:
-        pd.DataFrame: Covariance matrix of prices for all cards.
+        pd.DataFrame: Covariance matrix of prices for all cards found.
     """
     cards_prices = {}
+    issues = []
     
-    for _, row in cards_df.iterrows():
-        card_id = row["card_id"]
-        found = False
-        
+    for card_id in cards_df["card_id"]:
+        path = None
         for subdir in ['low_sales', 'medium_sales', 'high_sales']:
             file_path = os.path.join(folder_path, subdir, f'{card_id}.csv')
-            matching_files = glob.glob(file_path)
-            
-            if matching_files:
-                try:
-                    df = pd.read_csv(matching_files[0])
-                    df['start_date'] = pd.to_datetime(df['start_date'])
-                    df['end_date'] = pd.to_datetime(df['end_date'])
-                    prices = df['price'].tolist()
-                    cards_prices[card_id] = prices
-                    found = True
-                    break
-                except Exception as e:
-                    print(f"Erreur lors du traitement de {card_id}: {e}")
+            if os.path.exists(file_path):
+                path = file_path
+                break
+        if path is None:
+            issues.append((card_id, None, 'missing_file', f'not found in {folder_path}'))
+            continue
         
-        if not found:
-            print(f"Fichier non trouvé pour {card_id}")
+        try:
+            df = pd.read_csv(path)
+            increment('files_read')
+            # Histories of different lengths are aligned on their most recent week
+            cards_prices[card_id] = pd.Series(df['price'].values, index=np.arange(-len(df), 0))
+        except Exception as e:
+            issues.append((card_id, path, 'unreadable', f"{type(e).__name__}: {e}"))
+    
+    if diagnostics is not None:
+        diagnostics.extend(issues)
     
     if cards_prices:
         price_df = pd.DataFrame(cards_prices)
@@ -170,6 +381,7 @@ def plot_distributions(cards_df, log_scale=False):
                                  avec colonnes 'last_price' et 'Quantity Sold'.
         log_scale (bool): Si True, applique une échelle log sur l'axe x (log-normale).
     """
+    import matplotlib.pyplot as plt
     fig, axes = plt.subplots(1, 2, figsize=(14, 5))
 
     for ax, col, label in [
@@ -206,18 +418,17 @@ def plot_liquidity_frontier(cards_df):
         cards_df (pd.DataFrame): Sortie de get_dataframe_cards_matrix(),
                                  avec colonnes 'card_id' et 'Card Info'.
     """
-    LOW, HIGH = 0.25, 0.60
+    import matplotlib.pyplot as plt
+    from liquidity import get_liquidity_metrics
 
-    rows = []
-    for _, row in cards_df.iterrows():
-        df = row['Card Info']
-        median_price = df['price'].median()
-        if median_price <= 0:
-            continue
-        freq = (df['quantity_sold'] > 0).sum() / len(df)
-        rows.append({'log_price': np.log(median_price), 'freq': freq})
+    LOW, HIGH = 0.25, 0.60
 
-    plot_df = pd.DataFrame(rows)
+    liquidity_df = get_liquidity_metrics(cards_df)
+    liquidity_df = liquidity_df[liquidity_df['median_price'] > 0]
+    plot_df = pd.DataFrame({
+        'log_price': np.log(liquidity_df['median_price']),
+        'freq': liquidity_df['active_frequency']
+    })
 
     def zone_color(f):
         if f < LOW:
@@ -262,7 +473,7 @@ def plot_liquidity_frontier(cards_df):
           f"({100 * n_invest / n_total:.1f}%)")
 
 
-def plot_market_structure(cards_df, cards_db_path='datas/pokemon_cards.csv'):
+def plot_market_structure(cards_df, cards_db_path='datas/pokemon_cards.csv', folder_path='datas/price_history'):
     """
     Scatter plot log(prix_médian) × log(volume_médian) coloré par rareté,
     avec une régression LOWESS non-paramétrique.
@@ -271,30 +482,31 @@ def plot_market_structure(cards_df, cards_db_path='datas/pokemon_cards.csv'):
         cards_df (pd.DataFrame): Sortie de get_dataframe_cards_matrix(),
                                  avec colonnes 'card_id' et 'Card Info'.
         cards_db_path (str): Chemin vers le CSV principal des cartes (pour la rareté).
+        folder_path (str): Dossier des historiques de cards_df (clé de la table d'univers).
     """
+    import matplotlib.pyplot as plt
+    from statsmodels.nonparametric.smoothers_lowess import lowess
+    from universe_table import load_universe_table
+
     # Calcul des médianes par carte
     rows = []
-    for _, row in cards_df.iterrows():
-        df = row['Card Info']
+    for position, df in enumerate(cards_df['Card Info']):
         median_price = df['price'].median()
         non_zero_volumes = df['quantity_sold'][df['quantity_sold'] > 0]
         if median_price <= 0 or non_zero_volumes.empty:
             continue
         median_volume = non_zero_volumes.median()
-        # Supprime le suffixe _Holofoil / _Reverse_Holofoil pour rejoindre la DB
-        base_id = row['card_id'].rsplit('_', 1)[0]
         rows.append({
-            'card_id': base_id,
+            'position': position,
             'log_price': np.log(median_price),
             'log_volume': np.log(median_volume)
         })
 
     plot_df = pd.DataFrame(rows)
 
-    # Jointure avec la rareté
-    db = pd.read_csv(cards_db_path, usecols=['id', 'rarity'])
-    plot_df = plot_df.merge(db, left_on='card_id', right_on='id', how='left')
-    plot_df['rarity'] = plot_df['rarity'].fillna('Unknown')
+    # Rareté lue dans la table d'univers (jointure catalogue déjà faite), par indice de carte
+    universe = load_universe_table(cards_df, folder_path, cards_db_path)
+    plot_df['rarity'] = universe['rarity'].take(plot_df['position'].values).astype(object).fillna('Unknown').values
 
     # Couleur par rareté
     rarities = plot_df['rarity'].unique()
@@ -321,7 +533,7 @@ def plot_market_structure(cards_df, cards_db_path='datas/pokemon_cards.csv'):
     plt.show()
 
 
-def get_csv_by_card_id(card_id, folder_path='datas/price_history'):
+def get_csv_by_card_id(card_id, folder_path='datas/price_history', variant=None):
     """
     Renvoie le DataFrame associé à un identifiant de carte.
 
@@ -329,8 +541,9 @@ def get_csv_by_card_id(card_id, folder_path='datas/price_history'):
     un fichier CSV dont le nom correspond à card_id.
 
     Args:
-        card_id (str): Identifiant de la carte (ex: 'swsh6-207_Holofoil').
+        card_id (str): Identifiant de la carte (ex: 'swsh6-207').
         folder_path (str): Chemin vers le dossier contenant les historiques de prix.
+        variant (str, optional): Variante voulue (ex: 'Reverse_Holofoil'). Par défaut, la première trouvée.
 
     Returns:
         pd.DataFrame: Données de prix de la carte.
@@ -339,8 +552,10 @@ def get_csv_by_card_id(card_id, folder_path='datas/price_history'):
         FileNotFoundError: Si aucun fichier CSV ne correspond à l'identifiant donné.
     """
     for subdir in ['low_sales', 'medium_sales', 'high_sales']:
-        matching_files = glob.glob(os.path.join(folder_path, subdir, f'{card_id}_*.csv'))
+        pattern = f'{card_id}_{variant}.csv' if variant else f'{card_id}_*.csv'
+        matching_files = glob.glob(os.path.join(folder_path, subdir, pattern))
         if matching_files:
+            increment('files_read')
             return pd.read_csv(matching_files[0])
 
     raise FileNotFoundError(f"Aucun fichier CSV trouvé pour la carte '{card_id}' dans {folder_path}")
@@ -359,6 +574,7 @@ def plot_card_history(card_id, folder_path='datas/price_history'):
             - Haut : évolution du prix dans le temps (ligne)
             - Bas  : nombre de ventes par semaine (barres)
     """
+    import matplotlib.pyplot as plt
     df = get_csv_by_card_id(card_id, folder_path)
     df['start_date'] = pd.to_datetime(df['start_date'])
 
@@ -402,4 +618,80 @@ def select_mixed_cards(filtered_df, N):
     return result_df
 
 
-    
\ No newline at end of file
+    
+
+def correlation_distance(covariance):
+    """
+    Correlation distance sqrt((1 - rho) / 2) between cards: 0 for perfectly correlated returns,
+    1 for opposite returns. Cards with a constant price are at distance sqrt(1/2) from every card.
+
+    Args:
+        covariance: Covariance matrix of the returns (cards x cards)
+
+    Returns:
+        np.ndarray: Distance matrix with a zero diagonal
+    """
+    covariance = np.asarray(covariance, dtype=np.float64)
+    std = np.sqrt(np.clip(np.diag(covariance), 0, None))
+    inverse_std = np.divide(1, std, out=np.zeros_like(std), where=std > 0)
+    # In place: the matrix of the whole universe is ~100 MB
+    distance = covariance * inverse_std[:, None]
+    distance *= inverse_std[None, :]
+    np.clip(distance, -1, 1, out=distance)
+    np.subtract(1, distance, out=distance)
+    distance *= 0.5
+    np.sqrt(distance, out=distance)
+    np.fill_diagonal(distance, 0)
+    return distance
+
+
+def select_clustered_cards(filtered_df, N, covariance, score_column='Return x Fiability', budget=None):
+    """
+    Selects N diversified cards: the cards are grouped in N clusters of correlated returns
+    (average linkage on the correlation distance), and the best scoring card of each cluster is kept.
+
+    Args:
+        filtered_df: DataFrame containing card information
+        N: Total number of cards to select
+        covariance: Covariance of the returns of the cards of filtered_df, in the same order
+        score_column: Column used to choose the representative of each cluster
+        budget: If given and the representatives cost less in total, the representatives of some
+            clusters are replaced by the most expensive card of their cluster (as the price half of
+            select_mixed_cards), so that the selection can absorb the amount to invest
+
+    Returns:
+        DataFrame with selected cards, in the order of filtered_df
+    """
+    from scipy.cluster.hierarchy import linkage, fcluster
+    from scipy.spatial.distance import squareform
+
+    if len(filtered_df) <= N:
+        return filtered_df
+    distance = correlation_distance(covariance)
+    clusters = fcluster(linkage(squareform(distance, checks=False), method='average'), N, criterion='maxclust')
+
+    scores = filtered_df[score_column].values
+    # Best score first: the first card met in each cluster is its representative
+    order = np.argsort(-scores, kind='stable')
+    _, first = np.unique(clusters[order], return_index=True)
+    selected = order[first]
+
+    prices = filtered_df['last_price'].values
+    if budget is not None and prices[selected].sum() < budget:
+        by_price = np.argsort(-prices, kind='stable')
+        _, first = np.unique(clusters[by_price], return_index=True)
+        most_expensive = by_price[first]
+        gains = prices[most_expensive] - prices[selected]
+        missing = budget - prices[selected].sum()
+        for cluster in np.argsort(-gains, kind='stable'):
+            if missing <= 0 or gains[cluster] <= 0:
+                break
+            selected[cluster] = most_expensive[cluster]
+            missing -= gains[cluster]
+
+    if len(selected) < N:
+        # Ties in the distances can give fewer clusters: completed with the best remaining scores
+        remaining = order[~np.isin(order, selected)]
+        selected = np.concatenate([selected, remaining[:N - len(selected)]])
+    increment('clustered_selections')
+    return filtered_df.iloc[np.sort(selected)]